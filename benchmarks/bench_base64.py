@@ -0,0 +1,114 @@
+"""Measure peak RSS of Base64 input decoding and output encoding.
+
+Each case runs in a fresh interpreter that imports handler and loads its
+input: a Base64 payload of --size MB (decoded) as a str, the way it arrives in
+the job JSON, or nothing for the output side. The RSS high-water mark is then
+reset through /proc/self/clear_refs, so the reported peak belongs to the step
+alone:
+
+  decode   the previous save_base64_to_file (one b64decode, one write) against
+           the streaming save_base64_to_file
+  encode   reading the MP4 and encoding it in one piece against
+           encode_file_base64()
+
+Linux only.
+
+Usage:
+    python benchmarks/bench_base64.py [--size 200]
+"""
+import argparse
+import base64
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import base64, json, os, sys, time
+import handler
+payload_path, binary_path, out_dir, load, step = sys.argv[1:6]
+
+def status(field):
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) / 1024
+
+if load == "payload":
+    with open(payload_path) as f:
+        data = f.read()
+loaded = status("VmRSS")
+with open("/proc/self/clear_refs", "w") as f:
+    f.write("5")  # reset VmHWM to the current RSS
+
+start = time.perf_counter()
+if step == "b64decode":
+    with open(os.path.join(out_dir, "full.bin"), "wb") as f:
+        f.write(base64.b64decode(data))
+elif step == "save_base64_to_file":
+    handler.save_base64_to_file(data, out_dir, "streamed.bin")
+elif step == "b64encode":
+    with open(binary_path, "rb") as f:
+        result = base64.b64encode(f.read()).decode("ascii")
+elif step == "encode_file_base64":
+    result = handler.encode_file_base64(binary_path)
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "loaded": loaded, "peak": status("VmHWM")}))
+"""
+
+CASES = {
+    "decode: b64decode + write": ("payload", "b64decode"),
+    "decode: save_base64_to_file": ("payload", "save_base64_to_file"),
+    "encode: read + b64encode": ("none", "b64encode"),
+    "encode: encode_file_base64": ("none", "encode_file_base64"),
+}
+
+
+def run_case(load, step, payload_path, binary_path, out_dir):
+    """Return the child's {"seconds", "loaded", "peak"} (RSS in MB) for one step"""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_DIR, os.getenv("PYTHONPATH")])))
+    proc = subprocess.run(
+        [sys.executable, "-c", CHILD, payload_path, binary_path, out_dir, load, step],
+        cwd=REPO_DIR, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=200, help="decoded payload size in MB")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench_base64_") as tmp:
+        binary_path = os.path.join(tmp, "payload.bin")
+        payload_path = os.path.join(tmp, "payload.b64")
+        out_dir = os.path.join(tmp, "out")
+        os.makedirs(out_dir)
+        with open(binary_path, "wb") as binary, open(payload_path, "wb") as payload:
+            for _ in range(args.size):
+                # 1 MiB - 1 is a multiple of 3, so the encoded chunks concatenate without padding
+                chunk = os.urandom(1024 * 1024 - 1)
+                binary.write(chunk)
+                payload.write(base64.b64encode(chunk))
+
+        print(f"{args.size} MB payload")
+        print(f"{'case':<30} {'seconds':>10} {'loaded MB':>10} {'peak MB':>10} {'added MB':>10}")
+        for name, (load, step) in CASES.items():
+            try:
+                result = run_case(load, step, payload_path, binary_path, out_dir)
+            except RuntimeError as e:
+                print(f"{name:<30} failed: {e}")
+                continue
+            added = result["peak"] - result["loaded"]
+            print(f"{name:<30} {result['seconds']:>10.2f} {result['loaded']:>10.1f} {result['peak']:>10.1f} {added:>10.1f}")
+            for output in os.listdir(out_dir):
+                os.remove(os.path.join(out_dir, output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Measure the time from a rendered video to its URL, eager upload against upload after completion.
+
+"Render end" is the moment FakeComfyUI writes the VHS_VideoCombine output;
+"URL return" is when the handler holds the uploaded video's URL. Two flows
+are timed against the fakes in fakes.py:
+
+  eager       run_prompts() + OutputCollector.results(): the upload starts on
+              the output node's `executed` message
+  after end   the previous flow: wait for the prompt to end, fetch /history,
+              then upload each output in turn
+
+--tail sets how long the fake ComfyUI keeps working after the output node
+(the nodes and model offloading that follow it in a real workflow);
+--upload adds latency to every upload.
+
+Usage:
+    python benchmarks/bench_delivery.py [--runs 10] [--tail 0,0.5,2] [--upload 0.2]
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from fakes import FakeComfyUI, FakeStorage  # noqa: E402
+
+
+def deliver_eager(handler, session, prompt):
+    collector = handler.run_prompts([(prompt, [])], output_mode="url", session=session)[0]
+    collector.results()
+    return collector.prompt_id
+
+
+def deliver_after_end(handler, session, prompt):
+    collector = handler.run_prompts([(prompt, [])], output_mode="local", session=session)[0]
+    collector.results()
+    history = handler.get_history(collector.prompt_id, session)[collector.prompt_id]
+    for node_output in history["outputs"].values():
+        for video in node_output.get("gifs", []):
+            handler.deliver_video(video["fullpath"], "url")
+    return collector.prompt_id
+
+
+FLOWS = {"eager": deliver_eager, "after end": deliver_after_end}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10, help="prompts per flow and tail")
+    parser.add_argument("--tail", default="0,0.5,2", help="comma-separated seconds of ComfyUI work after the output node")
+    parser.add_argument("--upload", type=float, default=0.2, help="seconds added to every upload")
+    parser.add_argument("--render-seconds", type=float, default=0.2)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench_delivery_") as tmp:
+        os.environ.update({
+            "METRICS_PATH": "",
+            "RESULT_CACHE_TTL": "0",
+            "COMFYUI_HEALTH_INTERVAL": "0",
+            "WORKSPACE_DIR": os.path.join(tmp, "workspaces"),
+            "SUPABASE_SERVICE_ROLE_KEY": "bench",
+        })
+        import handler
+        logging.getLogger().setLevel(logging.WARNING)
+
+        output_video = os.path.join(tmp, "output.mp4")
+        with open(output_video, "wb") as f:
+            f.write(os.urandom(1024 * 1024))
+        comfyui = FakeComfyUI(output_video, os.path.join(tmp, "comfyui", "temp"), render_seconds=args.render_seconds)
+        storage = FakeStorage(tmp, upload_seconds=args.upload)
+        handler.storage_backend = handler.SupabaseStorage(url=storage.url, key="bench")
+        session = handler.ComfySession("127.0.0.1", comfyui.port)
+        template = handler.get_workflow_template("image", "single")
+        seeds = iter(range(10 ** 6))
+
+        print(f"upload latency {args.upload * 1000:.0f} ms, {args.runs} runs per cell; render end -> URL, p50 ms")
+        print(f"{'tail s':>8} {'eager':>10} {'after end':>10} {'saved':>10}")
+        for tail in (float(value) for value in args.tail.split(",")):
+            comfyui.tail_seconds = tail
+            medians = {}
+            for name, deliver in FLOWS.items():
+                latencies = []
+                for _ in range(args.runs):
+                    prompt_id = deliver(handler, session, template.instantiate({"seed": next(seeds)}))
+                    latencies.append(time.monotonic() - comfyui.output_times[prompt_id])
+                medians[name] = statistics.median(latencies) * 1000
+            saved = medians["after end"] - medians["eager"]
+            print(f"{tail:>8.2f} {medians['eager']:>10.1f} {medians['after end']:>10.1f} {saved:>10.1f}")
+
+        session.close()
+        comfyui.close()
+        storage.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+"""Replay job mixes through the handler against a fake ComfyUI and fake storage.
+
+Measures what the handler itself costs: input fetching and decoding, probing,
+preprocessing, prompt building, the WebSocket loop, output delivery and
+cleanup. The GPU is replaced by FakeComfyUI (see fakes.py), which sleeps
+--render-seconds per prompt and returns a small MP4. Uploads and URL inputs
+go to FakeStorage. Everything runs on localhost, so regressions in the
+non-GPU path show up on a laptop.
+
+Per job, overhead is the handler's wall time minus the time ComfyUI spent
+executing the prompt (the handler's own execution profile). With
+--concurrency above 1 it also includes waiting for a free instance. The
+report gives p50/p95 overhead per workflow and input source, throughput, and
+the peak RSS of this process (the handler plus the fakes, which stream
+their data).
+
+Jobs come from --mix (workflow=weight) and --sources (path, url, base64),
+or from --replay, a JSONL file of job inputs ({"input": {...}} or the bare
+input). Relative *_path values in a replay file are resolved against the
+generated fixtures ("image.jpg", "audio.mp3", "audio_2.mp3", "video.mp4").
+Needs ffmpeg on PATH and the handler's dependencies.
+
+Usage:
+    python benchmarks/bench_handler.py [--jobs 40] [--concurrency 1] [--instances 1]
+        [--mix i2v_single=4,i2v_multi=1,v2v_single=1,v2v_multi=1] [--sources path,url,base64]
+        [--output-mode url] [--render-seconds 0.5] [--replay jobs.jsonl]
+"""
+import argparse
+import asyncio
+import base64
+import itertools
+import json
+import logging
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from fakes import FakeComfyUI, FakeStorage  # noqa: E402
+
+WORKFLOWS = {
+    "i2v_single": ("image", "single"),
+    "i2v_multi": ("image", "multi"),
+    "v2v_single": ("video", "single"),
+    "v2v_multi": ("video", "multi"),
+}
+
+
+def make_fixtures(directory):
+    """Copy the example image/audio and render a source and an output video with ffmpeg"""
+    os.makedirs(directory, exist_ok=True)
+    shutil.copy(os.path.join(REPO_DIR, "examples", "image.jpg"), os.path.join(directory, "image.jpg"))
+    shutil.copy(os.path.join(REPO_DIR, "examples", "audio.mp3"), os.path.join(directory, "audio.mp3"))
+    shutil.copy(os.path.join(REPO_DIR, "examples", "audio.mp3"), os.path.join(directory, "audio_2.mp3"))
+    for name, seconds in (("video.mp4", 10), ("output.mp4", 4)):
+        subprocess.run([
+            "ffmpeg", "-v", "error", "-y", "-f", "lavfi", "-i", f"testsrc=size=640x360:rate=25:duration={seconds}",
+            "-f", "lavfi", "-i", f"sine=frequency=220:duration={seconds}",
+            "-c:v", "libx264", "-pix_fmt", "yuv420p", "-c:a", "aac", "-shortest", os.path.join(directory, name),
+        ], check=True)
+
+
+def start_comfyuis(args, fixtures, work_dir):
+    """Start --instances fake ComfyUIs on consecutive ports, as the handler expects"""
+    for _ in range(20):
+        base = random.randint(20000, 60000)
+        comfyuis = []
+        try:
+            for i in range(args.instances):
+                comfyuis.append(FakeComfyUI(
+                    os.path.join(fixtures, "output.mp4"), os.path.join(work_dir, f"comfyui_{i}", "temp"),
+                    render_seconds=args.render_seconds, steps=args.steps, port=base + i,
+                ))
+            return comfyuis
+        except OSError:
+            for comfyui in comfyuis:
+                comfyui.close()
+    raise SystemExit(f"Could not bind {args.instances} consecutive ports for the fake ComfyUI")
+
+
+def configure_env(work_dir, storage, comfyuis, args):
+    """Point the handler at the fakes and keep every cache and scratch file under work_dir"""
+    os.environ.update({
+        "SERVER_ADDRESS": "127.0.0.1",
+        "COMFYUI_PORT": str(comfyuis[0].port),
+        "COMFYUI_INSTANCES": str(len(comfyuis)),
+        "SUPABASE_URL": storage.url,
+        "SUPABASE_SERVICE_ROLE_KEY": "bench",
+        "METRICS_PATH": "",
+        "VRAM_GB": os.getenv("VRAM_GB", "24"),
+        "RESULT_CACHE_TTL": "0" if not args.result_cache else os.getenv("RESULT_CACHE_TTL", "3600"),
+        "RESULT_CACHE_PATH": os.path.join(work_dir, "results.sqlite"),
+        "INPUT_CACHE_DIR": os.path.join(work_dir, "cache", "inputs"),
+        "MEDIA_STORE_DIR": os.path.join(work_dir, "cache", "media"),
+        "PREPROCESS_CACHE_DIR": os.path.join(work_dir, "cache", "preprocessed"),
+        "TEXT_EMBED_CACHE_DIR": os.path.join(work_dir, "cache", "text_embeds"),
+        "WORKSPACE_DIR": os.path.join(work_dir, "workspaces"),
+        "WORKSPACE_TMPFS_DIR": "",
+        "OUTPUT_DIR": os.path.join(work_dir, "outputs"),
+    })
+
+
+def media_key(input_type):
+    return "image" if input_type == "image" else "video"
+
+
+def source_value(source, name, fixtures, storage):
+    """The job field value for fixture name given as a path, URL or base64 input"""
+    path = os.path.join(fixtures, name)
+    if source == "path":
+        return path
+    if source == "url":
+        return storage.input_url(name)
+    with open(path, "rb") as f:
+        return base64.b64encode(f.read()).decode("ascii")
+
+
+def build_jobs(args, fixtures, storage):
+    """Return [(label, job)] from --replay or the --mix/--sources generator"""
+    if args.replay:
+        jobs = []
+        with open(args.replay) as f:
+            for index, line in enumerate(filter(str.strip, f)):
+                job_input = json.loads(line)
+                job_input = dict(job_input.get("input", job_input))
+                for key, value in job_input.items():
+                    if key.endswith(("_path", "_path_2")) and isinstance(value, str) and not os.path.isabs(value):
+                        job_input[key] = os.path.join(fixtures, value)
+                label = "{}_{}".format(
+                    "i2v" if job_input.get("input_type", "image") == "image" else "v2v",
+                    job_input.get("person_count", "single"),
+                )
+                jobs.append((label, {"id": f"replay-{index}", "input": job_input}))
+        return jobs
+
+    weights = {}
+    for item in args.mix.split(","):
+        name, _, weight = item.partition("=")
+        if name.strip() not in WORKFLOWS:
+            raise SystemExit(f"Unknown workflow '{name}' (expected one of {', '.join(WORKFLOWS)})")
+        weights[name.strip()] = float(weight or 1)
+    sources = itertools.cycle([source.strip() for source in args.sources.split(",")])
+    rng = random.Random(args.seed)
+    jobs = []
+    for index in range(args.jobs):
+        workflow = rng.choices(list(weights), weights=list(weights.values()))[0]
+        source = next(sources)
+        input_type, person_count = WORKFLOWS[workflow]
+        media = "image.jpg" if input_type == "image" else "video.mp4"
+        job_input = {
+            "input_type": input_type,
+            "person_count": person_count,
+            "prompt": "A person is talking",
+            "seed": index,
+            "output_mode": args.output_mode,
+            f"{media_key(input_type)}_{source}": source_value(source, media, fixtures, storage),
+            f"wav_{source}": source_value(source, "audio.mp3", fixtures, storage),
+        }
+        if person_count == "multi":
+            job_input[f"wav_{source}_2"] = source_value(source, "audio_2.mp3", fixtures, storage)
+        jobs.append((f"{workflow}/{source}", {"id": f"bench-{index}", "input": job_input}))
+    return jobs
+
+
+def percentile(values, q):
+    """Linear-interpolated percentile (q in 0..100) of a non-empty list"""
+    values = sorted(values)
+    position = (len(values) - 1) * q / 100
+    low = int(position)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (position - low)
+
+
+def execution_seconds(result):
+    """Seconds ComfyUI spent executing the job's prompt(s), from the handler's own profile"""
+    items = result.get("items", [result])
+    return sum(item.get("timings", {}).get("execution", {}).get("total_seconds", 0.0) for item in items)
+
+
+def run_jobs(handler, jobs, concurrency):
+    """Run jobs through handler() (concurrency 1) or async_handler(); returns [(label, seconds, result)]"""
+    def timed_sync(label, job):
+        start = time.perf_counter()
+        result = handler.handler(job)
+        return label, time.perf_counter() - start, result
+
+    if concurrency <= 1:
+        return [timed_sync(label, job) for label, job in jobs]
+
+    async def run_all():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def timed(label, job):
+            async with semaphore:
+                start = time.perf_counter()
+                result = await handler.async_handler(job)
+                return label, time.perf_counter() - start, result
+
+        return await asyncio.gather(*(timed(label, job) for label, job in jobs))
+
+    return asyncio.run(run_all())
+
+
+def report(results, wall_seconds, storage, comfyuis):
+    groups = {}
+    errors = []
+    for label, seconds, result in results:
+        if "error" in result:
+            errors.append(f"{label}: {result['error']}")
+            continue
+        groups.setdefault(label, []).append(max(0.0, seconds - execution_seconds(result)))
+        groups.setdefault("all", []).append(max(0.0, seconds - execution_seconds(result)))
+
+    print(f"{'jobs':<24} {'n':>5} {'p50 ms':>10} {'p95 ms':>10} {'max ms':>10}")
+    for label in sorted(groups, key=lambda name: (name == "all", name)):
+        overheads = groups[label]
+        print(
+            f"{label:<24} {len(overheads):>5} {percentile(overheads, 50) * 1000:>10.1f} "
+            f"{percentile(overheads, 95) * 1000:>10.1f} {max(overheads) * 1000:>10.1f}"
+        )
+    print()
+    print(f"throughput       {len(results) / wall_seconds:.2f} jobs/s ({len(results)} jobs in {wall_seconds:.2f} s)")
+    # ru_maxrss is in KiB on Linux
+    print(f"peak RSS         {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MB")
+    print(f"prompts queued   {sum(comfyui.prompts for comfyui in comfyuis)}")
+    print(f"uploads          {storage.uploads} ({storage.uploaded_bytes / 1024 ** 2:.1f} MB), input downloads {storage.downloads}")
+    print(f"errors           {len(errors)}")
+    for error in errors[:5]:
+        print(f"  {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--jobs", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=1, help="1 runs handler(), more runs async_handler()")
+    parser.add_argument("--instances", type=int, default=1, help="fake ComfyUI instances (one per GPU)")
+    parser.add_argument("--mix", default="i2v_single=4,i2v_multi=1,v2v_single=1,v2v_multi=1")
+    parser.add_argument("--sources", default="path,url,base64")
+    parser.add_argument("--output-mode", default="url", choices=("url", "base64", "path"))
+    parser.add_argument("--render-seconds", type=float, default=0.5)
+    parser.add_argument("--steps", type=int, default=4)
+    parser.add_argument("--warmup", type=int, default=2, help="jobs run before measuring")
+    parser.add_argument("--replay", help="JSONL file of job inputs to replay instead of --mix")
+    parser.add_argument("--result-cache", action="store_true", help="leave the result cache on")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="bench_handler_")
+    try:
+        fixtures = os.path.join(work_dir, "fixtures")
+        make_fixtures(fixtures)
+        storage = FakeStorage(fixtures)
+        comfyuis = start_comfyuis(args, fixtures, work_dir)
+        configure_env(work_dir, storage, comfyuis, args)
+
+        import handler
+        logging.getLogger().setLevel(logging.WARNING)
+
+        jobs = build_jobs(args, fixtures, storage)
+        warmup = [(label, dict(job, id=f"warmup-{i}")) for i, (label, job) in enumerate(jobs[:args.warmup])]
+        run_jobs(handler, warmup, 1)
+        for comfyui in comfyuis:
+            comfyui.prompts = 0
+        storage.uploads = storage.uploaded_bytes = storage.downloads = 0
+
+        started = time.perf_counter()
+        results = run_jobs(handler, jobs, args.concurrency)
+        report(results, time.perf_counter() - started, storage, comfyuis)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
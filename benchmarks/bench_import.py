@@ -0,0 +1,62 @@
+"""Measure handler.py import time and peak RSS.
+
+Each statement is run in a fresh interpreter several times; the median wall time
+and the peak resident set size of the child process are reported. librosa is
+measured on its own as the reference for what the handler used to import at
+module load.
+
+Usage:
+    python benchmarks/bench_import.py [--runs 5]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STATEMENTS = {
+    "python (empty)": "pass",
+    "import handler": "import handler",
+    "import librosa": "import librosa",
+}
+
+
+def run_once(statement):
+    """Return (seconds, peak RSS in MB) for one interpreter running statement"""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_DIR, os.getenv("PYTHONPATH")])))
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-c", statement],
+        cwd=REPO_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+    )
+    _, status, rusage = os.wait4(proc.pid, 0)
+    elapsed = time.perf_counter() - start
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.read().decode(errors="replace").strip().splitlines()[-1])
+    # ru_maxrss is in KiB on Linux
+    return elapsed, rusage.ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'statement':<20} {'median s':>10} {'min s':>10} {'peak RSS MB':>12}")
+    for name, statement in STATEMENTS.items():
+        try:
+            results = [run_once(statement) for _ in range(args.runs)]
+        except RuntimeError as e:
+            print(f"{name:<20} failed: {e}")
+            continue
+        times = [t for t, _ in results]
+        rss = max(r for _, r in results)
+        print(f"{name:<20} {statistics.median(times):>10.3f} {min(times):>10.3f} {rss:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Measure the CPU cost of input normalization against what ComfyUI would decode.
+
+For the image, a full-resolution decode plus LANCZOS resize (roughly what
+LoadImage + ImageResizeKJv2 do) is compared with normalize_image() on a cold
+and a warm preprocessing cache, followed by a decode of its output. For the
+audio, a 48 kHz stereo WAV is generated from examples/audio.mp3 and decoded
+before and after normalize_audio(). Needs Pillow, NumPy and ffmpeg on PATH.
+
+Usage:
+    python benchmarks/bench_preprocess.py [--runs 5] [--size 854x480]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_DIR = tempfile.mkdtemp(prefix="bench_preprocess_")
+os.environ["PREPROCESS_CACHE_DIR"] = CACHE_DIR
+sys.path.insert(0, REPO_DIR)
+
+import handler  # noqa: E402
+from PIL import Image  # noqa: E402
+
+
+def timed(fn, runs):
+    """Return the median wall time of fn() over runs calls"""
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def clear_cache():
+    for name in os.listdir(CACHE_DIR):
+        os.remove(os.path.join(CACHE_DIR, name))
+
+
+def decode_image(path, size=None):
+    with Image.open(path) as img:
+        img = img.convert("RGB")
+        if size:
+            img = img.resize(size, Image.LANCZOS)
+        return img.size
+
+
+def make_stereo_wav(path):
+    subprocess.run([
+        "ffmpeg", "-v", "error", "-y", "-stream_loop", "9", "-i", os.path.join(REPO_DIR, "examples", "audio.mp3"),
+        "-ac", "2", "-ar", "48000", "-c:a", "pcm_s16le", path,
+    ], check=True)
+
+
+def report(name, seconds, size_path=None):
+    size = f"{os.path.getsize(size_path) / 1024:>10.0f}" if size_path else f"{'':>10}"
+    print(f"{name:<36} {seconds * 1000:>10.1f} {size}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--size", default="854x480")
+    args = parser.parse_args()
+    width, height = (int(v) for v in args.size.split("x"))
+    image = os.path.join(REPO_DIR, "examples", "image.jpg")
+
+    print(f"{'step':<36} {'median ms':>10} {'KiB':>10}")
+    report("image: full decode + lanczos", timed(lambda: decode_image(image, (width, height)), args.runs), image)
+
+    def cold_image():
+        clear_cache()
+        return handler.normalize_image(image, width, height)
+
+    report("image: normalize (cold)", timed(cold_image, args.runs))
+    resized, _ = handler.normalize_image(image, width, height)
+    report("image: normalize (cached)", timed(lambda: handler.normalize_image(image, width, height), args.runs), resized)
+    report("image: decode normalized", timed(lambda: decode_image(resized), args.runs))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        wav = os.path.join(tmp, "stereo48k.wav")
+        make_stereo_wav(wav)
+        report("audio: decode 48k stereo", timed(lambda: handler.decode_audio_mono(wav, 44100), args.runs), wav)
+
+        def cold_audio():
+            clear_cache()
+            return handler.normalize_audio(wav)
+
+        report("audio: normalize (cold)", timed(cold_audio, args.runs))
+        normalized, _ = handler.normalize_audio(wav)
+        report("audio: normalize (cached)", timed(lambda: handler.normalize_audio(wav), args.runs), normalized)
+        report("audio: decode normalized", timed(lambda: handler.decode_audio_mono(normalized, 44100), args.runs))
+    clear_cache()
+    os.rmdir(CACHE_DIR)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,515 @@
+"""Local stand-ins for ComfyUI and Supabase Storage, for benchmarks and tests that run without a GPU.
+
+FakeComfyUI speaks enough of ComfyUI's HTTP and WebSocket API for handler.py:
+/prompt, /history/<id>, /view, /queue, /interrupt, /system_stats and /ws.
+Prompts run one at a time, like on a GPU. The sampler node takes
+render_seconds and reports steps progress messages. Each VHS_VideoCombine
+node "writes" output_video (copied into output_dir); tail_seconds then pass
+before the prompt ends, standing in for the nodes and model offloading that
+follow the output in a real workflow. As in ComfyUI's node cache, a node
+whose inputs, and those of every node upstream of it, are unchanged since the
+previous prompt is reported in execution_cached and not run; a cached output
+node sends its previous `executed` output again. Each of the next
+sampler_faults prompts fails at the sampler with an execution_error.
+
+FakeStorage serves files from a directory under /inputs/<name> with ETag,
+Last-Modified and Content-Type, and answers conditional requests with 304 Not
+Modified (set send_etag to False to leave only Last-Modified). It accepts
+Supabase object uploads, both the single POST and TUS resumable ones.
+Single-request bodies are counted and discarded; upload_seconds adds network
+latency to them. TUS uploads are kept in objects, keyed by object name, and
+follow the protocol closely enough to test a client: PATCHes at the wrong
+Upload-Offset get 409, tus_extensions sets what OPTIONS advertises (add
+"concatenation" for partial and final uploads), and each of the next
+patch_faults PATCHes stores half its body and then fails with a 500.
+"""
+import base64
+import email.utils
+import hashlib
+import json
+import mimetypes
+import os
+import queue
+import shutil
+import socket
+import struct
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+class JSONHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, obj, status=200, headers=None):
+        body = json.dumps(obj).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_empty(self, status, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def read_body(self, sink=None):
+        """Read the request body (Content-Length or chunked); returns it, or its size if sink is given"""
+        size = 0
+        chunks = []
+
+        def take(data):
+            nonlocal size
+            size += len(data)
+            if sink is None:
+                chunks.append(data)
+            else:
+                sink(data)
+
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            while True:
+                length = int(self.rfile.readline().split(b";")[0].strip(), 16)
+                if length == 0:
+                    self.rfile.readline()
+                    break
+                take(self.rfile.read(length))
+                self.rfile.readline()
+        else:
+            remaining = int(self.headers.get("Content-Length") or 0)
+            while remaining > 0:
+                data = self.rfile.read(min(remaining, 1024 * 1024))
+                if not data:
+                    break
+                remaining -= len(data)
+                take(data)
+        return b"".join(chunks) if sink is None else size
+
+
+class FakeComfyUI:
+    def __init__(self, output_video, output_dir, render_seconds=0.5, steps=4, tail_seconds=0.0, host="127.0.0.1", port=0):
+        self.output_video = output_video
+        self.output_dir = output_dir
+        self.render_seconds = render_seconds
+        self.steps = steps
+        self.tail_seconds = tail_seconds  # spent after the last output node, before the prompt ends
+        self.sampler_faults = 0
+        os.makedirs(output_dir, exist_ok=True)
+        self.clients = {}  # client_id -> (socket, send lock)
+        self.history = {}
+        self.output_times = {}  # prompt_id -> time.monotonic() its last output file was written
+        self.finish_times = {}  # prompt_id -> time.monotonic() it ended
+        self.pending = []  # prompt_ids waiting or running, in order
+        self.prompts = 0
+        self.connections = 0  # TCP connections accepted, WebSockets included
+        self.ws_connections = 0
+        self.interrupts = 0
+        self.interrupted = threading.Event()
+        self._cache = {}  # node signature -> output, for the nodes of the previous prompt
+        self.cached = {}  # prompt_id -> node ids served from the cache
+        self._counter = 0
+        self._jobs = queue.Queue()
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.port = self.server.server_port
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        threading.Thread(target=self._worker, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def drop_websockets(self):
+        """Cut every WebSocket from the server side, as a ComfyUI restart or a network blip would"""
+        for conn, _ in list(self.clients.values()):
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def _handler(self):
+        fake = self
+
+        class Handler(JSONHandler):
+            def setup(self):
+                super().setup()
+                with fake._lock:
+                    fake.connections += 1
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path == "/ws":
+                    return fake._websocket(self, parse_qs(url.query).get("clientId", [""])[0])
+                if url.path.startswith("/history/"):
+                    prompt_id = url.path.rsplit("/", 1)[-1]
+                    return self.send_json({prompt_id: fake.history[prompt_id]} if prompt_id in fake.history else {})
+                if url.path == "/queue":
+                    with fake._lock:
+                        items = [[i, prompt_id, {}, {}, []] for i, prompt_id in enumerate(fake.pending)]
+                    return self.send_json({"queue_running": items[:1], "queue_pending": items[1:]})
+                if url.path == "/view":
+                    query = parse_qs(url.query)
+                    path = os.path.join(fake.output_dir, query.get("subfolder", [""])[0], query.get("filename", [""])[0])
+                    if not os.path.isfile(path):
+                        return self.send_empty(404)
+                    self.send_response(200)
+                    self.send_header("Content-Type", mimetypes.guess_type(path)[0] or "application/octet-stream")
+                    self.send_header("Content-Length", str(os.path.getsize(path)))
+                    self.end_headers()
+                    with open(path, "rb") as f:
+                        shutil.copyfileobj(f, self.wfile)
+                    return
+                if url.path == "/system_stats":
+                    return self.send_json({"system": {"os": "fake", "comfyui_version": "fake"}, "devices": []})
+                self.send_empty(404)
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                body = json.loads(self.read_body() or b"{}")
+                if url.path == "/prompt":
+                    if not isinstance(body.get("prompt"), dict):
+                        return self.send_json({"error": "no prompt", "node_errors": {}}, 400)
+                    prompt_id = str(uuid.uuid4())
+                    with fake._lock:
+                        fake.pending.append(prompt_id)
+                        fake.prompts += 1
+                        number = fake.prompts
+                    fake._jobs.put((prompt_id, body["prompt"], body.get("client_id")))
+                    return self.send_json({"prompt_id": prompt_id, "number": number, "node_errors": {}})
+                if url.path == "/interrupt":
+                    fake.interrupts += 1
+                    fake.interrupted.set()
+                    return self.send_json({})
+                if url.path == "/queue":
+                    with fake._lock:
+                        fake.pending = [p for p in fake.pending if p not in body.get("delete", [])]
+                    return self.send_json({})
+                self.send_empty(404)
+
+        return Handler
+
+    # WebSocket (server side, unfragmented frames only)
+
+    def _websocket(self, request, client_id):
+        key = request.headers["Sec-WebSocket-Key"]
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+        request.send_response(101)
+        request.send_header("Upgrade", "websocket")
+        request.send_header("Connection", "Upgrade")
+        request.send_header("Sec-WebSocket-Accept", accept)
+        request.end_headers()
+        request.wfile.flush()
+        conn = request.connection
+        with self._lock:
+            self.ws_connections += 1
+        self.clients[client_id] = (conn, threading.Lock())
+        self.send(client_id, "status", {"status": {"exec_info": {"queue_remaining": len(self.pending)}}, "sid": client_id})
+        try:
+            while True:
+                header = request.rfile.read(2)
+                if len(header) < 2:
+                    break
+                opcode, length = header[0] & 0x0F, header[1] & 0x7F
+                if length == 126:
+                    length = struct.unpack("!H", request.rfile.read(2))[0]
+                elif length == 127:
+                    length = struct.unpack("!Q", request.rfile.read(8))[0]
+                mask = request.rfile.read(4) if header[1] & 0x80 else b"\0\0\0\0"
+                payload = bytes(b ^ mask[i % 4] for i, b in enumerate(request.rfile.read(length)))
+                if opcode == 0x8:
+                    self._send_frame(client_id, 0x8, payload[:2])
+                    break
+                if opcode == 0x9:
+                    self._send_frame(client_id, 0xA, payload)
+        except OSError:
+            pass
+        finally:
+            if self.clients.get(client_id, (None,))[0] is conn:
+                del self.clients[client_id]
+        request.close_connection = True
+
+    def _send_frame(self, client_id, opcode, data):
+        client = self.clients.get(client_id)
+        if client is None:
+            return
+        conn, lock = client
+        if len(data) < 126:
+            header = struct.pack("!BB", 0x80 | opcode, len(data))
+        elif len(data) < 65536:
+            header = struct.pack("!BBH", 0x80 | opcode, 126, len(data))
+        else:
+            header = struct.pack("!BBQ", 0x80 | opcode, 127, len(data))
+        try:
+            with lock:
+                conn.sendall(header + data)
+        except OSError:
+            pass
+
+    def send(self, client_id, message_type, data):
+        self._send_frame(client_id, 0x1, json.dumps({"type": message_type, "data": data}).encode())
+
+    # Execution
+
+    def _worker(self):
+        while True:
+            prompt_id, prompt, client_id = self._jobs.get()
+            with self._lock:
+                if prompt_id not in self.pending:
+                    continue  # deleted from the queue before it started
+            self.interrupted.clear()
+            try:
+                self._execute(prompt_id, prompt, client_id)
+            finally:
+                with self._lock:
+                    self.pending = [p for p in self.pending if p != prompt_id]
+                self.finish_times[prompt_id] = time.monotonic()
+                self.send(client_id, "executing", {"node": None, "prompt_id": prompt_id})
+
+    @staticmethod
+    def _signatures(prompt):
+        """Cache key of every node: its class and inputs, with links replaced by the linked node's key"""
+        signatures = {}
+
+        def signature(node_id):
+            if node_id not in signatures:
+                node = prompt[node_id]
+                inputs = {
+                    name: [signature(value[0]), value[1]] if isinstance(value, list) and value and value[0] in prompt else value
+                    for name, value in node.get("inputs", {}).items()
+                }
+                key = json.dumps([node.get("class_type"), inputs], sort_keys=True)
+                signatures[node_id] = hashlib.sha256(key.encode()).hexdigest()
+            return signatures[node_id]
+
+        for node_id in prompt:
+            signature(node_id)
+        return signatures
+
+    def _execute(self, prompt_id, prompt, client_id):
+        self.send(client_id, "execution_start", {"prompt_id": prompt_id})
+        order = sorted(prompt, key=lambda node_id: int(node_id) if node_id.isdigit() else node_id)
+        signatures = self._signatures(prompt)
+        cached = [node_id for node_id in order if signatures[node_id] in self._cache]
+        self.cached[prompt_id] = cached
+        self.send(client_id, "execution_cached", {"nodes": cached, "prompt_id": prompt_id})
+
+        outputs = {}
+        for node_id in order:
+            class_type = prompt[node_id].get("class_type")
+            if node_id in cached:
+                output = self._cache[signatures[node_id]]
+                if output is not None:
+                    outputs[node_id] = output
+                    self.send(client_id, "executed", {"node": node_id, "output": output, "prompt_id": prompt_id})
+                continue
+            self.send(client_id, "executing", {"node": node_id, "prompt_id": prompt_id})
+            if class_type == "WanVideoSampler":
+                with self._lock:
+                    fault = self.sampler_faults > 0
+                    if fault:
+                        self.sampler_faults -= 1
+                if fault:
+                    self.send(client_id, "execution_error", {
+                        "prompt_id": prompt_id, "node_id": node_id, "node_type": class_type,
+                        "exception_message": "CUDA out of memory",
+                    })
+                    self._cache = {}
+                    self.history[prompt_id] = {"prompt": prompt, "outputs": {}, "status": {"status_str": "error", "completed": False}}
+                    return
+                for step in range(self.steps):
+                    if self.interrupted.wait(self.render_seconds / self.steps):
+                        self.send(client_id, "execution_interrupted", {"prompt_id": prompt_id, "node_id": node_id})
+                        self.history[prompt_id] = {"prompt": prompt, "outputs": {}, "status": {"completed": False}}
+                        return
+                    self.send(client_id, "progress", {"value": step + 1, "max": self.steps, "node": node_id, "prompt_id": prompt_id})
+            elif class_type == "VHS_VideoCombine":
+                with self._lock:
+                    self._counter += 1
+                    filename = f"{prompt[node_id]['inputs'].get('filename_prefix', 'fake')}_{self._counter:05d}.mp4"
+                path = os.path.join(self.output_dir, filename)
+                shutil.copyfile(self.output_video, path)
+                output = {"gifs": [{
+                    "filename": filename, "subfolder": "", "type": "temp", "format": "video/h264-mp4", "fullpath": path,
+                }]}
+                outputs[node_id] = output
+                self.output_times[prompt_id] = time.monotonic()
+                self.send(client_id, "executed", {"node": node_id, "output": output, "prompt_id": prompt_id})
+        time.sleep(self.tail_seconds)
+        self._cache = {signatures[node_id]: outputs.get(node_id) for node_id in order}
+        self.history[prompt_id] = {
+            "prompt": prompt,
+            "outputs": outputs,
+            "status": {"status_str": "success", "completed": True},
+        }
+        self.send(client_id, "execution_success", {"prompt_id": prompt_id})
+
+
+class FakeStorage:
+    def __init__(self, input_dir, upload_seconds=0.0, host="127.0.0.1", port=0):
+        self.input_dir = input_dir
+        self.upload_seconds = upload_seconds  # added to every single-request upload
+        self.upload_times = []  # time.monotonic() each single-request upload arrived
+        self.uploads = 0
+        self.uploaded_bytes = 0
+        self.downloads = 0
+        self.not_modified = 0
+        self.send_etag = True
+        self.objects = {}  # object name -> bytes of each finished TUS upload
+        self.tus_extensions = "creation"
+        self.tus_creates = []  # "single", "partial" or "final" for each TUS creation
+        self.patches = []  # (Upload-Offset, body size) of each PATCH
+        self.patch_seconds = 0.0  # added to every PATCH
+        self.patch_faults = 0
+        self.max_parallel_patches = 0
+        self.heads = 0
+        self._patches_running = 0
+        self._tus = {}  # upload id -> {"data", "length", "partial", "name"}
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.port = self.server.server_port
+        self.url = f"http://{host}:{self.port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def input_url(self, name):
+        return f"{self.url}/inputs/{name}"
+
+    def _record_upload(self, size):
+        with self._lock:
+            self.uploads += 1
+            self.uploaded_bytes += size
+
+    def _finish_tus(self, upload):
+        with self._lock:
+            self.objects[upload["name"]] = bytes(upload["data"])
+        self._record_upload(upload["length"])
+
+    def _handler(self):
+        fake = self
+        tus_path = "/storage/v1/upload/resumable"
+
+        class Handler(JSONHandler):
+            def do_GET(self):
+                path = urlparse(self.path).path
+                if not path.startswith("/inputs/"):
+                    return self.send_empty(404)
+                file_path = os.path.join(fake.input_dir, os.path.basename(path))
+                if not os.path.isfile(file_path):
+                    return self.send_empty(404)
+                st = os.stat(file_path)
+                validators = {"Last-Modified": email.utils.formatdate(int(st.st_mtime), usegmt=True)}
+                if fake.send_etag:
+                    validators["ETag"] = f'"{st.st_size:x}-{int(st.st_mtime):x}"'
+                if "If-None-Match" in self.headers and fake.send_etag:
+                    not_modified = self.headers["If-None-Match"] == validators["ETag"]
+                else:
+                    since = self.headers.get("If-Modified-Since")
+                    not_modified = since is not None and email.utils.parsedate_to_datetime(since).timestamp() >= int(st.st_mtime)
+                if not_modified:
+                    with fake._lock:
+                        fake.not_modified += 1
+                    return self.send_empty(304, validators)
+                with fake._lock:
+                    fake.downloads += 1
+                self.send_response(200)
+                self.send_header("Content-Type", mimetypes.guess_type(file_path)[0] or "application/octet-stream")
+                self.send_header("Content-Length", str(st.st_size))
+                for name, value in validators.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                with open(file_path, "rb") as f:
+                    shutil.copyfileobj(f, self.wfile)
+
+            def do_POST(self):
+                path = urlparse(self.path).path
+                if path.startswith("/storage/v1/object/"):
+                    fake.upload_times.append(time.monotonic())
+                    size = self.read_body(sink=lambda data: None)
+                    time.sleep(fake.upload_seconds)
+                    fake._record_upload(size)
+                    return self.send_json({"Key": path[len("/storage/v1/object/"):]})
+                if path == tus_path:
+                    self.read_body()
+                    concat = self.headers.get("Upload-Concat", "")
+                    metadata = {}
+                    for pair in filter(None, self.headers.get("Upload-Metadata", "").split(",")):
+                        key, _, value = pair.partition(" ")
+                        metadata[key] = base64.b64decode(value).decode()
+                    upload = {"data": bytearray(), "partial": concat == "partial", "name": metadata.get("objectName")}
+                    if concat.startswith("final;"):
+                        with fake._lock:
+                            parts = [fake._tus.get(url.rstrip("/").rsplit("/", 1)[-1]) for url in concat[6:].split()]
+                        if any(part is None or not part["partial"] or len(part["data"]) < part["length"] for part in parts):
+                            return self.send_empty(400)
+                        for part in parts:
+                            upload["data"] += part["data"]
+                        upload["length"] = len(upload["data"])
+                    else:
+                        upload["length"] = int(self.headers.get("Upload-Length") or 0)
+                    upload_id = uuid.uuid4().hex
+                    with fake._lock:
+                        fake._tus[upload_id] = upload
+                        fake.tus_creates.append(concat.split(";")[0] or "single")
+                    if concat.startswith("final;"):
+                        fake._finish_tus(upload)
+                    return self.send_empty(201, {"Location": f"{tus_path}/{upload_id}", "Tus-Resumable": "1.0.0"})
+                self.send_empty(404)
+
+            def do_PATCH(self):
+                upload = fake._tus.get(urlparse(self.path).path.rsplit("/", 1)[-1])
+                if upload is None:
+                    return self.send_empty(404)
+                offset = int(self.headers.get("Upload-Offset", -1))
+                body = self.read_body()
+                with fake._lock:
+                    fake.patches.append((offset, len(body)))
+                    fake._patches_running += 1
+                    fake.max_parallel_patches = max(fake.max_parallel_patches, fake._patches_running)
+                    fault = fake.patch_faults > 0
+                    if fault:
+                        fake.patch_faults -= 1
+                try:
+                    time.sleep(fake.patch_seconds)
+                    if self.headers.get("Content-Type") != "application/offset+octet-stream":
+                        return self.send_empty(415)
+                    if offset != len(upload["data"]):
+                        return self.send_empty(409, {"Upload-Offset": str(len(upload["data"]))})
+                    if fault:
+                        upload["data"] += body[:len(body) // 2]
+                        return self.send_empty(500)
+                    upload["data"] += body[:upload["length"] - offset]
+                    if len(upload["data"]) >= upload["length"] and not upload["partial"]:
+                        fake._finish_tus(upload)
+                    self.send_empty(204, {"Upload-Offset": str(len(upload["data"])), "Tus-Resumable": "1.0.0"})
+                finally:
+                    with fake._lock:
+                        fake._patches_running -= 1
+
+            def do_HEAD(self):
+                upload = fake._tus.get(urlparse(self.path).path.rsplit("/", 1)[-1])
+                if upload is None:
+                    return self.send_empty(404)
+                with fake._lock:
+                    fake.heads += 1
+                self.send_empty(200, {"Upload-Offset": str(len(upload["data"])), "Upload-Length": str(upload["length"])})
+
+            def do_OPTIONS(self):
+                self.send_empty(204, {"Tus-Resumable": "1.0.0", "Tus-Version": "1.0.0", "Tus-Extension": fake.tus_extensions})
+
+        return Handler
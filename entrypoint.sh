@@ -3,30 +3,57 @@
 # Exit immediately if a command exits with a non-zero status.
 set -e
 
-# Start ComfyUI in the background
-echo "Starting ComfyUI in the background..."
-python /ComfyUI/main.py --listen &
+# Cold-start timestamps, reported in the first job's output
+export BOOT_TIME=$(date +%s.%N)
+
+# GPUs this container may use: a CUDA_VISIBLE_DEVICES the platform already set,
+# otherwise every GPU nvidia-smi lists
+if [ -n "$CUDA_VISIBLE_DEVICES" ]; then
+    IFS=',' read -ra GPUS <<< "$CUDA_VISIBLE_DEVICES"
+else
+    read -ra GPUS <<< "$(nvidia-smi --query-gpu=index --format=csv,noheader 2>/dev/null | tr '\n' ' ' || true)"
+fi
 
-# Wait for ComfyUI to be ready
-echo "Waiting for ComfyUI to be ready..."
-max_wait=120  # Max wait 2 minutes
-wait_count=0
-while [ $wait_count -lt $max_wait ]; do
-    if curl -s http://127.0.0.1:8188/ > /dev/null 2>&1; then
-        echo "ComfyUI is ready!"
-        break
-    fi
-    echo "Waiting for ComfyUI... ($wait_count/$max_wait)"
-    sleep 2
-    wait_count=$((wait_count + 2))
-done
+# One ComfyUI per visible GPU on ports COMFYUI_PORT, COMFYUI_PORT + 1, ...
+# (COMFYUI_INSTANCES overrides, but never exceeds the visible GPUs)
+if [ -z "$COMFYUI_INSTANCES" ] || { [ ${#GPUS[@]} -gt 0 ] && [ "$COMFYUI_INSTANCES" -gt ${#GPUS[@]} ]; }; then
+    COMFYUI_INSTANCES=${#GPUS[@]}
+fi
+if [ "$COMFYUI_INSTANCES" -lt 1 ]; then
+    COMFYUI_INSTANCES=1
+fi
+if [ ${#GPUS[@]} -eq 0 ]; then
+    # No GPU list (nvidia-smi missing); assume COMFYUI_INSTANCES GPUs numbered from 0
+    read -ra GPUS <<< "$(seq 0 $((COMFYUI_INSTANCES - 1)) | tr '\n' ' ')"
+fi
+export COMFYUI_INSTANCES
+# The handler plans each instance's memory against its own GPU
+export COMFYUI_GPUS=$(IFS=','; echo "${GPUS[*]:0:$COMFYUI_INSTANCES}")
+export COMFYUI_PORT=${COMFYUI_PORT:-8188}
 
-if [ $wait_count -ge $max_wait ]; then
-    echo "Error: ComfyUI failed to start within $max_wait seconds"
-    exit 1
+# Start ComfyUI in the background
+# COMFYUI_CACHE_LRU=N keeps node outputs of the last N prompts instead of only the
+# previous one, so alternating avatars/prompts still skip their encoders
+COMFYUI_ARGS="--listen"
+if [ "${COMFYUI_CACHE_LRU:-0}" -gt 0 ]; then
+    COMFYUI_ARGS="$COMFYUI_ARGS --cache-lru $COMFYUI_CACHE_LRU"
+fi
+if [ "$COMFYUI_INSTANCES" -eq 1 ]; then
+    echo "Starting ComfyUI in the background on port $COMFYUI_PORT..."
+    python /ComfyUI/main.py $COMFYUI_ARGS --port $COMFYUI_PORT &
+else
+    # Separate temp directories keep the instances' output file names apart
+    for i in $(seq 0 $((COMFYUI_INSTANCES - 1))); do
+        echo "Starting ComfyUI $i on GPU ${GPUS[$i]}, port $((COMFYUI_PORT + i))..."
+        CUDA_VISIBLE_DEVICES=${GPUS[$i]} python /ComfyUI/main.py $COMFYUI_ARGS --port $((COMFYUI_PORT + i)) \
+            --temp-directory /tmp/comfyui_$i &
+    done
 fi
 
-# Start the handler in the foreground
+# Start the handler in the foreground while ComfyUI boots. It waits for the
+# ComfyUI WebSocket `status` event (up to COMFYUI_BOOT_TIMEOUT seconds), runs the
+# warm-up render (WARMUP=false skips it) and only then registers with RunPod.
 # This script becomes the container's main process
 echo "Starting the handler..."
-exec python handler.py
\ No newline at end of file
+export HANDLER_START=$(date +%s.%N)
+exec python handler.py
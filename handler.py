@@ -1,105 +1,1088 @@
 import runpod
+import asyncio
 import os
 import websocket
 import base64
 import json
+import math
 import uuid
 import logging
-import urllib.request
-import urllib.parse
 import binascii
+import fcntl
+import hashlib
+import shutil
+import sqlite3
+import struct
 import subprocess
 import time
-import librosa
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 import requests
+import planner
+from workspace import Workspace, reclaim_stats, start_sweeper
 # Logging configuration
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
+handler_started = time.time()  # fallback when entrypoint.sh did not export HANDLER_START
 
 # Supabase configuration
 SUPABASE_URL = os.getenv('SUPABASE_URL')
 SUPABASE_SERVICE_ROLE_KEY = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
 SUPABASE_BUCKET_NAME = os.getenv('SUPABASE_BUCKET_NAME', 'youtube-agent')
 
+# Upload configuration
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'supabase')
+UPLOAD_CHUNK_SIZE = 6 * 1024 * 1024  # Supabase only accepts 6 MiB resumable chunks
+RESUMABLE_UPLOAD_THRESHOLD = int(os.getenv('RESUMABLE_UPLOAD_THRESHOLD', str(50 * 1024 ** 2)))
+UPLOAD_PARALLEL_PARTS = int(os.getenv('UPLOAD_PARALLEL_PARTS', '4'))
+UPLOAD_RETRIES = int(os.getenv('UPLOAD_RETRIES', '3'))
+UPLOAD_WORKERS = int(os.getenv('UPLOAD_WORKERS', '4'))
+
 server_address = os.getenv('SERVER_ADDRESS', '127.0.0.1')
-client_id = str(uuid.uuid4())
 
-def upload_to_supabase(file_path, filename):
-    """Upload file to Supabase storage and return public URL"""
-    try:
-        # Read the file
-        with open(file_path, 'rb') as f:
-            file_data = f.read()
-        
-        # Construct the storage path
-        storage_path = f"animations/{filename}"
-        
-        # Upload to Supabase storage
-        upload_url = f"{SUPABASE_URL}/storage/v1/object/{SUPABASE_BUCKET_NAME}/{storage_path}"
-        
+# ComfyUI session configuration
+COMFYUI_PORT = int(os.getenv('COMFYUI_PORT', '8188'))
+# entrypoint.sh starts one ComfyUI per GPU on COMFYUI_PORT, COMFYUI_PORT + 1, ...
+COMFYUI_INSTANCES = int(os.getenv('COMFYUI_INSTANCES', '1'))
+# The GPU each of those instances runs on (nvidia-smi index or UUID), in instance order
+COMFYUI_GPUS = [gpu.strip() for gpu in os.getenv('COMFYUI_GPUS', '').split(',') if gpu.strip()]
+COMFYUI_CONNECT_TIMEOUT = float(os.getenv('COMFYUI_CONNECT_TIMEOUT', '30'))
+COMFYUI_HEALTH_INTERVAL = float(os.getenv('COMFYUI_HEALTH_INTERVAL', '15'))
+COMFYUI_BOOT_TIMEOUT = float(os.getenv('COMFYUI_BOOT_TIMEOUT', '300'))
+
+# Job deadlines. A job may set "timeout" (seconds); otherwise the deadline is
+# JOB_TIMEOUT_FACTOR x the render time estimated from frames x steps x megapixels
+# at the observed rate, but never under JOB_TIMEOUT_MIN. On expiry or cancellation
+# the prompt is interrupted and removed from the ComfyUI queue.
+JOB_TIMEOUT_FACTOR = float(os.getenv('JOB_TIMEOUT_FACTOR', '3'))
+JOB_TIMEOUT_MIN = float(os.getenv('JOB_TIMEOUT_MIN', '600'))
+RENDER_SECONDS_PER_UNIT = float(os.getenv('RENDER_SECONDS_PER_UNIT', '1.0'))  # per frame x step x megapixel
+WATCHDOG_INTERVAL = 1.0  # how often a waiting job checks its deadline and cancellation
+
+# Warm-up: before taking jobs, render one frame window from examples/ so model
+# loading and torch.compile are paid at boot instead of by the first job
+WARMUP = os.getenv('WARMUP', 'true').lower() == 'true'
+WARMUP_STEPS = int(os.getenv('WARMUP_STEPS', '2'))
+EXAMPLES_DIR = os.getenv('EXAMPLES_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'examples'))
+
+# Per-job timing reports are appended here as JSON lines (empty string disables).
+# Past METRICS_MAX_BYTES the file is rotated to <path>.1, replacing the previous one
+METRICS_PATH = os.getenv('METRICS_PATH', '/tmp/infinitetalk_metrics.jsonl')
+METRICS_MAX_BYTES = int(os.getenv('METRICS_MAX_BYTES', str(10 * 1024 ** 2)))
+
+# Upper bound on the items of one batch job
+MAX_BATCH_ITEMS = int(os.getenv('MAX_BATCH_ITEMS', '64'))
+
+# Jobs a worker accepts at once per ComfyUI instance. Only one of them renders on
+# an instance at a time; the others fetch inputs and probe audio (or upload
+# results) around it.
+MAX_CONCURRENCY = int(os.getenv('MAX_CONCURRENCY', '2'))
+
+# Minimum seconds between progress updates sent to RunPod
+PROGRESS_UPDATE_INTERVAL = float(os.getenv('PROGRESS_UPDATE_INTERVAL', '2'))
+
+# Workflow templates live next to this file (/ inside the container)
+WORKFLOW_DIR = os.getenv('WORKFLOW_DIR', os.path.dirname(os.path.abspath(__file__)))
+
+# Silence-aware frame budgeting
+SILENCE_AWARE_FRAMES = os.getenv('SILENCE_AWARE_FRAMES', 'true').lower() == 'true'
+SILENCE_THRESHOLD_DB = float(os.getenv('SILENCE_THRESHOLD_DB', '-45'))  # absolute floor, dBFS
+SILENCE_RELATIVE_DB = float(os.getenv('SILENCE_RELATIVE_DB', '40'))  # below the loudest 20 ms frame
+SILENCE_PADDING = float(os.getenv('SILENCE_PADDING', '0.15'))  # seconds kept around speech
+VAD_SAMPLE_RATE = 16000
+VAD_FRAME_SECONDS = 0.02
+
+# Segmented rendering of long audio: one prompt per segment, cut at silences
+SEGMENTED_RENDERING = os.getenv('SEGMENTED_RENDERING', 'false').lower() == 'true'
+SEGMENT_SECONDS = float(os.getenv('SEGMENT_SECONDS', '30'))  # target segment length
+SEGMENT_MIN_GAP = float(os.getenv('SEGMENT_MIN_GAP', '0.25'))  # shortest silence to cut in, seconds
+SEGMENT_RETRIES = int(os.getenv('SEGMENT_RETRIES', '1'))  # extra attempts per failed segment
+
+# Shape bucketing: nodes run under WanVideoTorchCompileSettings with dynamic=False,
+# so every new width/height/frame combination can trigger a recompile
+SHAPE_BUCKETING = os.getenv('SHAPE_BUCKETING', 'true').lower() == 'true'
+RESOLUTION_BUCKETS = os.getenv(
+    'RESOLUTION_BUCKETS',
+    '480x480,512x512,640x640,848x480,480x848,640x480,480x640,960x544,544x960,1280x720,720x1280'
+)
+# A job only snaps to a bucket within these relative aspect ratio and area changes;
+# any other size is rounded to multiples of 16 instead
+BUCKET_ASPECT_TOLERANCE = float(os.getenv('BUCKET_ASPECT_TOLERANCE', '0.1'))
+BUCKET_AREA_TOLERANCE = float(os.getenv('BUCKET_AREA_TOLERANCE', '0.25'))
+
+# Shape of jobs that do not set width/height (16:9); the warm-up renders it too
+DEFAULT_WIDTH = 854
+DEFAULT_HEIGHT = 480
+
+# Input download configuration
+DOWNLOAD_TIMEOUT = float(os.getenv('DOWNLOAD_TIMEOUT', '60'))
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_WORKERS = int(os.getenv('DOWNLOAD_WORKERS', '4'))
+MAX_DOWNLOAD_BYTES = int(os.getenv('MAX_DOWNLOAD_BYTES', str(2 * 1024 ** 3)))
+MAX_BASE64_BYTES = int(os.getenv('MAX_BASE64_BYTES', str(MAX_DOWNLOAD_BYTES)))  # decoded size
+BASE64_CHUNK_CHARS = 4 * 1024 * 1024  # multiple of 4: base64 is decoded this many characters at a time
+
+# How the finished video is returned: "url" uploads it to storage, "base64" returns
+# it inline, "path" hardlinks/copies it into OUTPUT_DIR (e.g. a network volume)
+OUTPUT_MODES = ("url", "base64", "path")
+OUTPUT_MODE = os.getenv('OUTPUT_MODE', 'url')
+OUTPUT_DIR = os.getenv('OUTPUT_DIR', '/runpod-volume/outputs')
+OUTPUT_BASE64_CHUNK_BYTES = 3 * 1024 * 1024  # multiple of 3, so the chunks concatenate into valid base64
+# Larger outputs are not returned inline but delivered as OUTPUT_BASE64_OVERFLOW ("url" or "path")
+OUTPUT_BASE64_MAX_BYTES = int(os.getenv('OUTPUT_BASE64_MAX_BYTES', str(20 * 1024 * 1024)))
+OUTPUT_BASE64_OVERFLOW = os.getenv('OUTPUT_BASE64_OVERFLOW', 'url')
+
+# Accepted Content-Type prefixes per input kind. Untyped responses are let through
+# because plenty of object stores serve everything as application/octet-stream.
+ALLOWED_CONTENT_TYPES = {
+    "image": ("image/",),
+    "video": ("video/",),
+    "audio": ("audio/", "video/"),  # m4a/mp4 audio is often labelled video/mp4
+}
+GENERIC_CONTENT_TYPES = ("", "application/octet-stream", "binary/octet-stream")
+
+# Input cache configuration (set INPUT_CACHE_MAX_BYTES=0 to disable)
+INPUT_CACHE_DIR = os.getenv('INPUT_CACHE_DIR', '/tmp/infinitetalk_cache/inputs')
+INPUT_CACHE_MAX_BYTES = int(os.getenv('INPUT_CACHE_MAX_BYTES', str(20 * 1024 ** 3)))
+
+# Result cache: identical jobs return the previously uploaded video (the sampler is
+# deterministic for a given seed). RESULT_CACHE_TTL=0 disables it.
+RESULT_CACHE_PATH = os.getenv('RESULT_CACHE_PATH', '/tmp/infinitetalk_cache/results.sqlite')
+RESULT_CACHE_TTL = float(os.getenv('RESULT_CACHE_TTL', str(7 * 24 * 3600)))
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv('RESULT_CACHE_MAX_ENTRIES', '10000'))
+
+# Embedding caches. WanVideoTextEncodeCached keeps prompt embeddings on disk so the
+# T5 encoder is only loaded for new prompts. Media is hardlinked to content-addressed
+# paths so ComfyUI's node cache can skip LoadImage/LoadAudio and the encoders after them.
+TEXT_EMBED_CACHE = os.getenv('TEXT_EMBED_CACHE', 'true').lower() == 'true'
+TEXT_EMBED_CACHE_DIR = os.getenv('TEXT_EMBED_CACHE_DIR', '/ComfyUI/custom_nodes/ComfyUI-WanVideoWrapper/text_embed_cache')
+TEXT_EMBED_CACHE_MAX_BYTES = int(os.getenv('TEXT_EMBED_CACHE_MAX_BYTES', str(2 * 1024 ** 3)))
+MEDIA_STORE_DIR = os.getenv('MEDIA_STORE_DIR', '/tmp/infinitetalk_cache/media')
+MEDIA_STORE_MAX_BYTES = int(os.getenv('MEDIA_STORE_MAX_BYTES', str(10 * 1024 ** 3)))  # 0 disables
+
+# CPU-side input normalization: images are downscaled to the job's resolution and
+# audio converted to mono PCM at MelBandRoFormer's rate (Wav2Vec resamples after it)
+PREPROCESS_INPUTS = os.getenv('PREPROCESS_INPUTS', 'true').lower() == 'true'
+PREPROCESS_CACHE_DIR = os.getenv('PREPROCESS_CACHE_DIR', '/tmp/infinitetalk_cache/preprocessed')
+PREPROCESS_CACHE_MAX_BYTES = int(os.getenv('PREPROCESS_CACHE_MAX_BYTES', str(5 * 1024 ** 3)))
+AUDIO_SAMPLE_RATE = int(os.getenv('AUDIO_SAMPLE_RATE', '44100'))
+
+# V2V: VHS_LoadVideo only decodes the source frames the audio needs, resampled to
+# the model's frame rate. Much longer sources are also cut with a stream copy first.
+VIDEO_PRETRIM = os.getenv('VIDEO_PRETRIM', 'true').lower() == 'true'
+VIDEO_STREAM_COPY_TRIM = os.getenv('VIDEO_STREAM_COPY_TRIM', 'true').lower() == 'true'
+VIDEO_FPS = 25
+
+# Pick WanVideoBlockSwap depth and VAE tiling per job from its shape and the GPU's
+# VRAM (see planner.py); disabled, the workflow defaults are used. Off until the
+# cost model has been measured on real cards.
+MEMORY_PLANNER = os.getenv('MEMORY_PLANNER', 'false').lower() == 'true'
+
+
+class ComfySession:
+    """Long-lived connection to ComfyUI shared by every job in this worker.
+
+    Owns the client_id, a single reused WebSocket and a pooled HTTP session for
+    /prompt, /history and /view. Connections are (re)established lazily, so a
+    dropped socket is replaced on the next call instead of failing the job.
+    """
+
+    def __init__(self, address, port=COMFYUI_PORT, gpu_index=0):
+        self.address = address
+        self.port = port
+        self.gpu_index = gpu_index  # GPU the instance runs on, for the memory planner
+        self.client_id = str(uuid.uuid4())
+        self.base_url = f"http://{address}:{port}"
+        self.ws_url = f"ws://{address}:{port}/ws?clientId={self.client_id}"
+        self.http = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=8)
+        self.http.mount("http://", adapter)
+        self.healthy = False
+        self.stats = {"ws_connects": 0, "ws_reconnects": 0}
+        self._ws = None
+        self._lock = threading.RLock()
+        self._health_thread = None
+        self._stop = threading.Event()
+
+    def get(self, path, **kwargs):
+        kwargs.setdefault("timeout", 30)
+        response = self.http.get(f"{self.base_url}{path}", **kwargs)
+        response.raise_for_status()
+        return response
+
+    def post(self, path, **kwargs):
+        kwargs.setdefault("timeout", 30)
+        response = self.http.post(f"{self.base_url}{path}", **kwargs)
+        response.raise_for_status()
+        return response
+
+    def connect(self, timeout=COMFYUI_CONNECT_TIMEOUT):
+        """Return the open WebSocket, connecting (with retries) if needed"""
+        with self._lock:
+            if self._ws is not None and self._ws.connected:
+                return self._ws
+            deadline = time.monotonic() + timeout
+            delay = 0.1
+            while True:
+                ws = websocket.WebSocket()
+                try:
+                    ws.connect(self.ws_url, timeout=5)
+                    ws.settimeout(None)
+                    break
+                except Exception as e:
+                    if time.monotonic() + delay > deadline:
+                        self.healthy = False
+                        raise Exception(f"Cannot connect to ComfyUI WebSocket at {self.ws_url}: {e}")
+                    time.sleep(delay)
+                    delay = min(delay * 2, 2.0)
+            if self.stats["ws_connects"]:
+                self.stats["ws_reconnects"] += 1
+            self.stats["ws_connects"] += 1
+            self._ws = ws
+            self.healthy = True
+            logger.info(f"WebSocket connected (client_id={self.client_id})")
+            self.start_health_check()
+            return ws
+
+    def wait_ready(self, timeout=COMFYUI_BOOT_TIMEOUT):
+        """Block until ComfyUI accepts the WebSocket and sends its first `status` event"""
+        deadline = time.monotonic() + timeout
+        ws = self.connect(timeout=timeout)
+        try:
+            while True:
+                ws.settimeout(max(1.0, deadline - time.monotonic()))
+                out = ws.recv()
+                if isinstance(out, str) and json.loads(out).get('type') == 'status':
+                    logger.info("✅ ComfyUI is ready")
+                    return
+        except (websocket.WebSocketException, OSError) as e:
+            self.reset()
+            raise Exception(f"ComfyUI did not report ready within {timeout:.0f}s: {e}")
+        finally:
+            if self._ws is not None:
+                ws.settimeout(None)
+
+    def recv(self, timeout=None):
+        """Receive one WebSocket frame.
+
+        Raises TimeoutError if nothing arrived within timeout seconds and
+        ConnectionError if the socket dropped.
+        """
+        ws = self.connect()
+        try:
+            ws.settimeout(timeout)
+            return ws.recv()
+        except websocket.WebSocketTimeoutException:
+            raise TimeoutError("No ComfyUI message within the timeout")
+        except (websocket.WebSocketException, OSError) as e:
+            self.reset()
+            raise ConnectionError(f"ComfyUI WebSocket dropped: {e}")
+
+    def reset(self):
+        """Close the WebSocket so the next call reconnects"""
+        with self._lock:
+            if self._ws is not None:
+                try:
+                    self._ws.close()
+                except Exception:
+                    pass
+            self._ws = None
+
+    def cancel(self, prompt_ids):
+        """Remove prompt_ids from the ComfyUI queue and interrupt whichever of them is running.
+
+        The WebSocket is reset afterwards so the next job starts on a clean
+        connection; late messages of the cancelled prompts are ignored by
+        prompt_id anyway.
+        """
+        prompt_ids = list(prompt_ids)
+        try:
+            running = self.get("/queue").json().get("queue_running", [])
+            for item in running:
+                if item[1] in prompt_ids:
+                    logger.warning(f"Interrupting prompt {item[1]}")
+                    self.post("/interrupt", json={"prompt_id": item[1]})
+            self.post("/queue", json={"delete": prompt_ids})
+        except Exception as e:
+            logger.error(f"❌ Failed to cancel prompts {prompt_ids}: {e}")
+        self.reset()
+
+    def queue_depth(self):
+        """Prompts running or pending in this ComfyUI (from any client)"""
+        queue = self.get("/queue", timeout=5).json()
+        return len(queue.get("queue_running", [])) + len(queue.get("queue_pending", []))
+
+    def check_health(self):
+        try:
+            self.get("/system_stats", timeout=5)
+            self.healthy = True
+        except Exception as e:
+            if self.healthy:
+                logger.warning(f"ComfyUI health check failed: {e}")
+            self.healthy = False
+        return self.healthy
+
+    def start_health_check(self, interval=COMFYUI_HEALTH_INTERVAL):
+        if interval <= 0 or (self._health_thread is not None and self._health_thread.is_alive()):
+            return
+        self._health_thread = threading.Thread(
+            target=self._health_loop, args=(interval,), name="comfy-health", daemon=True
+        )
+        self._health_thread.start()
+
+    def _health_loop(self, interval):
+        while not self._stop.wait(interval):
+            if not self.check_health():
+                # Drop the socket so the next job reconnects once ComfyUI is back
+                self.reset()
+
+    def close(self):
+        self._stop.set()
+        self.reset()
+        self.http.close()
+
+
+class ComfyPool:
+    """Routes jobs across several ComfyUI instances, one per GPU.
+
+    acquire() picks the healthy instance with the fewest prompts in its live
+    /queue plus the jobs this worker has already routed to it. An instance
+    that fails a queue probe, a connect or a health check is drained (no new
+    jobs) until its health check passes again.
+    """
+
+    def __init__(self, sessions):
+        self.sessions = sessions
+        self.in_flight = {session: 0 for session in sessions}
+        # Serializes the GPU stage per instance. It also makes sure only one job
+        # at a time reads that instance's WebSocket.
+        self.slots = {session: asyncio.Lock() for session in sessions}
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Reserve the least loaded healthy instance; pair with release()"""
+        candidates = [session for session in self.sessions if session.healthy]
+        if not candidates:
+            candidates = [session for session in self.sessions if session.check_health()]
+        depths = {}
+        for session in candidates:
+            try:
+                depths[session] = session.queue_depth()
+            except Exception as e:
+                logger.warning(f"Draining ComfyUI at {session.base_url}: {e}")
+                session.healthy = False
+        if not depths:
+            raise Exception("No healthy ComfyUI instance")
+        with self._lock:
+            # /queue already includes the prompt of the job holding the instance's slot
+            load = {s: self.in_flight[s] + max(0, depths[s] - min(1, self.in_flight[s])) for s in depths}
+            session = min(depths, key=lambda s: (load[s], self.sessions.index(s)))
+            self.in_flight[session] += 1
+        return session
+
+    def release(self, session):
+        with self._lock:
+            self.in_flight[session] -= 1
+
+    def status(self):
+        return [
+            {"url": session.base_url, "healthy": session.healthy, "in_flight": self.in_flight[session]}
+            for session in self.sessions
+        ]
+
+
+comfy_pool = ComfyPool([
+    ComfySession(server_address, COMFYUI_PORT + i, COMFYUI_GPUS[i] if i < len(COMFYUI_GPUS) else i)
+    for i in range(COMFYUI_INSTANCES)
+])
+comfy = comfy_pool.sessions[0]  # default instance for single-GPU callers
+
+# Shared keep-alive session and worker pool for input downloads
+download_session = requests.Session()
+download_session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=DOWNLOAD_WORKERS))
+download_session.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=DOWNLOAD_WORKERS))
+download_pool = ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS, thread_name_prefix="input-fetch")
+
+class FileChunk:
+    """Read-only file-like view of [offset, offset + length) of a file.
+
+    Lets requests stream a slice of the output without loading it into memory.
+    """
+
+    def __init__(self, file_path, offset, length):
+        self._file = open(file_path, 'rb')
+        self._file.seek(offset)
+        self._remaining = length
+        self.len = length  # requests uses this for Content-Length
+
+    def read(self, size=-1):
+        if self._remaining <= 0:
+            return b""
+        if size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._file.read(min(size, DOWNLOAD_CHUNK_SIZE))
+        self._remaining -= len(data)
+        return data
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TusUploader:
+    """Resumable (TUS 1.0.0) upload client.
+
+    Chunks are PATCHed from the file handle, so memory use is bounded by the
+    chunk size whatever the file size. A failed chunk is retried after asking
+    the server (HEAD) how much it already has. If the server advertises the
+    concatenation extension, the file is split into parts that upload in
+    parallel and are then joined with a final Upload-Concat request.
+    """
+
+    def __init__(self, endpoint, headers, session=None, chunk_size=UPLOAD_CHUNK_SIZE,
+                 parallel_parts=UPLOAD_PARALLEL_PARTS, retries=UPLOAD_RETRIES):
+        self.endpoint = endpoint
+        self.headers = dict(headers, **{"Tus-Resumable": "1.0.0"})
+        self.session = session or requests.Session()
+        self.chunk_size = chunk_size
+        self.parallel_parts = parallel_parts
+        self.retries = retries
+
+    @staticmethod
+    def encode_metadata(metadata):
+        return ",".join(
+            f"{k} {base64.b64encode(str(v).encode('utf-8')).decode('ascii')}" for k, v in metadata.items()
+        )
+
+    def supports_concatenation(self):
+        try:
+            response = self.session.options(self.endpoint, headers=self.headers, timeout=10)
+            return "concatenation" in response.headers.get("Tus-Extension", "")
+        except requests.RequestException:
+            return False
+
+    def create(self, length, metadata=None, concat=None):
+        headers = dict(self.headers)
+        if concat != "final":
+            headers["Upload-Length"] = str(length)
+        if metadata:
+            headers["Upload-Metadata"] = self.encode_metadata(metadata)
+        if concat:
+            headers["Upload-Concat"] = concat
+        response = self.session.post(self.endpoint, headers=headers, timeout=30)
+        if response.status_code not in (200, 201):
+            raise Exception(f"Resumable upload creation failed: {response.status_code} - {response.text}")
+        return requests.compat.urljoin(self.endpoint, response.headers["Location"])
+
+    def server_offset(self, location):
+        response = self.session.head(location, headers=self.headers, timeout=10)
+        response.raise_for_status()
+        return int(response.headers["Upload-Offset"])
+
+    def send(self, location, file_path, start, length):
+        """PATCH file_path[start:start + length] to location, chunk by chunk"""
+        offset = 0
+        attempt = 0
+        while offset < length:
+            size = min(self.chunk_size, length - offset)
+            headers = dict(self.headers, **{
+                "Upload-Offset": str(offset),
+                "Content-Type": "application/offset+octet-stream",
+            })
+            try:
+                with FileChunk(file_path, start + offset, size) as body:
+                    response = self.session.patch(location, headers=headers, data=body, timeout=120)
+                if response.status_code != 204:
+                    raise Exception(f"{response.status_code} - {response.text}")
+                offset = int(response.headers.get("Upload-Offset", offset + size))
+                attempt = 0
+            except Exception as e:
+                attempt += 1
+                if attempt > self.retries:
+                    raise Exception(f"Resumable upload chunk at offset {offset} failed: {e}")
+                logger.warning(f"Upload chunk at offset {offset} failed ({e}), retry {attempt}/{self.retries}")
+                time.sleep(min(2 ** attempt, 10))
+                try:
+                    offset = self.server_offset(location)
+                except Exception:
+                    pass
+
+    def upload(self, file_path, metadata):
+        length = os.path.getsize(file_path)
+        n_chunks = max(1, -(-length // self.chunk_size))
+        n_parts = min(self.parallel_parts, n_chunks)
+        if n_parts > 1 and self.supports_concatenation():
+            # Split on chunk boundaries so every part but the last is a whole number of chunks
+            part_chunks = -(-n_chunks // n_parts)
+            ranges = []
+            for start_chunk in range(0, n_chunks, part_chunks):
+                start = start_chunk * self.chunk_size
+                ranges.append((start, min(part_chunks * self.chunk_size, length - start)))
+
+            def send_part(part_range):
+                location = self.create(part_range[1], concat="partial")
+                self.send(location, file_path, *part_range)
+                return location
+
+            with ThreadPoolExecutor(max_workers=len(ranges)) as pool:
+                locations = list(pool.map(send_part, ranges))
+            self.create(length, metadata, concat="final;" + " ".join(locations))
+        else:
+            location = self.create(length, metadata)
+            self.send(location, file_path, 0, length)
+
+
+class StorageBackend:
+    """Where rendered videos go. Subclasses implement upload() and return a URL."""
+
+    def upload(self, file_path, filename, content_type="video/mp4"):
+        raise NotImplementedError
+
+
+class SupabaseStorage(StorageBackend):
+    """Supabase Storage: streamed single request for small files, TUS for large ones"""
+
+    def __init__(self, url=None, key=None, bucket=None, prefix="animations"):
+        self.url = url or SUPABASE_URL
+        self.key = key or SUPABASE_SERVICE_ROLE_KEY
+        self.bucket = bucket or SUPABASE_BUCKET_NAME
+        self.prefix = prefix
+        self.session = requests.Session()
+
+    def public_url(self, storage_path):
+        return f"{self.url}/storage/v1/object/public/{self.bucket}/{storage_path}"
+
+    def upload(self, file_path, filename, content_type="video/mp4"):
+        storage_path = f"{self.prefix}/{filename}"
         headers = {
-            'Authorization': f'Bearer {SUPABASE_SERVICE_ROLE_KEY}',
-            'Content-Type': 'video/mp4',
+            'Authorization': f'Bearer {self.key}',
             'x-upsert': 'true'  # Overwrite if exists
         }
-        
-        response = requests.post(upload_url, headers=headers, data=file_data)
-        
-        if response.status_code in [200, 201]:
-            # Construct public URL
-            public_url = f"{SUPABASE_URL}/storage/v1/object/public/{SUPABASE_BUCKET_NAME}/{storage_path}"
-            logger.info(f"✅ Successfully uploaded to Supabase: {public_url}")
-            return public_url
+        if os.path.getsize(file_path) >= RESUMABLE_UPLOAD_THRESHOLD:
+            uploader = TusUploader(f"{self.url}/storage/v1/upload/resumable", headers, self.session)
+            uploader.upload(file_path, {
+                "bucketName": self.bucket,
+                "objectName": storage_path,
+                "contentType": content_type,
+            })
         else:
-            logger.error(f"❌ Supabase upload failed: {response.status_code} - {response.text}")
-            raise Exception(f"Supabase upload failed: {response.text}")
-            
+            upload_url = f"{self.url}/storage/v1/object/{self.bucket}/{storage_path}"
+            # Passing the file object makes requests stream it instead of buffering
+            with open(file_path, 'rb') as f:
+                response = self.session.post(upload_url, headers=dict(headers, **{'Content-Type': content_type}), data=f)
+            if response.status_code not in [200, 201]:
+                raise Exception(f"Supabase upload failed: {response.status_code} - {response.text}")
+        return self.public_url(storage_path)
+
+
+STORAGE_BACKENDS = {
+    "supabase": SupabaseStorage,
+}
+
+storage_backend = STORAGE_BACKENDS[STORAGE_BACKEND]()
+
+upload_pool = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix="upload")
+
+def upload_to_supabase(file_path, filename):
+    """Upload file to the configured storage backend and return its public URL"""
+    try:
+        public_url = storage_backend.upload(file_path, filename)
+        logger.info(f"✅ Successfully uploaded to storage: {public_url}")
+        return public_url
     except Exception as e:
-        logger.error(f"❌ Error uploading to Supabase: {e}")
+        logger.error(f"❌ Error uploading to storage: {e}")
         raise
 
-def download_file_from_url(url, output_path):
-    """Function to download file from URL"""
+def check_content_type(content_type, kind):
+    """Raise if a response Content-Type cannot be the expected input kind"""
+    if kind is None:
+        return
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    if content_type in GENERIC_CONTENT_TYPES:
+        return
+    if not content_type.startswith(ALLOWED_CONTENT_TYPES[kind]):
+        raise Exception(f"Unexpected Content-Type '{content_type}' for {kind} input")
+
+def fetch_url(url, output_path, kind=None, max_bytes=MAX_DOWNLOAD_BYTES, headers=None):
+    """Stream url to output_path; returns the response headers, or None on 304 Not Modified"""
+    part_path = f"{output_path}.{uuid.uuid4().hex[:8]}.part"
     try:
-        # Download file using wget
-        result = subprocess.run([
-            'wget', '-O', output_path, '--no-verbose', '--timeout=30', url
-        ], capture_output=True, text=True, timeout=60)
-        
-        if result.returncode == 0:
-            logger.info(f"✅ Successfully downloaded file from URL: {url} -> {output_path}")
-            return output_path
-        else:
-            logger.error(f"❌ wget download failed: {result.stderr}")
-            raise Exception(f"URL download failed: {result.stderr}")
-    except subprocess.TimeoutExpired:
+        with download_session.get(url, stream=True, headers=headers, timeout=(10, DOWNLOAD_TIMEOUT)) as response:
+            if response.status_code == 304:
+                return None
+            response.raise_for_status()
+            check_content_type(response.headers.get("Content-Type"), kind)
+            content_length = int(response.headers.get("Content-Length") or 0)
+            if content_length > max_bytes:
+                raise Exception(f"File too large: {content_length} bytes (limit {max_bytes})")
+
+            size = 0
+            with open(part_path, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise Exception(f"File too large: more than {max_bytes} bytes")
+                    f.write(chunk)
+        os.replace(part_path, output_path)
+        logger.info(f"✅ Successfully downloaded file from URL: {url} -> {output_path} ({size} bytes)")
+        return response.headers
+    finally:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+
+def download_file_from_url(url, output_path, kind=None, max_bytes=MAX_DOWNLOAD_BYTES):
+    """Function to download file from URL, streaming it to disk in chunks"""
+    try:
+        fetch_url(url, output_path, kind, max_bytes)
+        return output_path
+    except requests.Timeout:
         logger.error("❌ Download timeout")
         raise Exception("Download timeout")
     except Exception as e:
         logger.error(f"❌ Error occurred during download: {e}")
         raise Exception(f"Error occurred during download: {e}")
 
-def save_base64_to_file(base64_data, temp_dir, output_filename):
-    """Function to save Base64 data to file"""
+def base64_payload_start(base64_data):
+    """Offset of the Base64 payload, skipping a data: URI header if there is one"""
+    if base64_data.startswith("data:"):
+        comma = base64_data.find(",", 0, 256)
+        if comma == -1 or not base64_data[:comma].endswith(";base64"):
+            raise ValueError("data: URI is not Base64 encoded")
+        return comma + 1
+    return 0
+
+def save_base64_to_file(base64_data, temp_dir, output_filename, max_bytes=MAX_BASE64_BYTES):
+    """Function to save Base64 data to file.
+
+    The payload is decoded BASE64_CHUNK_CHARS at a time straight into the file,
+    so a large video never exists twice in memory. The decoded size is checked
+    against max_bytes before anything is written and every chunk is validated
+    as it is decoded. Whitespace and a data: URI header are accepted.
+    """
+    file_path = os.path.abspath(os.path.join(temp_dir, output_filename))
+    part_path = f"{file_path}.{uuid.uuid4().hex[:8]}.part"
     try:
-        # Decode Base64 string
-        decoded_data = base64.b64decode(base64_data)
-        
+        start = base64_payload_start(base64_data)
+        size_estimate = (len(base64_data) - start) // 4 * 3
+        if size_estimate > max_bytes:
+            raise Exception(f"Base64 input too large: about {size_estimate} bytes (limit {max_bytes})")
+
         # Create directory if it doesn't exist
         os.makedirs(temp_dir, exist_ok=True)
-        
-        # Save to file
-        file_path = os.path.abspath(os.path.join(temp_dir, output_filename))
-        with open(file_path, 'wb') as f:
-            f.write(decoded_data)
-        
-        logger.info(f"✅ Saved Base64 input to file: '{file_path}'")
+
+        size = 0
+        pending = ""
+        with open(part_path, 'wb') as f:
+            for offset in range(start, len(base64_data), BASE64_CHUNK_CHARS):
+                # Line breaks would shift the 4-character groups; carry the remainder over
+                chunk = pending + "".join(base64_data[offset:offset + BASE64_CHUNK_CHARS].split())
+                usable = len(chunk) - len(chunk) % 4
+                pending = chunk[usable:]
+                decoded = base64.b64decode(chunk[:usable], validate=True)
+                size += len(decoded)
+                f.write(decoded)
+        if pending:
+            raise binascii.Error("Incorrect padding")
+        if size == 0:
+            raise ValueError("empty payload")
+        os.replace(part_path, file_path)
+
+        logger.info(f"✅ Saved Base64 input to file: '{file_path}' ({size} bytes)")
         return file_path
     except (binascii.Error, ValueError) as e:
         logger.error(f"❌ Base64 decoding failed: {e}")
         raise Exception(f"Base64 decoding failed: {e}")
+    finally:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+
+def link_or_copy(src, dst):
+    """Hardlink src to dst, copying when the two paths are on different filesystems"""
+    if os.path.lexists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+    return dst
+
+
+class InputCache:
+    """On-disk cache of job inputs with an LRU byte budget.
+
+    URL entries are keyed by the URL and revalidated with ETag/Last-Modified;
+    base64 entries are keyed by the SHA-256 of the payload. Hits are hardlinked
+    into the job directory. Each entry is guarded by an flock so concurrent
+    handler invocations (threads or processes) never see a half-written file.
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        self._stats_lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def _paths(self, key):
+        base = os.path.join(self.cache_dir, key)
+        return f"{base}.bin", f"{base}.json", f"{base}.lock"
+
+    def _lock(self, key, blocking=True):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        lock_file = open(self._paths(key)[2], 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return None
+        return lock_file
+
+    def record(self, hit, job_stats=None):
+        field = "hits" if hit else "misses"
+        with self._stats_lock:
+            self.stats[field] += 1
+            if job_stats is not None:
+                job_stats[field] = job_stats.get(field, 0) + 1
+
+    def fetch_url(self, url, dest_path, kind=None, job_stats=None):
+        """Download url into dest_path through the cache"""
+        key = "url-" + hashlib.sha256(url.encode('utf-8')).hexdigest()
+        data_path, meta_path, _ = self._paths(key)
+        lock_file = self._lock(key)
+        try:
+            meta = None
+            if os.path.exists(data_path) and os.path.exists(meta_path):
+                with open(meta_path, 'r') as f:
+                    meta = json.load(f)
+
+            headers = {}
+            if meta and meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta and meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+            response_headers = fetch_url(url, data_path, kind, headers=headers or None)
+
+            hit = response_headers is None
+            if hit:
+                logger.info(f"♻️ Input cache hit (not modified): {url}")
+                os.utime(data_path)
+            else:
+                meta = {
+                    "url": url,
+                    "etag": response_headers.get("ETag"),
+                    "last_modified": response_headers.get("Last-Modified"),
+                }
+                with open(meta_path, 'w') as f:
+                    json.dump(meta, f)
+            link_or_copy(data_path, dest_path)
+        finally:
+            lock_file.close()
 
-def process_input(input_data, temp_dir, output_filename, input_type):
+        self.record(hit, job_stats)
+        if not hit:
+            self.evict()
+        return dest_path
+
+    def store_base64(self, base64_data, dest_path, job_stats=None):
+        """Decode base64_data into dest_path through the cache"""
+        digest = hashlib.sha256()
+        for offset in range(0, len(base64_data), BASE64_CHUNK_CHARS):
+            digest.update(base64_data[offset:offset + BASE64_CHUNK_CHARS].encode('utf-8'))
+        key = "b64-" + digest.hexdigest()
+        data_path, _, _ = self._paths(key)
+        lock_file = self._lock(key)
+        try:
+            hit = os.path.exists(data_path)
+            if hit:
+                logger.info(f"♻️ Input cache hit (base64 {key[4:16]})")
+                os.utime(data_path)
+            else:
+                tmp_name = f"{key}.{uuid.uuid4().hex[:8]}.part"
+                tmp_path = save_base64_to_file(base64_data, self.cache_dir, tmp_name)
+                os.replace(tmp_path, data_path)
+            link_or_copy(data_path, dest_path)
+        finally:
+            lock_file.close()
+
+        self.record(hit, job_stats)
+        if not hit:
+            self.evict()
+        return dest_path
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits its byte budget"""
+        entries = []
+        total = 0
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".bin"):
+                st = entry.stat()
+                entries.append((st.st_mtime, st.st_size, entry.name[:-4]))
+                total += st.st_size
+        if total <= self.max_bytes:
+            return
+
+        entries.sort()
+        for _, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            # Skip entries another invocation is reading or writing right now
+            lock_file = self._lock(key, blocking=False)
+            if lock_file is None:
+                continue
+            try:
+                # Data is always swapped in with os.replace, so dropping the lock
+                # file here can at worst cause a redundant re-download
+                for path in self._paths(key):
+                    if os.path.exists(path):
+                        os.remove(path)
+                total -= size
+                with self._stats_lock:
+                    self.stats["evictions"] += 1
+                logger.info(f"🧹 Evicted input cache entry {key} ({size} bytes)")
+            finally:
+                lock_file.close()
+
+
+input_cache = InputCache(INPUT_CACHE_DIR, INPUT_CACHE_MAX_BYTES)
+
+_file_digests = {}
+_file_digests_lock = threading.Lock()
+
+def file_identity(path):
+    """(device, inode, size, mtime) of a file; hardlinks of one file share it"""
+    st = os.stat(path)
+    return st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns
+
+def remember_sha256(path, digest):
+    """Record digest as the SHA-256 of the file at path, so file_sha256() does not read it"""
+    key = file_identity(path)
+    with _file_digests_lock:
+        if len(_file_digests) > 1024:
+            _file_digests.clear()
+        _file_digests[key] = digest
+    return digest
+
+def file_sha256(path):
+    """SHA-256 of a file's content, memoized on its file_identity()"""
+    key = file_identity(path)
+    with _file_digests_lock:
+        if key in _file_digests:
+            return _file_digests[key]
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return remember_sha256(path, digest.hexdigest())
+
+
+class ResultCache:
+    """Persistent fingerprint -> job result index with TTL and size eviction.
+
+    Backed by SQLite so concurrent handler invocations can share it.
+    """
+
+    def __init__(self, path, ttl, max_entries):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stats = {"lookups": 0, "hits": 0}
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and self.max_entries > 0
+
+    def _connect(self):
+        if not self._initialized:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10)
+        if not self._initialized:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "fingerprint TEXT PRIMARY KEY, result TEXT NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._initialized = True
+        return conn
+
+    def lookup(self, fingerprint):
+        """Return the cached result for fingerprint, or None"""
+        result = None
+        try:
+            conn = self._connect()
+            with conn:
+                row = conn.execute(
+                    "SELECT result FROM results WHERE fingerprint = ? AND created > ?",
+                    (fingerprint, time.time() - self.ttl),
+                ).fetchone()
+                if row:
+                    conn.execute("UPDATE results SET last_used = ? WHERE fingerprint = ?", (time.time(), fingerprint))
+                    result = json.loads(row[0])
+            conn.close()
+        except sqlite3.Error as e:
+            logger.warning(f"Result cache lookup failed: {e}")
+        with self._lock:
+            self.stats["lookups"] += 1
+            self.stats["hits"] += result is not None
+        return result
+
+    def store(self, fingerprint, result):
+        try:
+            conn = self._connect()
+            now = time.time()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO results (fingerprint, result, created, last_used) VALUES (?, ?, ?, ?)",
+                    (fingerprint, json.dumps(result), now, now),
+                )
+                conn.execute("DELETE FROM results WHERE created <= ?", (now - self.ttl,))
+                conn.execute(
+                    "DELETE FROM results WHERE fingerprint IN ("
+                    "SELECT fingerprint FROM results ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+            conn.close()
+        except sqlite3.Error as e:
+            logger.warning(f"Result cache store failed: {e}")
+
+    def report(self, hit):
+        with self._lock:
+            lookups, hits = self.stats["lookups"], self.stats["hits"]
+        return {"hit": hit, "hits": hits, "lookups": lookups, "hit_rate": round(hits / lookups, 3) if lookups else 0.0}
+
+
+result_cache = ResultCache(RESULT_CACHE_PATH, RESULT_CACHE_TTL, RESULT_CACHE_MAX_ENTRIES)
+
+
+class DiskLRU:
+    """A directory of cache files kept under a byte budget, least recently used first.
+
+    Recency is the later of atime and mtime; files the handler reuses are
+    touched explicitly since atime is usually only updated once a day.
+    Pinned files (see pin()) are never pruned.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._pins = {}  # path -> number of holders
+        self._lock = threading.Lock()
+
+    def pin(self, path):
+        """Keep path out of prune() until every pin() is matched by an unpin()"""
+        with self._lock:
+            self._pins[path] = self._pins.get(path, 0) + 1
+
+    def unpin(self, path):
+        with self._lock:
+            if self._pins.get(path, 0) > 1:
+                self._pins[path] -= 1
+            else:
+                self._pins.pop(path, None)
+
+    def entries(self):
+        """Return [(last_used, size, path)] for every file in the directory"""
+        try:
+            scan = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return []
+        entries = []
+        for entry in scan:
+            if entry.is_file() and not entry.name.endswith(".part"):
+                st = entry.stat()
+                entries.append((max(st.st_atime, st.st_mtime), st.st_size, entry.path))
+        return entries
+
+    def names(self):
+        return {os.path.basename(path) for _, _, path in self.entries()}
+
+    def prune(self):
+        """Delete least recently used files until the directory fits its budget"""
+        with self._lock:
+            entries = sorted(self.entries())
+            total = sum(size for _, size, _ in entries)
+            removed = 0
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                if path in self._pins:
+                    continue
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                removed += 1
+            if removed:
+                logger.info(f"🧹 Pruned {removed} file(s) from {self.directory}")
+            return removed
+
+
+class MediaStore(DiskLRU):
+    """Content-addressed copies of job media.
+
+    ComfyUI keys its node cache on input values, so the same avatar arriving
+    under a different temp path would re-run LoadImage, the resize and CLIP
+    vision. Handing ComfyUI <sha256><ext> paths makes repeats cache hits.
+    """
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def put(self, path, workspace=None):
+        """Return the content-addressed path for the file at path.
+
+        The file is pinned while put() runs and, given a workspace, until the
+        workspace is removed: a job prepared ahead of its render (async
+        prefetch, batch items) must still find it when ComfyUI loads it.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        digest = file_sha256(path)
+        stable_path = os.path.join(self.directory, digest + os.path.splitext(path)[1].lower())
+        self.pin(stable_path)
+        try:
+            if os.path.exists(stable_path):
+                os.utime(stable_path)
+            else:
+                tmp_path = f"{stable_path}.{uuid.uuid4().hex[:8]}.part"
+                link_or_copy(path, tmp_path)
+                os.replace(tmp_path, stable_path)
+                self.prune()
+        except Exception:
+            self.unpin(stable_path)
+            raise
+        # The name is the digest; the job fingerprint must not read the file again
+        remember_sha256(stable_path, digest)
+        if workspace is None:
+            self.unpin(stable_path)
+        else:
+            workspace.on_cleanup(self.unpin, stable_path)
+        return stable_path
+
+
+text_embed_cache = DiskLRU(TEXT_EMBED_CACHE_DIR, TEXT_EMBED_CACHE_MAX_BYTES)
+media_store = MediaStore(MEDIA_STORE_DIR, MEDIA_STORE_MAX_BYTES)
+preprocess_cache = DiskLRU(PREPROCESS_CACHE_DIR, PREPROCESS_CACHE_MAX_BYTES)
+
+# Nodes whose work an embedding cache hit saves, reported per job
+ENCODER_CLASS_TYPES = (
+    "LoadImage", "ImageResizeKJv2", "WanVideoClipVisionEncode", "WanVideoTextEncodeCached",
+    "LoadAudio", "MelBandRoFormerSampler", "MultiTalkWav2VecEmbeds", "VHS_LoadVideo", "WanVideoEncode",
+)
+
+def process_input(input_data, temp_dir, output_filename, input_type, kind=None, cache_stats=None):
     """Function to process input data and return file path"""
     if input_type == "path":
         # Return path as-is if it's a path
@@ -110,99 +1093,816 @@ def process_input(input_data, temp_dir, output_filename, input_type):
         logger.info(f"🌐 Processing URL input: {input_data}")
         os.makedirs(temp_dir, exist_ok=True)
         file_path = os.path.abspath(os.path.join(temp_dir, output_filename))
-        return download_file_from_url(input_data, file_path)
+        if input_cache.enabled:
+            try:
+                return input_cache.fetch_url(input_data, file_path, kind, cache_stats)
+            except Exception as e:
+                logger.error(f"❌ Error occurred during download: {e}")
+                raise Exception(f"Error occurred during download: {e}")
+        return download_file_from_url(input_data, file_path, kind)
     elif input_type == "base64":
         # Decode and save if it's Base64
         logger.info(f"🔢 Processing Base64 input")
+        if input_cache.enabled:
+            os.makedirs(temp_dir, exist_ok=True)
+            file_path = os.path.abspath(os.path.join(temp_dir, output_filename))
+            return input_cache.store_base64(input_data, file_path, cache_stats)
         return save_base64_to_file(input_data, temp_dir, output_filename)
     else:
         raise Exception(f"Unsupported input type: {input_type}")
 
-def queue_prompt(prompt, input_type="image", person_count="single"):
-    url = f"http://{server_address}:8188/prompt"
-    p = {"prompt": prompt, "client_id": client_id}
-    data = json.dumps(p).encode('utf-8')
-    
-    req = urllib.request.Request(url, data=data)
-    req.add_header('Content-Type', 'application/json')
-    
+def select_input(job_input, prefix, suffix=""):
+    """Return (data, input_type) for the first of <prefix>_path/_url/_base64<suffix> in the job"""
+    for input_type in ("path", "url", "base64"):
+        key = f"{prefix}_{input_type}{suffix}"
+        if key in job_input:
+            return job_input[key], input_type
+    return None, None
+
+def process_inputs(inputs, workspace):
+    """Process several inputs concurrently into workspace.
+
+    inputs maps a name to (input_data, output_filename, input_type, kind). Returns
+    the same names mapped to file paths, plus the input cache hit/miss counts
+    for this call. Wall-clock time is that of the slowest input rather than the
+    sum of all of them.
+    """
+    cache_stats = {"hits": 0, "misses": 0}
+    futures = {
+        name: download_pool.submit(process_input, data, workspace.dir_for(kind), filename, input_type, kind, cache_stats)
+        for name, (data, filename, input_type, kind) in inputs.items()
+    }
+    return {name: future.result() for name, future in futures.items()}, cache_stats
+
+def queue_prompt(prompt, input_type="image", person_count="single", session=None):
+    session = session or comfy
+    p = {"prompt": prompt, "client_id": session.client_id}
     try:
-        response = urllib.request.urlopen(req)
-        result = json.loads(response.read())
+        response = session.post("/prompt", json=p)
+        result = response.json()
         logger.info(f"Prompt sent successfully: {result}")
         return result
-    except urllib.error.HTTPError as e:
-        logger.error(f"HTTP error occurred: {e.code} - {e.reason}")
-        logger.error(f"Response content: {e.read().decode('utf-8')}")
+    except requests.HTTPError as e:
+        logger.error(f"HTTP error occurred: {e.response.status_code} - {e.response.reason}")
+        logger.error(f"Response content: {e.response.text}")
         raise
     except Exception as e:
         logger.error(f"Error while sending prompt: {e}")
         raise
 
-def get_image(filename, subfolder, folder_type):
-    url = f"http://{server_address}:8188/view"
-    logger.info(f"Getting image from: {url}")
+def get_image(filename, subfolder, folder_type, session=None):
+    session = session or comfy
+    logger.info(f"Getting image from: {session.base_url}/view")
     data = {"filename": filename, "subfolder": subfolder, "type": folder_type}
-    url_values = urllib.parse.urlencode(data)
-    with urllib.request.urlopen(f"{url}?{url_values}") as response:
-        return response.read()
-
-def get_history(prompt_id):
-    url = f"http://{server_address}:8188/history/{prompt_id}"
-    logger.info(f"Getting history from: {url}")
-    with urllib.request.urlopen(url) as response:
-        return json.loads(response.read())
-
-def get_videos(ws, prompt, input_type="image", person_count="single"):
-    prompt_id = queue_prompt(prompt, input_type, person_count)['prompt_id']
-    output_videos = {}
-    while True:
-        out = ws.recv()
-        if isinstance(out, str):
-            message = json.loads(out)
-            if message['type'] == 'executing':
-                data = message['data']
-                if data['node'] is None and data['prompt_id'] == prompt_id:
-                    break
-        else:
-            continue
+    return session.get("/view", params=data).content
+
+def get_history(prompt_id, session=None):
+    session = session or comfy
+    logger.info(f"Getting history from: {session.base_url}/history/{prompt_id}")
+    return session.get(f"/history/{prompt_id}").json()
+
+def encode_file_base64(file_path, chunk_bytes=OUTPUT_BASE64_CHUNK_BYTES):
+    """Base64 of a file as one string, read and encoded one chunk at a time.
+
+    chunk_bytes is a multiple of 3, so only the last chunk carries padding and
+    the chunks join into the Base64 of the whole file. The file itself is never
+    held in memory whole; deliver_video() caps what is encoded at all.
+    """
+    with open(file_path, 'rb') as f:
+        return "".join(base64.b64encode(data).decode('ascii') for data in iter(lambda: f.read(chunk_bytes), b''))
+
+def deliver_video(file_path, output_mode="url"):
+    """Hand a finished video over in output_mode; returns the fields for the job output.
 
-    history = get_history(prompt_id)[prompt_id]
-    for node_id in history['outputs']:
-        node_output = history['outputs'][node_id]
-        videos_output = []
-        if 'gifs' in node_output:
-            for video in node_output['gifs']:
-                # Upload to Supabase storage
-                filename = f"output_{uuid.uuid4()}.mp4"
-                video_url = upload_to_supabase(video['fullpath'], filename)
-                videos_output.append(video_url)
-        output_videos[node_id] = videos_output
+    "local" (internal) leaves the file where ComfyUI wrote it.
+    """
+    if not os.path.exists(file_path):
+        raise Exception(f"ComfyUI output {file_path} does not exist")
+    filename = f"output_{uuid.uuid4()}.mp4"
+    if output_mode == "url":
+        return {"video_url": upload_to_supabase(file_path, filename)}
+    if output_mode == "base64":
+        size = os.path.getsize(file_path)
+        if size > OUTPUT_BASE64_MAX_BYTES:
+            overflow = OUTPUT_BASE64_OVERFLOW if OUTPUT_BASE64_OVERFLOW in ("url", "path") else "url"
+            logger.warning(f"⚠️ {file_path} is {size} bytes, over OUTPUT_BASE64_MAX_BYTES; delivering as {overflow}")
+            return deliver_video(file_path, overflow)
+        video_base64 = encode_file_base64(file_path)
+        logger.info(f"✅ Encoded {file_path} as Base64 ({size} bytes)")
+        return {"video_base64": video_base64}
+    if output_mode == "path":
+        os.makedirs(OUTPUT_DIR, exist_ok=True)
+        output_path = link_or_copy(file_path, os.path.join(OUTPUT_DIR, filename))
+        logger.info(f"✅ Saved video to {output_path}")
+        return {"video_path": output_path}
+    if output_mode == "local":
+        return {"video_path": file_path}
+    raise Exception(f"Unsupported output mode: {output_mode}")
 
-    return output_videos
+
+class OutputCollector:
+    """Collects the outputs of one prompt from the ComfyUI WebSocket stream.
+
+    Uploads (or whatever output_mode asks for, see deliver_video()) start as
+    soon as a node reports an `executed` message with video outputs, so they
+    overlap with whatever ComfyUI still has left to run.
+    /history is only consulted if no output was seen on the socket or the
+    socket dropped while the prompt was running.
+    """
+
+    def __init__(self, prompt_id, output_mode="url", session=None):
+        self.prompt_id = prompt_id
+        self.session = session or comfy
+        self.output_mode = output_mode
+        self.done = False
+        self.error = None
+        self.missed_messages = False
+        self._uploads = {}  # node_id -> [Future]
+        self.paths = {}  # node_id -> [local output path]
+        self._seen = set()
+
+    def add_outputs(self, node_id, node_output):
+        for video in node_output.get('gifs', []):
+            if video['fullpath'] in self._seen:
+                continue
+            self._seen.add(video['fullpath'])
+            self.paths.setdefault(node_id, []).append(video['fullpath'])
+            logger.info(f"Node {node_id} produced {video['fullpath']}, delivering as {self.output_mode}")
+            self._uploads.setdefault(node_id, []).append(
+                upload_pool.submit(deliver_video, video['fullpath'], self.output_mode)
+            )
+
+    def on_message(self, message):
+        data = message.get('data') or {}
+        if data.get('prompt_id') != self.prompt_id:
+            return
+        if message['type'] == 'executed':
+            self.add_outputs(data['node'], data.get('output') or {})
+        elif message['type'] == 'execution_error':
+            self.error = f"Node {data.get('node_id')} ({data.get('node_type')}): {data.get('exception_message')}"
+        elif message['type'] == 'executing' and data.get('node') is None:
+            self.done = True
+
+    def on_reconnect(self):
+        """Called after the socket was re-established; returns True if the prompt already finished"""
+        self.missed_messages = True
+        if self.prompt_id in get_history(self.prompt_id, self.session):
+            self.done = True
+        return self.done
+
+    def results(self):
+        """Wait for all uploads and return {node_id: [deliver_video() output, ...]}"""
+        if self.error:
+            raise Exception(f"ComfyUI execution failed: {self.error}")
+        if not self._uploads or self.missed_messages:
+            history = get_history(self.prompt_id, self.session).get(self.prompt_id, {})
+            for node_id, node_output in history.get('outputs', {}).items():
+                self.add_outputs(node_id, node_output)
+        return {node_id: [future.result() for future in futures] for node_id, futures in self._uploads.items()}
+
+
+class ExecutionProfiler:
+    """Builds a per-node timeline for one prompt from the ComfyUI WebSocket stream.
+
+    Wall time is attributed to a node from its `executing` message until the
+    next one. `progress` messages give sampler step rates and
+    `execution_cached` lists the nodes ComfyUI skipped.
+    """
+
+    def __init__(self, prompt, prompt_id=None):
+        self.prompt_id = prompt_id
+        self.class_types = {node_id: node.get("class_type") for node_id, node in prompt.items()}
+        self.node_seconds = {}
+        self.node_started = {}  # node_id -> when it first started executing
+        self.cached = []
+        self.steps = {}  # node_id -> [(timestamp, value, max)]
+        self.started = None
+        self.finished = None
+        self._current = None
+        self._current_start = None
+
+    def _switch(self, node_id, now):
+        if self._current is not None:
+            self.node_seconds[self._current] = self.node_seconds.get(self._current, 0.0) + now - self._current_start
+        self._current, self._current_start = node_id, now
+        self.node_started.setdefault(node_id, now)
+
+    def attach(self, prompt_id):
+        self.prompt_id = prompt_id
+
+    def on_message(self, message):
+        data = message.get('data') or {}
+        if data.get('prompt_id', self.prompt_id) != self.prompt_id:
+            return
+        now = time.perf_counter()
+        if message['type'] == 'execution_start':
+            self.started = now
+        elif message['type'] == 'execution_cached':
+            self.cached.extend(data.get('nodes', []))
+        elif message['type'] == 'executing':
+            if self.started is None:
+                self.started = now
+            self._switch(data.get('node'), now)
+            if data.get('node') is None:
+                self.finished = now
+        elif message['type'] == 'progress':
+            node_id = data.get('node') or self._current
+            self.steps.setdefault(node_id, []).append((now, data.get('value'), data.get('max')))
+
+    def step_rates(self):
+        """Return {node_id: {"steps": n, "steps_per_second": r}} for nodes that reported progress"""
+        rates = {}
+        for node_id, samples in self.steps.items():
+            elapsed = samples[-1][0] - samples[0][0]
+            rates[node_id] = {
+                "steps": len(samples),
+                "steps_per_second": round((len(samples) - 1) / elapsed, 3) if elapsed > 0 else None,
+            }
+        return rates
+
+    def report(self):
+        nodes = [
+            {"node": node_id, "class_type": self.class_types.get(node_id), "seconds": round(seconds, 3)}
+            for node_id, seconds in sorted(self.node_seconds.items(), key=lambda item: -item[1])
+        ]
+        return {
+            "total_seconds": round(self.finished - self.started, 3) if self.started and self.finished else None,
+            "nodes": nodes,
+            "cached": [{"node": node_id, "class_type": self.class_types.get(node_id)} for node_id in self.cached],
+            "progress": self.step_rates(),
+        }
+
+
+class ProgressReporter:
+    """Turns ComfyUI progress into throttled runpod progress_update calls.
+
+    The sampler reports one progress bar per InfiniteTalk window, so a drop in
+    the step value marks the start of the next window. Updates are sent from a
+    single background thread; if the previous one is still in flight, the new
+    one is dropped instead of blocking the WebSocket loop.
+    """
+
+    def __init__(self, job, prompt, windows=1, interval=PROGRESS_UPDATE_INTERVAL, extra=None):
+        self.job = job
+        self.extra = extra or {}
+        self.prompt_id = None
+        self.class_types = {node_id: node.get("class_type") for node_id, node in prompt.items()}
+        self.windows = max(windows, 1)
+        self.interval = interval
+        self.window = 0
+        self.step = 0
+        self.steps_per_window = None
+        self.node = None
+        self._first_step_at = None
+        self._steps_done = 0
+        self._last_sent = 0.0
+        self._pending = None
+        self._sender = ThreadPoolExecutor(max_workers=1, thread_name_prefix="progress")
+
+    @classmethod
+    def for_template(cls, job, prompt, template, max_frame, extra=None):
+        stride = template.frame_window_size - template.motion_frame
+        windows = 1 + max(0, math.ceil((max_frame - template.frame_window_size) / stride))
+        return cls(job, prompt, windows, extra=extra)
+
+    def attach(self, prompt_id):
+        self.prompt_id = prompt_id
+
+    def on_message(self, message):
+        data = message.get('data') or {}
+        if data.get('prompt_id', self.prompt_id) != self.prompt_id:
+            return
+        if message['type'] == 'executing' and data.get('node') is not None:
+            self.node = data['node']
+            self.update()
+        elif message['type'] == 'progress' and self.class_types.get(data.get('node') or self.node) == "WanVideoSampler":
+            value, maximum = data.get('value', 0), data.get('max') or 1
+            if value < self.step:
+                self.window = min(self.window + 1, self.windows - 1)
+            self.step, self.steps_per_window = value, maximum
+            now = time.perf_counter()
+            if self._first_step_at is None:
+                self._first_step_at = now
+            self._steps_done += 1
+            self.update()
+
+    def snapshot(self):
+        progress = dict(self.extra, node=self.node, class_type=self.class_types.get(self.node))
+        if self.steps_per_window:
+            total_steps = self.windows * self.steps_per_window
+            done = self.window * self.steps_per_window + self.step
+            progress.update({
+                "percent": round(100.0 * done / total_steps, 1),
+                "step": self.step,
+                "steps": self.steps_per_window,
+                "window": self.window + 1,
+                "windows": self.windows,
+            })
+            elapsed = time.perf_counter() - self._first_step_at
+            if self._steps_done > 1 and elapsed > 0:
+                rate = (self._steps_done - 1) / elapsed
+                progress["eta_seconds"] = round((total_steps - done) / rate, 1)
+        return progress
+
+    def update(self, force=False):
+        now = time.perf_counter()
+        if not self.job.get("id") or (not force and now - self._last_sent < self.interval):
+            return
+        if self._pending is not None and not self._pending.done():
+            return
+        self._last_sent = now
+        self._pending = self._sender.submit(self._send, self.snapshot())
+
+    def _send(self, progress):
+        try:
+            runpod.serverless.progress_update(self.job, progress)
+        except Exception as e:
+            logger.warning(f"Progress update failed: {e}")
+
+    def close(self):
+        self._sender.shutdown(wait=False)
+
+
+class PhaseTimer:
+    """Accumulates wall time of the handler's own phases"""
+
+    def __init__(self):
+        self.phases = {}
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = round(self.phases.get(name, 0.0) + time.perf_counter() - start, 3)
+
+
+_metrics_lock = threading.Lock()
+
+def write_metrics(record, path=None, max_bytes=None):
+    """Append one JSON line to the local metrics file, rotating it once it reaches max_bytes"""
+    path = METRICS_PATH if path is None else path
+    max_bytes = METRICS_MAX_BYTES if max_bytes is None else max_bytes
+    if not path:
+        return
+    try:
+        with _metrics_lock:
+            if max_bytes and os.path.exists(path) and os.path.getsize(path) >= max_bytes:
+                os.replace(path, f"{path}.1")
+            with open(path, 'a') as f:
+                f.write(json.dumps(record) + "\n")
+    except OSError as e:
+        logger.warning(f"Could not write metrics to {path}: {e}")
+
+def run_prompts(runs, timer=None, output_mode="url", deadline=None, cancelled=None, session=None):
+    """Queue several prompts back to back and follow them until all have finished.
+
+    runs is a list of (prompt, listeners). Each listener is attach()ed to its
+    prompt_id once queued and then receives every decoded WebSocket message
+    through on_message(). Returns one OutputCollector per run (uploads may
+    still be in flight), or the exception raised while queueing that prompt.
+    Outputs are delivered in output_mode (see deliver_video()).
+
+    deadline (a time.monotonic() value) and cancelled (a callable) are checked
+    while waiting. When either fires, the unfinished prompts are cancelled in
+    ComfyUI and their collectors carry the reason as their error. session is
+    the ComfyUI instance to run on (the default one if omitted).
+    """
+    session = session or comfy
+    timer = timer or PhaseTimer()
+    # Make sure the socket is up before queueing so no execution message is missed
+    session.connect()
+    collectors = []
+    active = []
+    with timer.phase("queue"):
+        for prompt, listeners in runs:
+            try:
+                prompt_id = queue_prompt(prompt, session=session)['prompt_id']
+            except Exception as e:
+                collectors.append(e)
+                continue
+            collector = OutputCollector(prompt_id, output_mode, session)
+            for listener in listeners:
+                listener.attach(prompt_id)
+            collectors.append(collector)
+            active.append((collector, [collector, *listeners]))
+
+    with timer.phase("render"):
+        while not all(collector.done for collector, _ in active):
+            reason = None
+            if cancelled is not None and cancelled():
+                reason = "Job cancelled; render interrupted"
+            elif deadline is not None and time.monotonic() > deadline:
+                reason = "Job exceeded its deadline; render interrupted"
+            if reason:
+                pending = [collector for collector, _ in active if not collector.done]
+                logger.error(f"❌ {reason} ({len(pending)} prompt(s))")
+                session.cancel(collector.prompt_id for collector in pending)
+                for collector in pending:
+                    collector.error, collector.done = reason, True
+                break
+            try:
+                out = session.recv(WATCHDOG_INTERVAL if deadline is not None or cancelled is not None else None)
+            except TimeoutError:
+                continue
+            except ConnectionError as e:
+                logger.warning(f"{e}; reconnecting")
+                session.connect()
+                # Messages sent while disconnected are lost, so ask history instead
+                for collector, _ in active:
+                    if not collector.done:
+                        collector.on_reconnect()
+                continue
+            if isinstance(out, str):
+                message = json.loads(out)
+                for _, listeners in active:
+                    for listener in listeners:
+                        listener.on_message(message)
+    return collectors
+
+def run_prompt(prompt, timer=None, listeners=()):
+    """Queue prompt and follow it until ComfyUI has finished executing it.
+
+    Returns the OutputCollector, whose uploads may still be running.
+    """
+    collector = run_prompts([(prompt, listeners)], timer)[0]
+    if isinstance(collector, Exception):
+        raise collector
+    return collector
+
+def get_videos(prompt, input_type="image", person_count="single", timer=None, listeners=()):
+    """Run prompt and return {node_id: [deliver_video() output, ...]}"""
+    timer = timer or PhaseTimer()
+    collector = run_prompt(prompt, timer, listeners)
+    with timer.phase("upload"):
+        return collector.results()
 
 def load_workflow(workflow_path):
     with open(workflow_path, 'r') as file:
         return json.load(file)
 
-def get_workflow_path(input_type, person_count):
-    """Return appropriate workflow file path based on input_type and person_count"""
-    if input_type == "image":
-        if person_count == "single":
-            return "/I2V_single.json"
-        else:  # multi
-            return "/I2V_multi.json"
-    else:  # video
-        if person_count == "single":
-            return "/V2V_single.json"
-        else:  # multi
-            return "/V2V_multi.json"
+# Workflow templates keyed by (input_type, person_count). "bindings" maps each job
+# field to the node inputs it is written to; adding a template or exposing a new
+# parameter only needs an entry here.
+_COMMON_BINDINGS = {
+    "wav": [("125", "audio")],
+    "prompt": [("241", "positive_prompt")],
+    "width": [("245", "value")],
+    "height": [("246", "value")],
+    "max_frame": [("270", "value")],
+    "steps": [("128", "steps")],
+    "seed": [("128", "seed")],
+    "negative_prompt": [("241", "negative_prompt")],
+    "text_embed_cache": [("241", "use_disk_cache")],
+    "blocks_to_swap": [("134", "blocks_to_swap")],
+    "prefetch_blocks": [("134", "prefetch_blocks")],
+    "vae_tiling": [("130", "enable_vae_tiling")],
+    "output_prefix": [("131", "filename_prefix")],
+}
+
+# V2V only: the load rate feeds the audio embeddings and the output frame rate too
+_VIDEO_BINDINGS = {
+    "video_fps": [("228", "force_rate"), ("194", "fps"), ("131", "frame_rate")],
+    "video_frame_cap": [("228", "frame_load_cap")],
+    "vae_tiling": [("130", "enable_vae_tiling"), ("229", "enable_vae_tiling")],
+}
+
+WORKFLOW_TEMPLATES = {
+    ("image", "single"): {
+        "file": "I2V_single.json",
+        "bindings": dict(_COMMON_BINDINGS, media=[("284", "image")]),
+    },
+    ("image", "multi"): {
+        "file": "I2V_multi.json",
+        "bindings": dict(_COMMON_BINDINGS, media=[("284", "image")], wav_2=[("307", "audio")]),
+    },
+    ("video", "single"): {
+        "file": "V2V_single.json",
+        "bindings": dict(_COMMON_BINDINGS, **_VIDEO_BINDINGS, media=[("228", "video")]),
+    },
+    ("video", "multi"): {
+        "file": "V2V_multi.json",
+        "bindings": dict(_COMMON_BINDINGS, **_VIDEO_BINDINGS, media=[("228", "video")], wav_2=[("313", "audio")]),
+    },
+}
+
+
+class WorkflowTemplate:
+    """A parsed workflow plus the job-field -> node input bindings validated against it"""
+
+    def __init__(self, name, workflow, bindings):
+        self.name = name
+        self.workflow = workflow
+        self.bindings = bindings
+        # InfiniteTalk window settings, used to align frame counts to the sampling grid
+        self.frame_window_size, self.motion_frame = 81, 9
+        for node in workflow.values():
+            if node.get("class_type") == "WanVideoImageToVideoMultiTalk":
+                self.frame_window_size = node["inputs"]["frame_window_size"]
+                self.motion_frame = node["inputs"]["motion_frame"]
+
+    @classmethod
+    def load(cls, path, bindings):
+        workflow = load_workflow(path)
+        name = os.path.splitext(os.path.basename(path))[0]
+        for field, targets in bindings.items():
+            for node_id, input_name in targets:
+                if input_name not in workflow.get(node_id, {}).get("inputs", {}):
+                    raise Exception(f"Workflow {name}: binding '{field}' refers to missing input {node_id}.{input_name}")
+        return cls(name, workflow, bindings)
+
+    # Job fields whose values are file paths; fingerprints use their content instead
+    FILE_FIELDS = ("media", "wav", "wav_2")
+    # Job fields that differ on every run without changing the video; fingerprints leave them out
+    RUN_FIELDS = ("output_prefix",)
+
+    def fingerprint(self, prompt):
+        """Canonical hash of template identity, every bound value and input file contents"""
+        prompt = dict(prompt)
+        for field in self.RUN_FIELDS:
+            for node_id, input_name in self.bindings.get(field, []):
+                inputs = {name: value for name, value in prompt[node_id]["inputs"].items() if name != input_name}
+                prompt[node_id] = dict(prompt[node_id], inputs=inputs)
+        for field in self.FILE_FIELDS:
+            for node_id, input_name in self.bindings.get(field, []):
+                path = prompt[node_id]["inputs"][input_name]
+                inputs = dict(prompt[node_id]["inputs"], **{input_name: f"sha256:{file_sha256(path)}"})
+                prompt[node_id] = dict(prompt[node_id], inputs=inputs)
+        canonical = json.dumps({"template": self.name, "prompt": prompt}, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    def instantiate(self, values, base=None):
+        """Return a prompt with values applied to the template, or to a prompt it made.
+
+        Only the bound nodes are copied; every other node is shared with the
+        template (or base) and must not be modified by the caller.
+        """
+        prompt = dict(self.workflow if base is None else base)
+        copied = set()
+        for field, value in values.items():
+            if value is None or field not in self.bindings:
+                continue
+            for node_id, input_name in self.bindings[field]:
+                if node_id not in copied:
+                    prompt[node_id] = dict(prompt[node_id], inputs=dict(prompt[node_id]["inputs"]))
+                    copied.add(node_id)
+                prompt[node_id]["inputs"][input_name] = value
+        return prompt
+
+
+def load_workflow_templates(templates=WORKFLOW_TEMPLATES, workflow_dir=WORKFLOW_DIR):
+    """Parse and validate every template once; raises on a broken binding"""
+    return {
+        key: WorkflowTemplate.load(os.path.join(workflow_dir, spec["file"]), spec["bindings"])
+        for key, spec in templates.items()
+    }
+
+workflow_templates = load_workflow_templates()
+
+def get_workflow_template(input_type, person_count):
+    """Return the precompiled template for input_type and person_count"""
+    key = ("image" if input_type == "image" else "video", "single" if person_count == "single" else "multi")
+    return workflow_templates[key]
+
+def parse_resolution_buckets(spec):
+    """Parse "WxH,WxH,..." into [(w, h), ...]; every side must be divisible by 16"""
+    buckets = []
+    for item in spec.split(","):
+        width, height = (int(v) for v in item.strip().lower().split("x"))
+        if width % 16 or height % 16:
+            raise Exception(f"Resolution bucket {width}x{height} is not divisible by 16")
+        buckets.append((width, height))
+    return buckets
+
+resolution_buckets = parse_resolution_buckets(RESOLUTION_BUCKETS)
+
+def round_to_16(pixels):
+    return max(16, int(pixels / 16 + 0.5) * 16)
+
+def snap_resolution(width, height, buckets=None):
+    """Return the bucket closest to width x height, preferring a matching aspect ratio.
+
+    Buckets whose aspect ratio or area differ by more than a factor of
+    1 + BUCKET_ASPECT_TOLERANCE / 1 + BUCKET_AREA_TOLERANCE are not considered;
+    if none is left, each side is rounded to a multiple of 16 instead.
+    """
+    buckets = buckets or resolution_buckets
+    def errors(bucket):
+        aspect_error = abs(math.log((bucket[0] / bucket[1]) / (width / height)))
+        area_error = abs(math.log((bucket[0] * bucket[1]) / (width * height)))
+        return aspect_error, area_error
+    aspect_limit, area_limit = math.log1p(BUCKET_ASPECT_TOLERANCE), math.log1p(BUCKET_AREA_TOLERANCE)
+    candidates = [bucket for bucket in buckets if errors(bucket)[0] <= aspect_limit and errors(bucket)[1] <= area_limit]
+    if not candidates:
+        return round_to_16(width), round_to_16(height)
+    def distance(bucket):
+        aspect_error, area_error = errors(bucket)
+        return (2 * aspect_error + area_error, -bucket[0] * bucket[1])
+    return min(candidates, key=distance)
+
+def snap_frames(max_frame, frame_window_size=81, motion_frame=9):
+    """Round max_frame up to the window grid: window + k * (window - motion_frame)"""
+    if max_frame <= frame_window_size:
+        return frame_window_size
+    stride = frame_window_size - motion_frame
+    return frame_window_size + math.ceil((max_frame - frame_window_size) / stride) * stride
+
+
+class ShapeBucketStats:
+    """Counts how often a job lands on a shape this worker has already compiled"""
+
+    def __init__(self):
+        self.counts = {}
+        self.jobs = 0
+        self.hits = 0
+        self._lock = threading.Lock()
+
+    def record(self, key):
+        with self._lock:
+            hit = key in self.counts
+            self.counts[key] = self.counts.get(key, 0) + 1
+            self.jobs += 1
+            self.hits += hit
+        return hit
+
+    @property
+    def hit_rate(self):
+        return self.hits / self.jobs if self.jobs else 0.0
+
+
+shape_stats = ShapeBucketStats()
+
+def bucket_shape(template, width, height, max_frame):
+    """Snap a job's shape to the configured buckets and log the choice"""
+    bucket_width, bucket_height = snap_resolution(width, height)
+    bucket_frames = snap_frames(max_frame, template.frame_window_size, template.motion_frame)
+    hit = shape_stats.record((template.name, bucket_width, bucket_height, bucket_frames))
+    rounded = "" if (bucket_width, bucket_height) in resolution_buckets else ", no bucket close enough"
+    logger.info(
+        f"Shape bucket {bucket_width}x{bucket_height}x{bucket_frames} for requested "
+        f"{width}x{height}x{max_frame} ({'hit' if hit else 'new shape'}{rounded}; "
+        f"hit rate {shape_stats.hit_rate:.0%} over {shape_stats.jobs} jobs)"
+    )
+    return bucket_width, bucket_height, bucket_frames
+
+# MPEG audio header tables, indexed by [version][layer] / [version]
+_MP3_BITRATES = {
+    (1, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (1, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (1, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (2, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (2, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (2, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+_MP3_SAMPLE_RATES = {1: (44100, 48000, 32000), 2: (22050, 24000, 16000), 2.5: (11025, 12000, 8000)}
+
+def _wav_duration(f, file_size):
+    f.seek(12)
+    byte_rate = None
+    while True:
+        chunk = f.read(8)
+        if len(chunk) < 8:
+            return None
+        chunk_id, chunk_size = struct.unpack('<4sI', chunk)
+        if chunk_id == b'fmt ':
+            fmt = f.read(chunk_size)
+            byte_rate = struct.unpack('<I', fmt[8:12])[0]
+            if chunk_size % 2:
+                f.read(1)
+        elif chunk_id == b'data':
+            if not byte_rate:
+                return None
+            # Streamed WAVs leave the size at 0 or 0xFFFFFFFF; use the file size then
+            if chunk_size in (0, 0xFFFFFFFF):
+                chunk_size = file_size - f.tell()
+            return min(chunk_size, file_size - f.tell()) / byte_rate
+        else:
+            f.seek(chunk_size + chunk_size % 2, 1)
+
+def _flac_duration(f):
+    f.seek(4)
+    header = f.read(4)
+    if len(header) < 4 or header[0] & 0x7F != 0:  # first block must be STREAMINFO
+        return None
+    info = f.read(34)
+    if len(info) < 34:
+        return None
+    packed = int.from_bytes(info[10:18], 'big')
+    sample_rate = packed >> 44
+    total_samples = packed & 0xFFFFFFFFF
+    if not sample_rate or not total_samples:
+        return None
+    return total_samples / sample_rate
+
+def _mp3_frame_info(header):
+    """Decode a 4-byte MPEG audio frame header; returns None if it is not one"""
+    if len(header) < 4 or header[0] != 0xFF or header[1] & 0xE0 != 0xE0:
+        return None
+    version = {0: 2.5, 2: 2, 3: 1}.get((header[1] >> 3) & 0x3)
+    layer = {1: 3, 2: 2, 3: 1}.get((header[1] >> 1) & 0x3)
+    bitrate_index = header[2] >> 4
+    rate_index = (header[2] >> 2) & 0x3
+    if version is None or layer is None or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    bitrate = _MP3_BITRATES[(1 if version == 1 else 2, layer)][bitrate_index] * 1000
+    sample_rate = _MP3_SAMPLE_RATES[version][rate_index]
+    padding = (header[2] >> 1) & 0x1
+    if layer == 1:
+        samples, length = 384, (12 * bitrate // sample_rate + padding) * 4
+    else:
+        samples = 576 if layer == 3 and version != 1 else 1152
+        length = samples // 8 * bitrate // sample_rate + padding
+    mono = (header[3] >> 6) == 3
+    return {"version": version, "bitrate": bitrate, "sample_rate": sample_rate,
+            "samples": samples, "length": length, "mono": mono}
+
+def _mp3_duration(f, file_size):
+    f.seek(0)
+    head = f.read(10)
+    start = 0
+    if head[:3] == b'ID3':
+        size = (head[6] << 21) | (head[7] << 14) | (head[8] << 7) | head[9]
+        start = 10 + size + (10 if head[5] & 0x10 else 0)
+
+    # Find the first frame whose successor is also a valid frame header
+    f.seek(start)
+    buf = f.read(64 * 1024)
+    for i in range(len(buf) - 4):
+        info = _mp3_frame_info(buf[i:i + 4])
+        if info is None:
+            continue
+        f.seek(start + i + info["length"])
+        if _mp3_frame_info(f.read(4)) is not None or start + i + info["length"] >= file_size:
+            break
+    else:
+        return None
+    frame = buf[i:i + 200]
+    audio_start = start + i
+
+    # Xing/Info (LAME) or VBRI headers carry the exact frame count
+    if info["version"] == 1:
+        xing_offset = 21 if info["mono"] else 36
+    else:
+        xing_offset = 13 if info["mono"] else 21
+    tag = frame[xing_offset:xing_offset + 4]
+    if tag in (b'Xing', b'Info'):
+        flags = struct.unpack('>I', frame[xing_offset + 4:xing_offset + 8])[0]
+        if flags & 0x1:
+            frames = struct.unpack('>I', frame[xing_offset + 8:xing_offset + 12])[0]
+            return frames * info["samples"] / info["sample_rate"]
+    if frame[36:40] == b'VBRI':
+        frames = struct.unpack('>I', frame[50:54])[0]
+        return frames * info["samples"] / info["sample_rate"]
+
+    # Otherwise assume constant bitrate
+    f.seek(max(file_size - 128, 0))
+    audio_end = file_size - 128 if f.read(3) == b'TAG' else file_size
+    return (audio_end - audio_start) * 8 / info["bitrate"]
+
+def probe_audio_duration(audio_path):
+    """Read the duration of a WAV/FLAC/MP3 file from its container headers.
+
+    Returns None for anything else or a header that cannot be parsed.
+    """
+    file_size = os.path.getsize(audio_path)
+    with open(audio_path, 'rb') as f:
+        magic = f.read(12)
+        if magic[:4] == b'RIFF' and magic[8:12] == b'WAVE':
+            return _wav_duration(f, file_size)
+        if magic[:4] == b'fLaC':
+            return _flac_duration(f)
+        if magic[:3] == b'ID3' or _mp3_frame_info(magic[:4]) is not None:
+            return _mp3_duration(f, file_size)
+    return None
+
+def ffprobe_duration(media_path):
+    """Ask ffprobe for a media file's duration in seconds"""
+    result = subprocess.run([
+        'ffprobe', '-v', 'error', '-show_entries', 'format=duration',
+        '-of', 'default=noprint_wrappers=1:nokey=1', media_path
+    ], capture_output=True, text=True, timeout=30)
+    if result.returncode != 0:
+        raise Exception(result.stderr.strip())
+    return float(result.stdout.strip())
 
 def get_audio_duration(audio_path):
     """Return audio file duration in seconds"""
     try:
-        duration = librosa.get_duration(path=audio_path)
-        return duration
+        duration = probe_audio_duration(audio_path)
+        if duration is not None:
+            return duration
+    except Exception as e:
+        logger.warning(f"Audio header probe failed ({audio_path}): {e}")
+
+    # Fall back to ffprobe, then librosa (imported lazily, it pulls in numba/scipy)
+    try:
+        return ffprobe_duration(audio_path)
+    except Exception as e:
+        logger.warning(f"ffprobe failed ({audio_path}): {e}")
+    try:
+        import librosa
+        return librosa.get_duration(path=audio_path)
     except Exception as e:
         logger.warning(f"Failed to calculate audio duration ({audio_path}): {e}")
         return None
@@ -235,163 +1935,1251 @@ def calculate_max_frames_from_audio(wav_path, wav_path_2=None, fps=25):
     logger.info(f"Longest audio duration: {max_duration:.2f} seconds, calculated max_frames: {max_frames}")
     return max_frames
 
-def handler(job):
+def decode_audio_mono(audio_path, sample_rate=VAD_SAMPLE_RATE):
+    """Decode any audio file to a mono float32 NumPy array with ffmpeg"""
+    import numpy as np
+    result = subprocess.run([
+        'ffmpeg', '-v', 'error', '-i', audio_path, '-f', 's16le', '-ac', '1', '-ar', str(sample_rate), '-'
+    ], capture_output=True, timeout=120)
+    if result.returncode != 0:
+        raise Exception(f"ffmpeg decode failed: {result.stderr.decode(errors='replace').strip()}")
+    return np.frombuffer(result.stdout, dtype=np.int16).astype(np.float32) / 32768.0
+
+def voiced_frames(audio_path, frame_seconds=VAD_FRAME_SECONDS):
+    """Return (per-frame voiced mask, duration in seconds) for audio_path.
+
+    A frame counts as voiced when its energy is above both
+    SILENCE_THRESHOLD_DB and SILENCE_RELATIVE_DB below the loudest frame.
+    """
+    import numpy as np
+    samples = decode_audio_mono(audio_path)
+    duration = len(samples) / VAD_SAMPLE_RATE
+    frame_len = int(VAD_SAMPLE_RATE * frame_seconds)
+    n_frames = len(samples) // frame_len
+    if n_frames == 0:
+        return np.zeros(0, dtype=bool), duration
+
+    frames = samples[:n_frames * frame_len].reshape(n_frames, frame_len)
+    energy_db = 10 * np.log10(np.mean(np.square(frames), axis=1) + 1e-10)
+    threshold = max(SILENCE_THRESHOLD_DB, energy_db.max() - SILENCE_RELATIVE_DB)
+    return energy_db > threshold, duration
+
+def detect_voiced_span(audio_path, frame_seconds=VAD_FRAME_SECONDS):
+    """Return (start, end, duration) in seconds of the voiced part of audio_path.
+
+    A file with no voiced frame is returned untrimmed.
+    """
+    import numpy as np
+    mask, duration = voiced_frames(audio_path, frame_seconds)
+    voiced = np.flatnonzero(mask)
+    if voiced.size == 0:
+        return 0.0, duration, duration
+
+    start = max(voiced[0] * frame_seconds - SILENCE_PADDING, 0.0)
+    end = min((voiced[-1] + 1) * frame_seconds + SILENCE_PADDING, duration)
+    return float(start), float(end), duration
+
+def trim_audio(audio_path, start, end, output_path):
+    """Cut [start, end) seconds of audio_path into a PCM WAV at output_path"""
+    result = subprocess.run([
+        'ffmpeg', '-v', 'error', '-y', '-ss', f"{start:.3f}", '-t', f"{end - start:.3f}",
+        '-i', audio_path, '-c:a', 'pcm_s16le', output_path
+    ], capture_output=True, text=True, timeout=120)
+    if result.returncode != 0:
+        raise Exception(f"ffmpeg trim failed: {result.stderr.strip()}")
+    return output_path
+
+def budget_frames_from_voiced_audio(wav_path, wav_path_2, temp_dir, fps=25, trim=False):
+    """Size max_frames from the voiced span of the audio instead of its file length.
+
+    Trailing silence is always left out of the frame budget. With trim=True the
+    leading silence is cut from the audio handed to ComfyUI as well. For
+    multi-person jobs both tracks share one span (earliest start, latest end)
+    so they stay in sync. Returns a dict with max_frames, the (possibly
+    trimmed) audio paths and what was saved; None if analysis failed.
+    """
+    try:
+        spans = [detect_voiced_span(path) for path in filter(None, [wav_path, wav_path_2])]
+    except Exception as e:
+        logger.warning(f"Voice activity detection failed, using full audio length: {e}")
+        return None
+
+    full_duration = max(duration for _, _, duration in spans)
+    start = min(span[0] for span in spans) if trim else 0.0
+    end = max(span[1] for span in spans)
+
+    if trim and start > 0:
+        os.makedirs(temp_dir, exist_ok=True)
+        wav_path = trim_audio(wav_path, start, end, os.path.abspath(os.path.join(temp_dir, "input_audio_trimmed.wav")))
+        if wav_path_2:
+            wav_path_2 = trim_audio(wav_path_2, start, end, os.path.abspath(os.path.join(temp_dir, "input_audio_2_trimmed.wav")))
+
+    full_frames = int(full_duration * fps) + 25
+    max_frames = int((end - start) * fps) + 25
+    logger.info(f"Voiced audio {start:.2f}-{end:.2f}s of {full_duration:.2f}s, max_frames {full_frames} -> {max_frames}")
+    return {
+        "max_frames": max_frames,
+        "wav_path": wav_path,
+        "wav_path_2": wav_path_2,
+        "report": {
+            "voiced_start": round(start, 3),
+            "voiced_end": round(end, 3),
+            "duration": round(full_duration, 3),
+            "frames_trimmed": full_frames - max_frames,
+        },
+    }
+
+def probe_video(video_path):
+    """Return fps, frames, width, height and duration of a video's first stream via ffprobe"""
+    result = subprocess.run([
+        'ffprobe', '-v', 'error', '-select_streams', 'v:0',
+        '-show_entries', 'stream=width,height,avg_frame_rate,nb_frames:format=duration', '-of', 'json', video_path
+    ], capture_output=True, text=True, timeout=30)
+    if result.returncode != 0:
+        raise Exception(result.stderr.strip())
+    info = json.loads(result.stdout)
+    stream = info["streams"][0]
+    num, _, den = stream.get("avg_frame_rate", "0/1").partition("/")
+    fps = float(num) / float(den or 1) if float(den or 1) else 0.0
+    duration = float(info.get("format", {}).get("duration") or 0)
+    frames = int(stream["nb_frames"]) if str(stream.get("nb_frames", "")).isdigit() else round(duration * fps)
+    return {"fps": round(fps, 3), "frames": frames, "width": stream["width"], "height": stream["height"], "duration": duration}
+
+def stream_copy_trim(video_path, seconds, output_path):
+    """Cut the first `seconds` of the video stream into output_path without re-encoding"""
+    result = subprocess.run([
+        'ffmpeg', '-v', 'error', '-y', '-i', video_path, '-t', f"{seconds:.3f}", '-map', '0:v:0', '-c', 'copy',
+        '-an', '-map_metadata', '-1', '-fflags', '+bitexact', output_path
+    ], capture_output=True, text=True, timeout=120)
+    if result.returncode != 0:
+        raise Exception(f"ffmpeg stream copy failed: {result.stderr.strip()}")
+    return output_path
+
+def plan_video_load(video_path, max_frame, temp_dir, stream_copy=VIDEO_STREAM_COPY_TRIM):
+    """Limit what VHS_LoadVideo decodes to the frames the audio needs.
+
+    The source is resampled to VIDEO_FPS (the rate the audio embeddings and
+    max_frame are computed at) and capped at max_frame frames. With
+    stream_copy, a source much longer than that is cut first so the unused
+    tail is never read, hashed or demuxed. Returns a dict with the (possibly
+    trimmed) video_path, the template values to apply and a report.
+    """
+    values = {"video_fps": VIDEO_FPS, "video_frame_cap": max_frame}
+    needed_seconds = max_frame / VIDEO_FPS
+    try:
+        info = probe_video(video_path)
+    except Exception as e:
+        logger.warning(f"Video probe failed, loading capped at {max_frame} frames: {e}")
+        return {"video_path": video_path, "values": values, "report": {"frames_loaded": max_frame}}
+
+    report = {
+        "source_fps": info["fps"],
+        "source_frames": info["frames"],
+        "source_size": [info["width"], info["height"]],
+        "frames_loaded": min(max_frame, int(info["duration"] * VIDEO_FPS) or max_frame),
+    }
+    # Keep a second of slack: stream copy can only end on packet boundaries
+    if stream_copy and info["duration"] > needed_seconds + 2:
+        os.makedirs(temp_dir, exist_ok=True)
+        output_path = os.path.abspath(os.path.join(temp_dir, "input_video_trimmed" + os.path.splitext(video_path)[1]))
+        try:
+            original_size = os.path.getsize(video_path)
+            video_path = stream_copy_trim(video_path, needed_seconds + 1, output_path)
+            report["trimmed_seconds"] = round(info["duration"] - needed_seconds - 1, 3)
+            report["trimmed_bytes"] = original_size - os.path.getsize(video_path)
+        except Exception as e:
+            logger.warning(f"Video pre-trim failed, loading the full file: {e}")
+    logger.info(f"🎞️ Video load: {info['frames']} frames @ {info['fps']} fps -> {report['frames_loaded']} @ {VIDEO_FPS} fps")
+    return {"video_path": video_path, "values": values, "report": report}
+
+def _is_normalized_wav(path):
+    """True if path is already a 16-bit PCM mono WAV at AUDIO_SAMPLE_RATE"""
+    with open(path, 'rb') as f:
+        header = f.read(12)
+        if len(header) < 12 or header[:4] != b'RIFF' or header[8:12] != b'WAVE':
+            return False
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                return False
+            chunk_id, chunk_size = struct.unpack('<4sI', chunk)
+            if chunk_id == b'fmt ':
+                fmt = f.read(16)
+                audio_format, channels, sample_rate, _, _, bits = struct.unpack('<HHIIHH', fmt)
+                return (audio_format, channels, sample_rate, bits) == (1, 1, AUDIO_SAMPLE_RATE, 16)
+            f.seek(chunk_size + chunk_size % 2, 1)
+
+def _preprocessed(src_path, variant, make):
+    """Return (path, hit) for the preprocessed copy of src_path identified by variant.
+
+    make(tmp_path) writes a new copy; results are keyed by the SHA-256 of the
+    source so repeated uploads of the same file are only converted once.
+    """
+    os.makedirs(preprocess_cache.directory, exist_ok=True)
+    path = os.path.join(preprocess_cache.directory, f"{file_sha256(src_path)}-{variant}")
+    if os.path.exists(path):
+        os.utime(path)
+        return path, True
+    tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.part"
+    try:
+        make(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    preprocess_cache.prune()
+    return path, False
+
+def normalize_audio(audio_path):
+    """Convert audio to 16-bit PCM mono WAV at AUDIO_SAMPLE_RATE.
+
+    Returns (path, status) where status is "unchanged", "cached" or "converted".
+    """
+    if _is_normalized_wav(audio_path):
+        return audio_path, "unchanged"
+
+    def convert(tmp_path):
+        result = subprocess.run([
+            'ffmpeg', '-v', 'error', '-y', '-i', audio_path, '-vn', '-ac', '1', '-ar', str(AUDIO_SAMPLE_RATE),
+            '-c:a', 'pcm_s16le', '-f', 'wav', tmp_path
+        ], capture_output=True, text=True, timeout=300)
+        if result.returncode != 0:
+            raise Exception(f"ffmpeg audio conversion failed: {result.stderr.strip()}")
+
+    path, hit = _preprocessed(audio_path, f"{AUDIO_SAMPLE_RATE}-mono.wav", convert)
+    return path, "cached" if hit else "converted"
+
+def normalize_image(image_path, width, height):
+    """Downscale an image so it just covers width x height.
+
+    The aspect ratio is kept and nothing is cropped, so the crop/resize in
+    ImageResizeKJv2 gives the same framing on a much smaller image. JPEGs are
+    decoded at a reduced DCT scale where possible. Returns (path, status) where
+    status is "unchanged", "cached" or "resized".
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(image_path) as img:
+        # EXIF orientations 5-8 are rotated by 90 degrees
+        rotated = img.getexif().get(0x0112) in (5, 6, 7, 8)
+        src_width, src_height = (img.height, img.width) if rotated else img.size
+    scale = max(width / src_width, height / src_height)
+    if scale >= 1:
+        return image_path, "unchanged"
+    target = (math.ceil(src_width * scale), math.ceil(src_height * scale))
+
+    def resize(tmp_path):
+        with Image.open(image_path) as img:
+            img.draft("RGB", (target[1], target[0]) if rotated else target)
+            img = ImageOps.exif_transpose(img)
+            if img.mode not in ("RGB", "RGBA"):
+                img = img.convert("RGBA" if "A" in img.getbands() else "RGB")
+            img.resize(target, Image.LANCZOS).save(tmp_path, format="PNG", compress_level=1)
+
+    path, hit = _preprocessed(image_path, f"{width}x{height}.png", resize)
+    return path, "cached" if hit else "resized"
+
+def preprocess_inputs(media_path, media_kind, wav_path, wav_path_2, width, height):
+    """Normalize job media on the CPU before it reaches ComfyUI.
+
+    Returns the new (media_path, wav_path, wav_path_2) and a per-input status
+    report. An input that fails to convert is passed through unchanged.
+    """
+    paths = {"media": media_path, "wav": wav_path, "wav_2": wav_path_2}
+    report = {}
+    for name, path in paths.items():
+        if path is None or (name == "media" and media_kind != "image"):
+            continue
+        try:
+            if name == "media":
+                paths[name], report[name] = normalize_image(path, width, height)
+            else:
+                paths[name], report[name] = normalize_audio(path)
+        except Exception as e:
+            logger.warning(f"Preprocessing {name} failed, using the original file: {e}")
+            report[name] = "failed"
+    return paths["media"], paths["wav"], paths["wav_2"], report
+
+class JobError(Exception):
+    """A problem with the job's input, reported to the client as {"error": ...}"""
+
+
+class RenderRate:
+    """Running estimate of render seconds per frame x step x megapixel.
+
+    Starts at RENDER_SECONDS_PER_UNIT and follows finished renders with an
+    exponential moving average.
+    """
+
+    def __init__(self, seconds_per_unit, alpha=0.3):
+        self.seconds_per_unit = seconds_per_unit
+        self.alpha = alpha
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def units(settings):
+        return settings["max_frame"] * settings["steps"] * settings["width"] * settings["height"] / 1e6
+
+    def estimate(self, settings):
+        return self.seconds_per_unit * self.units(settings)
+
+    def observe(self, settings, seconds):
+        units = self.units(settings)
+        if units <= 0 or not seconds:
+            return
+        with self._lock:
+            self.seconds_per_unit += self.alpha * (seconds / units - self.seconds_per_unit)
+
+
+render_rate = RenderRate(RENDER_SECONDS_PER_UNIT)
+
+def job_timeout(job_input, settings):
+    """Seconds a job's render may take before it is interrupted"""
+    timeout = job_input.get("timeout")
+    if timeout is not None:
+        try:
+            seconds = float(timeout)
+        except (TypeError, ValueError):
+            raise JobError(f"Invalid timeout '{timeout}': expected a number of seconds")
+        if not seconds > 0:
+            raise JobError(f"Invalid timeout '{timeout}': must be greater than 0")
+        return seconds
+    return max(JOB_TIMEOUT_MIN, JOB_TIMEOUT_FACTOR * render_rate.estimate(settings))
+
+def job_dimension(job_input, field, default):
+    """job_input[field] as a whole, positive number of pixels"""
+    value = job_input.get(field, default)
+    try:
+        pixels = float(value)
+    except (TypeError, ValueError):
+        raise JobError(f"Invalid {field} '{value}': expected a number of pixels")
+    if not pixels > 0 or not pixels.is_integer():
+        raise JobError(f"Invalid {field} '{value}': must be a whole number greater than 0")
+    return int(pixels)
+
+class JobPlan:
+    """Everything prepare_job() works out before the prompt is queued"""
+
+    def __init__(self, job, template, prompt, timer, settings, report):
+        self.job = job
+        self.template = template
+        self.prompt = prompt
+        self.timer = timer
+        self.settings = settings  # input_type, person_count, width, height, max_frame, steps
+        self.report = report  # extra fields returned with the result
+        self.profiler = None
+        self.fingerprint = None
+        self.cached_result = None  # set when the result cache already has this job
+        self.text_embeds_before = None  # text embedding cache files when rendering started
+        self.timeout = None  # seconds the render may take, see job_timeout()
+        self.cancel = threading.Event()  # set to stop the render (e.g. the client cancelled)
+        self.output_mode = "url"  # see deliver_video()
+        self.workspace = None  # scratch files, removed when the job ends
+
+
+def collect_inputs(job_input, input_type, person_count):
+    """Map input names (media, wav, wav_2) to process_inputs() specs for a job"""
+    inputs = {}
+    media_kind = "image" if input_type == "image" else "video"
+    media_data, media_source = select_input(job_input, media_kind)
+    if media_data is not None:
+        media_filename = "input_image.jpg" if media_kind == "image" else "input_video.mp4"
+        inputs["media"] = (media_data, media_filename, media_source, media_kind)
+
+    wav_data, wav_source = select_input(job_input, "wav")
+    if wav_data is not None:
+        inputs["wav"] = (wav_data, "input_audio.wav", wav_source, "audio")
+
+    # Second audio for multi-person
+    if person_count == "multi":
+        wav_data_2, wav_source_2 = select_input(job_input, "wav", "_2")
+        if wav_data_2 is not None:
+            inputs["wav_2"] = (wav_data_2, "input_audio_2.wav", wav_source_2, "audio")
+    return inputs
+
+def prepare_job(job, prefetched=None):
+    """CPU/network stage of a job: fetch inputs, probe audio and build the prompt.
+
+    prefetched maps input names to paths that were already resolved (a batch
+    fetches its shared media once); those inputs are not fetched again. The
+    job's files live in plan.workspace, which the caller removes once the job
+    is over; if preparation fails it is removed here.
+    """
+    workspace = Workspace()
+    try:
+        return build_plan(job, prefetched, workspace)
+    except BaseException:
+        workspace.cleanup()
+        raise
+
+def build_plan(job, prefetched, workspace):
     job_input = job.get("input", {})
     logger.info(f"Processing job: {job_input.get('input_type', 'image')}, {job_input.get('person_count', 'single')}")
-    task_id = f"task_{uuid.uuid4()}"
 
     # Check input type and person count
     input_type = job_input.get("input_type", "image")  # "image" or "video"
     person_count = job_input.get("person_count", "single")  # "single" or "multi"
 
-    # Determine workflow file path
-    workflow_path = get_workflow_path(input_type, person_count)
-
-    # Process image/video input
-    media_path = None
-    if input_type == "image":
-        # Process image input (use only one of image_path, image_url, image_base64)
-        if "image_path" in job_input:
-            media_path = process_input(job_input["image_path"], task_id, "input_image.jpg", "path")
-        elif "image_url" in job_input:
-            media_path = process_input(job_input["image_url"], task_id, "input_image.jpg", "url")
-        elif "image_base64" in job_input:
-            media_path = process_input(job_input["image_base64"], task_id, "input_image.jpg", "base64")
-        else:
-            # Use default value
-            media_path = "/examples/image.jpg"
-            logger.info("Using default image file: /examples/image.jpg")
-    else:  # video
-        # Process video input (use only one of video_path, video_url, video_base64)
-        if "video_path" in job_input:
-            media_path = process_input(job_input["video_path"], task_id, "input_video.mp4", "path")
-        elif "video_url" in job_input:
-            media_path = process_input(job_input["video_url"], task_id, "input_video.mp4", "url")
-        elif "video_base64" in job_input:
-            media_path = process_input(job_input["video_base64"], task_id, "input_video.mp4", "base64")
-        else:
-            # Use default value (use default image if video is not provided)
-            media_path = "/examples/image.jpg"
-            logger.info("Using default image file: /examples/image.jpg")
+    # Select the workflow template
+    template = get_workflow_template(input_type, person_count)
 
-    # Process audio input (use only one of wav_path, wav_url, wav_base64)
-    wav_path = None
-    wav_path_2 = None  # Second audio for multi-person
-    
-    if "wav_path" in job_input:
-        wav_path = process_input(job_input["wav_path"], task_id, "input_audio.wav", "path")
-    elif "wav_url" in job_input:
-        wav_path = process_input(job_input["wav_url"], task_id, "input_audio.wav", "url")
-    elif "wav_base64" in job_input:
-        wav_path = process_input(job_input["wav_base64"], task_id, "input_audio.wav", "base64")
-    else:
+    # Collect image/video and audio inputs (use only one of *_path, *_url, *_base64 each)
+    prefetched = prefetched or {}
+    inputs = {
+        name: spec for name, spec in collect_inputs(job_input, input_type, person_count).items()
+        if name not in prefetched
+    }
+
+    # Fetch everything in parallel
+    timer = PhaseTimer()
+    with timer.phase("input_fetch"):
+        paths, cache_stats = process_inputs(inputs, workspace)
+    paths = {**prefetched, **paths}
+
+    media_path = paths.get("media")
+    if media_path is None:
+        # Use default value (use default image if video is not provided)
+        media_path = "/examples/image.jpg"
+        logger.info("Using default image file: /examples/image.jpg")
+
+    wav_path = paths.get("wav")
+    if wav_path is None:
         # Use default value
         wav_path = "/examples/audio.mp3"
         logger.info("Using default audio file: /examples/audio.mp3")
-    
-    # Process second audio for multi-person
+
+    wav_path_2 = None
     if person_count == "multi":
-        if "wav_path_2" in job_input:
-            wav_path_2 = process_input(job_input["wav_path_2"], task_id, "input_audio_2.wav", "path")
-        elif "wav_url_2" in job_input:
-            wav_path_2 = process_input(job_input["wav_url_2"], task_id, "input_audio_2.wav", "url")
-        elif "wav_base64_2" in job_input:
-            wav_path_2 = process_input(job_input["wav_base64_2"], task_id, "input_audio_2.wav", "base64")
-        else:
+        wav_path_2 = paths.get("wav_2")
+        if wav_path_2 is None:
             # Use default value (same as first audio)
             wav_path_2 = wav_path
             logger.info("No second audio provided, using first audio")
 
     # Validate required fields and set default values (optimized for fast cartoon animations)
     prompt_text = job_input.get("prompt", "A person talking naturally")
-    width = job_input.get("width", 854)  # 16:9 aspect ratio
-    height = job_input.get("height", 480)  # 16:9 aspect ratio
+    width = job_dimension(job_input, "width", DEFAULT_WIDTH)
+    height = job_dimension(job_input, "height", DEFAULT_HEIGHT)
     steps = job_input.get("steps", 4)  # 4 steps = 30-40% faster than 6
+    output_mode = job_input.get("output_mode", OUTPUT_MODE)
+    if output_mode not in OUTPUT_MODES:
+        raise JobError(f"Unsupported output_mode '{output_mode}' (expected one of {', '.join(OUTPUT_MODES)})")
     
     # Set max_frame (auto-calculate based on audio duration if not provided)
     max_frame = job_input.get("max_frame")
-    if max_frame is None:
-        max_frame = calculate_max_frames_from_audio(wav_path, wav_path_2 if person_count == "multi" else None)
+    trim_silence = job_input.get("trim_silence", False)
+    report = {"input_cache": cache_stats}
+    cold_start = take_cold_start()
+    if cold_start is not None:
+        report["cold_start"] = cold_start
+    with timer.phase("probe"):
+        if (max_frame is None and job_input.get("silence_aware", SILENCE_AWARE_FRAMES)) or trim_silence:
+            budget = budget_frames_from_voiced_audio(wav_path, wav_path_2, workspace.dir_for("audio"), trim=trim_silence)
+            if budget is not None:
+                wav_path, wav_path_2 = budget["wav_path"], budget["wav_path_2"]
+                report["audio"] = budget["report"]
+                if max_frame is None:
+                    max_frame = budget["max_frames"]
+        if max_frame is None:
+            max_frame = calculate_max_frames_from_audio(wav_path, wav_path_2 if person_count == "multi" else None)
     
-    logger.info(f"Settings: {width}x{height}, steps={steps}, max_frame={max_frame}")
+    # Snap to compiled shapes; VHS_VideoCombine (trim_to_audio) cuts the extra frames again
+    if job_input.get("shape_bucketing", SHAPE_BUCKETING):
+        width, height, max_frame = bucket_shape(template, width, height, max_frame)
 
-    prompt = load_workflow(workflow_path)
+    logger.info(f"Settings: {width}x{height}, steps={steps}, max_frame={max_frame}")
 
     # Check file existence
     if not os.path.exists(media_path):
-        return {"error": f"Media file not found: {media_path}"}
+        raise JobError(f"Media file not found: {media_path}")
     if not os.path.exists(wav_path):
-        return {"error": f"Audio file not found: {wav_path}"}
+        raise JobError(f"Audio file not found: {wav_path}")
     if person_count == "multi" and wav_path_2 and not os.path.exists(wav_path_2):
-        return {"error": f"Second audio file not found: {wav_path_2}"}
+        raise JobError(f"Second audio file not found: {wav_path_2}")
+
+    # Only decode the part of a source video the audio covers
+    video_values = {}
+    if input_type != "image" and job_input.get("video_pretrim", VIDEO_PRETRIM):
+        with timer.phase("video_probe"):
+            video_plan = plan_video_load(media_path, max_frame, workspace.dir_for("video"))
+        media_path, video_values, report["video"] = video_plan["video_path"], video_plan["values"], video_plan["report"]
+
+    # Shrink images to the target resolution and audio to mono PCM before ComfyUI decodes them
+    if job_input.get("preprocess", PREPROCESS_INPUTS):
+        with timer.phase("preprocess"):
+            media_path, wav_path, wav_path_2, report["preprocess"] = preprocess_inputs(
+                media_path, input_type, wav_path, wav_path_2, width, height
+            )
+
+    # Stable,content-addressed paths let ComfyUI reuse cached loader/encoder outputs
+    if media_store.enabled:
+        with timer.phase("media_store"):
+            media_path = media_store.put(media_path, workspace)
+            wav_path = media_store.put(wav_path, workspace)
+            if wav_path_2:
+                wav_path_2 = media_store.put(wav_path_2, workspace)
 
     # Configure workflow nodes
-    if input_type == "image":
-        # I2V workflow: configure image input
-        prompt["284"]["inputs"]["image"] = media_path
-    else:
-        # V2V workflow: configure video input
-        prompt["228"]["inputs"]["video"] = media_path
-    
-    # Common settings
-    prompt["125"]["inputs"]["audio"] = wav_path
-    prompt["241"]["inputs"]["positive_prompt"] = prompt_text
-    prompt["245"]["inputs"]["value"] = width
-    prompt["246"]["inputs"]["value"] = height
-    prompt["270"]["inputs"]["value"] = max_frame
-    
-    # Set generation steps (node 128 is the sampler)
-    if "128" in prompt:
-        prompt["128"]["inputs"]["steps"] = steps
-    
-    # Configure second audio for multi-person
-    if person_count == "multi":
-        # Configure second audio node based on workflow type
-        if input_type == "image":  # For I2V_multi.json
-            if "307" in prompt:
-                prompt["307"]["inputs"]["audio"] = wav_path_2
-        else:  # For V2V_multi.json
-            if "313" in prompt:
-                prompt["313"]["inputs"]["audio"] = wav_path_2
-
-    ws_url = f"ws://{server_address}:8188/ws?clientId={client_id}"
-    http_url = f"http://{server_address}:8188/"
-    
-    # Check HTTP connection (max 30 seconds)
-    max_http_attempts = 30
-    for http_attempt in range(max_http_attempts):
-        try:
-            import urllib.request
-            response = urllib.request.urlopen(http_url, timeout=5)
-            logger.info(f"HTTP connection successful")
-            break
-        except Exception as e:
-            if http_attempt == max_http_attempts - 1:
-                raise Exception("Cannot connect to ComfyUI server. Please verify the server is running.")
-            time.sleep(1)
-    
-    ws = websocket.WebSocket()
-    # Attempt WebSocket connection (max 10 seconds)
-    max_attempts = 10
-    for attempt in range(max_attempts):
-        import time
-        try:
-            ws.connect(ws_url)
-            logger.info(f"WebSocket connected")
-            break
-        except Exception as e:
-            if attempt == max_attempts - 1:
-                raise Exception("WebSocket connection timeout")
-            time.sleep(1)
-    videos = get_videos(ws, prompt, input_type, person_count)
-    ws.close()
+    prompt = template.instantiate({
+        "media": media_path,
+        "wav": wav_path,
+        "wav_2": wav_path_2,
+        "prompt": prompt_text,
+        "width": width,
+        "height": height,
+        "max_frame": max_frame,
+        "steps": steps,
+        "seed": job_input.get("seed"),
+        "negative_prompt": job_input.get("negative_prompt"),
+        "text_embed_cache": TEXT_EMBED_CACHE,
+        # A new file name per prompt: ComfyUI caches the output node too, and a
+        # repeated job would otherwise be handed the file cleanup() deleted
+        "output_prefix": workspace.name,
+        **video_values,
+    })
+
+    settings = {
+        "input_type": input_type,
+        "person_count": person_count,
+        "width": width,
+        "height": height,
+        "max_frame": max_frame,
+        "steps": steps,
+    }
+    plan = JobPlan(job, template, prompt, timer, settings, report)
+    plan.workspace = workspace
+    plan.timeout = job_timeout(job_input, settings)
+    plan.output_mode = output_mode
+
+    # Deduplicate against earlier identical jobs (the cache holds uploaded URLs)
+    if result_cache.enabled and output_mode == "url" and job_input.get("use_result_cache", True):
+        with timer.phase("fingerprint"):
+            plan.fingerprint = template.fingerprint(prompt)
+            plan.cached_result = result_cache.lookup(plan.fingerprint)
+        if plan.cached_result is not None:
+            logger.info(f"♻️ Result cache hit ({plan.fingerprint[:12]}), skipping render")
+    return plan
+
+def render_job(plan, session=None):
+    """GPU stage of a job: queue the prompt and follow it until ComfyUI is done.
+
+    Returns the OutputCollector; its uploads may still be in flight.
+    """
+    collector = render_jobs([plan], plan.timer, session)[0]
+    if isinstance(collector, Exception):
+        raise collector
+    return collector
+
+def apply_memory_plan(plan, session=None):
+    """Size block swapping and VAE tiling to the plan's shape and the GPU of the session.
+
+    Runs once the instance is known: with one ComfyUI per GPU, the GPUs may differ.
+    """
+    if not MEMORY_PLANNER:
+        return
+    session = session or comfy
+    settings = plan.settings
+    memory_plan = planner.plan_for_job(settings["width"], settings["height"], plan.template.frame_window_size, session.gpu_index)
+    if memory_plan is None:
+        return
+    plan.report["memory_plan"] = dict(memory_plan, gpu_index=session.gpu_index)
+    values = {key: memory_plan[key] for key in ("blocks_to_swap", "prefetch_blocks", "vae_tiling")}
+    plan.prompt = plan.template.instantiate(values, base=plan.prompt)
+
+def render_jobs(plans, timer, session=None):
+    """Queue the prompts of several plans back to back and follow them all.
+
+    The plans share one output_mode. Returns one OutputCollector (or queueing
+    exception) per plan.
+    """
+    runs = []
+    reporters = []
+    text_embeds_before = text_embed_cache.names() if TEXT_EMBED_CACHE else None
+    for index, plan in enumerate(plans):
+        apply_memory_plan(plan, session)
+        plan.profiler = ExecutionProfiler(plan.prompt)
+        plan.text_embeds_before = text_embeds_before
+        extra = {"item": index + 1, "items": len(plans)} if len(plans) > 1 else None
+        reporter = ProgressReporter.for_template(plan.job, plan.prompt, plan.template, plan.settings["max_frame"], extra)
+        reporters.append(reporter)
+        runs.append((plan.prompt, [plan.profiler, reporter]))
+    # Back-to-back prompts share one deadline: the sum of their budgets
+    deadline = time.monotonic() + sum(plan.timeout for plan in plans)
+    try:
+        return run_prompts(
+            runs, timer, plans[0].output_mode, deadline=deadline,
+            cancelled=lambda: any(plan.cancel.is_set() for plan in plans), session=session
+        )
+    finally:
+        for reporter in reporters:
+            reporter.close()
+
+def encoder_report(plan):
+    """Which encoder nodes ComfyUI skipped for this job, and how the text embeddings were obtained"""
+    skipped = [
+        {"node": node_id, "class_type": plan.profiler.class_types.get(node_id)}
+        for node_id in plan.profiler.cached
+        if plan.profiler.class_types.get(node_id) in ENCODER_CLASS_TYPES
+    ]
+    report = {"skipped": skipped}
+    if plan.text_embeds_before is not None:
+        text_nodes = [n for n, t in plan.profiler.class_types.items() if t == "WanVideoTextEncodeCached"]
+        if text_nodes and all(n in plan.profiler.cached for n in text_nodes):
+            report["text_embeds"] = "node_cache"
+        elif text_embed_cache.names() - plan.text_embeds_before:
+            report["text_embeds"] = "encoded"
+            text_embed_cache.prune()
+        else:
+            report["text_embeds"] = "disk_cache"
+    return report
+
+def finish_cached_job(plan):
+    """Build the job output for a result cache hit"""
+    return {
+        **plan.cached_result,
+        **plan.report,
+        "result_cache": result_cache.report(True),
+        "timings": {"phases": plan.timer.phases},
+    }
+
+def finish_job(plan, collector):
+    """Wait for uploads, record metrics and build the job output"""
+    with plan.timer.phase("upload"):
+        videos = collector.results()
+    # Delivered; the ComfyUI output goes with the workspace
+    plan.workspace.track(*(path for paths in collector.paths.values() for path in paths))
+
+    timings = {"phases": plan.timer.phases, "execution": plan.profiler.report()}
+    if not collector.error:
+        render_rate.observe(plan.settings, timings["execution"]["total_seconds"])
+    plan.report["encoders"] = encoder_report(plan)
+    settings = plan.settings
+    write_metrics({
+        "job_id": plan.job.get("id"),
+        "timestamp": time.time(),
+        "workflow": plan.template.name,
+        "shape": [settings["width"], settings["height"], settings["max_frame"]],
+        "steps": settings["steps"],
+        "timings": timings,
+        "disk": reclaim_stats.report(),
+    })
 
     # Return video URL
     for node_id in videos:
         if videos[node_id]:
             logger.info(f"Video generation complete")
-            return {"video_url": videos[node_id][0]}
+            result = videos[node_id][0]
+            if plan.fingerprint is not None:
+                result_cache.store(plan.fingerprint, result)
+                plan.report["result_cache"] = result_cache.report(False)
+            return {**result, **plan.report, "timings": timings}
     
     return {"error": "Video not found"}
 
-runpod.serverless.start({"handler": handler})
\ No newline at end of file
+def split_batch(job):
+    """Turn a batch job into (shared job input, [per-item jobs]).
+
+    Items inherit every field of the batch input and override what they set.
+    An item that sets any of wav_path/wav_url/wav_base64 (or the *_2 variants)
+    replaces all of the batch-level fields for that audio track. output_mode
+    is batch-wide, since all items are rendered together. An item that is not
+    an object gets a JobError in place of its job, which prepare_batch()
+    reports as that item's error.
+    """
+    job_input = dict(job.get("input", {}))
+    items = job_input.pop("items")
+    if not isinstance(items, list) or not items:
+        raise JobError("'items' must be a non-empty list")
+    if len(items) > MAX_BATCH_ITEMS:
+        raise JobError(f"Too many items: {len(items)} (limit {MAX_BATCH_ITEMS})")
+
+    track_keys = {
+        "": [f"wav_{source}" for source in ("path", "url", "base64")],
+        "_2": [f"wav_{source}_2" for source in ("path", "url", "base64")],
+    }
+    item_jobs = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            item_jobs.append(JobError(f"Item {index + 1} must be an object, got {type(item).__name__}"))
+            continue
+        item_input = dict(job_input)
+        for keys in track_keys.values():
+            if any(key in item for key in keys):
+                for key in keys:
+                    item_input.pop(key, None)
+        item_input.update(item)
+        item_input["output_mode"] = job_input.get("output_mode", OUTPUT_MODE)
+        item_jobs.append({"id": job.get("id"), "input": item_input})
+    return job_input, item_jobs
+
+def prepare_batch(job):
+    """Fetch the shared media once, then prepare every item concurrently.
+
+    Returns (plans, errors, cache_stats, workspace); a failed item has plan
+    None and its error message at the same index. workspace holds the shared
+    media and is removed by the caller along with the plans' workspaces.
+    """
+    job_input, item_jobs = split_batch(job)
+    input_type = job_input.get("input_type", "image")
+    person_count = job_input.get("person_count", "single")
+    media = {
+        name: spec for name, spec in collect_inputs(job_input, input_type, person_count).items()
+        if name == "media"
+    }
+    workspace = Workspace()
+    try:
+        prefetched, cache_stats = process_inputs(media, workspace)
+    except BaseException:
+        workspace.cleanup()
+        raise
+
+    def prepare_item(item_job):
+        if isinstance(item_job, JobError):
+            return None, str(item_job)
+        try:
+            return prepare_job(item_job, prefetched), None
+        except Exception as e:
+            logger.error(f"❌ Batch item failed during preparation: {e}")
+            return None, str(e)
+
+    with ThreadPoolExecutor(max_workers=min(len(item_jobs), DOWNLOAD_WORKERS)) as pool:
+        prepared = list(pool.map(prepare_item, item_jobs))
+    plans = [plan for plan, _ in prepared]
+    errors = [error for _, error in prepared]
+    return plans, errors, cache_stats, workspace
+
+def cleanup_workspaces(plans, *workspaces):
+    """Remove the workspaces of finished plans (None entries are skipped) and any extra ones"""
+    for plan in plans:
+        if plan is not None:
+            plan.workspace.cleanup()
+    for workspace in workspaces:
+        workspace.cleanup()
+
+def render_batch(plans, timer, session=None):
+    """Render every prepared item back to back; returns collectors aligned with plans"""
+    def needs_render(plan):
+        return plan is not None and plan.cached_result is None
+
+    ready = [plan for plan in plans if needs_render(plan)]
+    collectors = iter(render_jobs(ready, timer, session) if ready else [])
+    return [next(collectors) if needs_render(plan) else None for plan in plans]
+
+def finish_batch(plans, errors, collectors, cache_stats, timer):
+    """Collect per-item results in item order"""
+    items = []
+    for plan, error, collector in zip(plans, errors, collectors):
+        if plan is None:
+            items.append({"error": error})
+        elif plan.cached_result is not None:
+            items.append(finish_cached_job(plan))
+        elif isinstance(collector, Exception):
+            items.append({"error": f"Failed to queue prompt: {collector}"})
+        else:
+            try:
+                items.append(finish_job(plan, collector))
+            except Exception as e:
+                logger.error(f"❌ Batch item failed: {e}")
+                items.append({"error": str(e)})
+    return {"items": items, "input_cache": cache_stats, "timings": {"phases": timer.phases}}
+
+def find_segment_cuts(voiced, frame_seconds, duration, template, target_seconds, fps=VIDEO_FPS):
+    """Pick cut times (seconds) that split audio into segments of about target_seconds.
+
+    Cuts go in the middle of silent runs of at least SEGMENT_MIN_GAP seconds,
+    preferring the one whose segment length wastes the fewest frames on the
+    window grid (frame_window_size + k * (frame_window_size - motion_frame)).
+    Where no silence falls between half and 1.5x the target, the cut is made
+    at the longest grid length that fits, which wastes nothing.
+    """
+    window, motion = template.frame_window_size, template.motion_frame
+    min_seconds, max_seconds = target_seconds / 2, target_seconds * 1.5
+    min_gap = max(1, int(SEGMENT_MIN_GAP / frame_seconds))
+
+    # Midpoints of silent runs
+    silences = []
+    run_start = None
+    for index, is_voiced in enumerate(list(voiced) + [True]):
+        if not is_voiced and run_start is None:
+            run_start = index
+        elif is_voiced and run_start is not None:
+            if index - run_start >= min_gap:
+                silences.append((run_start + index) / 2 * frame_seconds)
+            run_start = None
+
+    cuts = []
+    start = 0.0
+    while duration - start > max_seconds:
+        best = None
+        for cut in silences:
+            length = cut - start
+            if min_seconds <= length <= max_seconds:
+                frames = math.ceil(round(length * fps, 6))
+                waste = snap_frames(frames, window, motion) - frames
+                score = waste + abs(length - target_seconds)  # frames wasted, then closeness to target
+                if best is None or score < best[0]:
+                    best = (score, cut)
+        if best is not None:
+            cut = best[1]
+        else:
+            stride = window - motion
+            k = max(0, int((max_seconds * fps - window) // stride))
+            cut = start + (window + k * stride) / fps
+        cuts.append(cut)
+        start = cut
+    return cuts
+
+def plan_audio_segments(wav_path, wav_path_2, template, target_seconds):
+    """Return [(start, end)] seconds covering the audio, cut at shared silences"""
+    import numpy as np
+    masks = []
+    duration = 0.0
+    for path in filter(None, [wav_path, wav_path_2]):
+        mask, track_duration = voiced_frames(path)
+        masks.append(mask)
+        duration = max(duration, track_duration)
+    # A frame is silent only if every track is silent there
+    length = max(len(mask) for mask in masks)
+    voiced = np.zeros(length, dtype=bool)
+    for mask in masks:
+        voiced[:len(mask)] |= mask
+    cuts = find_segment_cuts(voiced, VAD_FRAME_SECONDS, duration, template, target_seconds)
+    bounds = [0.0, *cuts, duration]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+def extract_last_frame(video_path, output_path):
+    """Write the last frame of video_path as a PNG"""
+    result = subprocess.run([
+        'ffmpeg', '-v', 'error', '-y', '-sseof', '-0.5', '-i', video_path, '-update', '1', output_path
+    ], capture_output=True, text=True, timeout=120)
+    if result.returncode != 0 or not os.path.exists(output_path):
+        raise Exception(f"ffmpeg last frame extraction failed: {result.stderr.strip()}")
+    return output_path
+
+def concat_videos(video_paths, output_path, fps=VIDEO_FPS):
+    """Join segment videos, dropping the first frame of every segment after the first.
+
+    A later segment starts from the last frame of the one before it, and its
+    audio starts 1/fps early to match (see render_segments), so that frame and
+    its audio are a repeat. The video is re-encoded with the settings of the
+    workflow's VHS_VideoCombine node.
+    """
+    inputs, filters, streams = [], [], []
+    for index, path in enumerate(video_paths):
+        skip = 1 if index else 0
+        inputs += ['-i', path]
+        filters.append(f"[{index}:v]trim=start_frame={skip},setpts=PTS-STARTPTS[v{index}]")
+        filters.append(f"[{index}:a]atrim=start={skip / fps:.6f},asetpts=PTS-STARTPTS[a{index}]")
+        streams.append(f"[v{index}][a{index}]")
+    filters.append(f"{''.join(streams)}concat=n={len(video_paths)}:v=1:a=1[v][a]")
+    result = subprocess.run([
+        'ffmpeg', '-v', 'error', '-y', *inputs, '-filter_complex', ';'.join(filters), '-map', '[v]', '-map', '[a]',
+        '-c:v', 'libx264', '-crf', '19', '-pix_fmt', 'yuv420p', '-c:a', 'aac', output_path
+    ], capture_output=True, text=True, timeout=600)
+    if result.returncode != 0:
+        raise Exception(f"ffmpeg concat failed: {result.stderr.strip()}")
+    return output_path
+
+def wants_segments(job_input):
+    """Whether a job goes to run_segmented(); only image jobs can be segmented"""
+    return (
+        "items" not in job_input
+        and job_input.get("input_type", "image") == "image"
+        and job_input.get("segmented", SEGMENTED_RENDERING)
+    )
+
+def job_segment_seconds(job_input):
+    """job_input["segment_seconds"] as a positive number of seconds"""
+    value = job_input.get("segment_seconds", SEGMENT_SECONDS)
+    try:
+        seconds = float(value)
+    except (TypeError, ValueError):
+        raise JobError(f"Invalid segment_seconds '{value}': expected a number of seconds")
+    if not math.isfinite(seconds) or seconds <= 0:
+        raise JobError(f"Invalid segment_seconds '{value}': must be greater than 0")
+    return seconds
+
+def run_segmented(job, render, cancel=None):
+    """Render a long-audio image job as a chain of shorter prompts.
+
+    The audio is cut at silences (see find_segment_cuts) and every segment is
+    its own prompt, started from the last frame of the segment before it.
+    Audio that fits in one segment is rendered as a normal job.
+    render(plan) runs one prompt and returns its OutputCollector. Each
+    segment is delivered in the job's output_mode and announced through
+    progress_update as soon as it is done; with "base64" only the joined video
+    is encoded. A failed segment is retried on its own up to SEGMENT_RETRIES
+    times. The segments are then joined with concat_videos(). If a segment
+    still fails, the segments finished so far are returned with the error.
+    """
+    job_input = job.get("input", {})
+    input_type = job_input.get("input_type", "image")
+    person_count = job_input.get("person_count", "single")
+    if input_type != "image":
+        raise JobError("Segmented rendering needs an image input")
+    output_mode = job_input.get("output_mode", OUTPUT_MODE)
+    if output_mode not in OUTPUT_MODES:
+        raise JobError(f"Unsupported output_mode '{output_mode}' (expected one of {', '.join(OUTPUT_MODES)})")
+    job_segment_seconds(job_input)
+    template = get_workflow_template(input_type, person_count)
+    workspace = Workspace()
+    plans = []
+    try:
+        return render_segments(job, render, cancel, template, workspace, plans)
+    finally:
+        cleanup_workspaces(plans, workspace)
+
+def render_segments(job, render, cancel, template, workspace, plans):
+    """run_segmented() body; every plan it prepares is appended to plans"""
+    job_input = job.get("input", {})
+    input_type = job_input.get("input_type", "image")
+    person_count = job_input.get("person_count", "single")
+    output_mode = job_input.get("output_mode", OUTPUT_MODE)
+    timer = PhaseTimer()
+
+    with timer.phase("input_fetch"):
+        paths, cache_stats = process_inputs(collect_inputs(job_input, input_type, person_count), workspace)
+    start_image = paths.get("media", "/examples/image.jpg")
+    wav_path = paths.get("wav", "/examples/audio.mp3")
+    wav_path_2 = paths.get("wav_2", wav_path) if person_count == "multi" else None
+
+    with timer.phase("segment_plan"):
+        segments = plan_audio_segments(wav_path, wav_path_2, template, job_segment_seconds(job_input))
+    if len(segments) == 1:
+        logger.info("Audio fits in one segment, rendering it as a normal job")
+        plan = prepare_job(job, paths)
+        plans.append(plan)
+        if cancel is not None:
+            plan.cancel = cancel
+        if plan.cached_result is not None:
+            return finish_cached_job(plan)
+        return finish_job(plan, render(plan))
+    logger.info(f"✂️ Rendering {len(segments)} segment(s): {[(round(a, 2), round(b, 2)) for a, b in segments]}")
+
+    results = []
+    video_paths = []
+    for index, (start, end) in enumerate(segments):
+        # A later segment's first frame repeats the last frame it is seeded with;
+        # one frame of extra audio keeps the frames after it in step, and
+        # concat_videos() drops the repeat again
+        lead = 1 / VIDEO_FPS if index else 0.0
+        prefetched = {
+            "media": start_image,
+            "wav": trim_audio(wav_path, start - lead, end, workspace.path(f"segment_{index}.wav", "audio")),
+        }
+        if wav_path_2:
+            prefetched["wav_2"] = trim_audio(
+                wav_path_2, start - lead, end, workspace.path(f"segment_{index}_2.wav", "audio")
+            )
+        frames = math.ceil(round((end - start + lead) * VIDEO_FPS, 6))
+        segment_job = {"id": job.get("id"), "input": {
+            **job_input,
+            "max_frame": snap_frames(frames, template.frame_window_size, template.motion_frame),
+            "silence_aware": False,
+            "trim_silence": False,
+            "use_result_cache": False,
+        }}
+
+        for attempt in range(1, SEGMENT_RETRIES + 2):
+            try:
+                plan = prepare_job(segment_job, prefetched)
+                plans.append(plan)
+                if cancel is not None:
+                    plan.cancel = cancel
+                if output_mode == "base64":
+                    plan.output_mode = "local"
+                with timer.phase("segments"):
+                    collector = render(plan)
+                    output = finish_job(plan, collector)
+                if "error" in output:
+                    raise Exception(output["error"])
+                break
+            except Exception as e:
+                if attempt > SEGMENT_RETRIES or (cancel is not None and cancel.is_set()):
+                    logger.error(f"❌ Segment {index + 1}/{len(segments)} failed: {e}")
+                    return {
+                        "error": f"Segment {index + 1}/{len(segments)} failed: {e}",
+                        "segments": results,
+                        "input_cache": cache_stats,
+                        "timings": {"phases": timer.phases},
+                    }
+                logger.warning(f"Segment {index + 1}/{len(segments)} failed (attempt {attempt}), retrying: {e}")
+
+        video_path = next(path for node_paths in collector.paths.values() for path in node_paths)
+        video_paths.append(video_path)
+        delivered = {key: output[key] for key in ("video_url", "video_path") if key in output}
+        results.append({
+            **(delivered if plan.output_mode != "local" else {}),
+            "start": round(start, 3),
+            "end": round(end, 3),
+            "attempts": attempt,
+        })
+        try:
+            runpod.serverless.progress_update(job, {"segment": index + 1, "segments": len(segments), **results[-1]})
+        except Exception as e:
+            logger.warning(f"Progress update failed: {e}")
+        if index + 1 < len(segments):
+            start_image = extract_last_frame(video_path, workspace.path(f"segment_{index}_last.png", "image"))
+
+    with timer.phase("stitch"):
+        if len(video_paths) > 1:
+            stitched = concat_videos(video_paths, workspace.path("stitched.mp4", "video"))
+            delivered = deliver_video(stitched, output_mode)
+        elif output_mode == "base64":
+            delivered = deliver_video(video_paths[0], output_mode)
+    return {**delivered, "segments": results, "input_cache": cache_stats, "timings": {"phases": timer.phases}}
+
+def render_plan(plan):
+    """render_job() on the least loaded ComfyUI instance (synchronous callers)"""
+    session = comfy_pool.acquire()
+    try:
+        return render_job(plan, session)
+    finally:
+        comfy_pool.release(session)
+
+def handler(job):
+    """Synchronous handler: one job at a time, start to finish"""
+    try:
+        if wants_segments(job.get("input", {})):
+            return run_segmented(job, render_plan)
+        if "items" in job.get("input", {}):
+            timer = PhaseTimer()
+            with timer.phase("prepare"):
+                plans, errors, cache_stats, workspace = prepare_batch(job)
+            try:
+                session = comfy_pool.acquire()
+                try:
+                    collectors = render_batch(plans, timer, session)
+                finally:
+                    comfy_pool.release(session)
+                return finish_batch(plans, errors, collectors, cache_stats, timer)
+            finally:
+                cleanup_workspaces(plans, workspace)
+        plan = prepare_job(job)
+    except JobError as e:
+        return {"error": str(e)}
+    try:
+        if plan.cached_result is not None:
+            return finish_cached_job(plan)
+        return finish_job(plan, render_plan(plan))
+    finally:
+        plan.workspace.cleanup()
+
+async def render_until_cancelled(plans, render, *args):
+    """Run render(*args) in a thread; if this task is cancelled, stop the render first.
+
+    The render thread owns the ComfyUI socket, so the GPU slot is only given
+    up once it has interrupted its prompts and returned.
+    """
+    task = asyncio.ensure_future(asyncio.to_thread(render, *args))
+    try:
+        return await asyncio.shield(task)
+    except asyncio.CancelledError:
+        for plan in plans:
+            if plan is not None:
+                plan.cancel.set()
+        try:
+            await task
+        except Exception:
+            pass
+        raise
+
+def discard_prepared(task):
+    """Done callback: remove the workspaces of a prepare_job()/prepare_batch() result nobody will use"""
+    if task.cancelled() or task.exception() is not None:
+        return  # prepare_job() already removed its workspace
+    result = task.result()
+    if isinstance(result, JobPlan):
+        result.workspace.cleanup()
+    else:
+        plans, errors, cache_stats, workspace = result
+        cleanup_workspaces(plans, workspace)
+
+async def prepare_until_cancelled(prepare, job):
+    """Run prepare(job) in a thread; if this task is cancelled, clean up after it.
+
+    The thread cannot be stopped mid-download, so the workspaces it created
+    are removed once it returns instead of staying active forever.
+    """
+    task = asyncio.ensure_future(asyncio.to_thread(prepare, job))
+    try:
+        return await asyncio.shield(task)
+    except asyncio.CancelledError:
+        task.add_done_callback(discard_prepared)
+        raise
+
+async def render_on_instance(plans, render, *args):
+    """Run the GPU stage on the least loaded ComfyUI instance, once its slot is free"""
+    session = await asyncio.to_thread(comfy_pool.acquire)
+    try:
+        async with comfy_pool.slots[session]:
+            return await render_until_cancelled(plans, render, *args, session)
+    finally:
+        comfy_pool.release(session)
+
+async def async_handler(job):
+    """Concurrent handler.
+
+    Input fetching and probing for the next job run while the current job
+    renders, and uploads overlap the next render. Only render_job() holds an
+    instance's GPU slot, so no ComfyUI ever has more than one of our prompts
+    queued; with several instances, jobs render on them in parallel.
+    """
+    try:
+        if wants_segments(job.get("input", {})):
+            # Segments run in a thread; each one is rendered through the event loop
+            loop = asyncio.get_running_loop()
+            cancel = threading.Event()
+
+            def render(plan):
+                future = asyncio.run_coroutine_threadsafe(render_on_instance([plan], render_job, plan), loop)
+                return future.result()
+            try:
+                return await asyncio.to_thread(run_segmented, job, render, cancel)
+            except asyncio.CancelledError:
+                cancel.set()
+                raise
+        if "items" in job.get("input", {}):
+            timer = PhaseTimer()
+            with timer.phase("prepare"):
+                plans, errors, cache_stats, workspace = await prepare_until_cancelled(prepare_batch, job)
+            try:
+                collectors = await render_on_instance(plans, render_batch, plans, timer)
+                return await asyncio.to_thread(finish_batch, plans, errors, collectors, cache_stats, timer)
+            finally:
+                cleanup_workspaces(plans, workspace)
+        plan = await prepare_until_cancelled(prepare_job, job)
+    except JobError as e:
+        return {"error": str(e)}
+    try:
+        if plan.cached_result is not None:
+            return finish_cached_job(plan)
+        collector = await render_on_instance([plan], render_job, plan)
+        return await asyncio.to_thread(finish_job, plan, collector)
+    finally:
+        plan.workspace.cleanup()
+
+def concurrency_modifier(current_concurrency):
+    """Tell RunPod how many jobs this worker may hold at once"""
+    healthy = sum(1 for session in comfy_pool.sessions if session.healthy)
+    return MAX_CONCURRENCY * max(1, healthy)
+
+# Cold-start breakdown, handed to the first job that asks for it
+_cold_start = {"report": None}
+_cold_start_lock = threading.Lock()
+
+def take_cold_start():
+    with _cold_start_lock:
+        report, _cold_start["report"] = _cold_start["report"], None
+    return report
+
+# Node classes whose time in the warm-up render counts as model loading
+MODEL_LOADER_CLASS_TYPES = (
+    "WanVideoModelLoader", "MultiTalkModelLoader", "WanVideoLoraSelect", "WanVideoVAELoader",
+    "CLIPVisionLoader", "Wav2VecModelLoader", "DownloadAndLoadWav2VecModel", "MelBandRoFormerModelLoader",
+    "WanVideoTextEncodeCached",  # loads umt5 unless the embedding is on disk
+)
+
+def warm_up(session=None):
+    """Render one frame window of examples/ and return where its time went.
+
+    The job has the default shape and goes through the same bucketing and
+    memory planning as a job that sets no width/height, so torch.compile
+    specializes on, and WanVideoBlockSwap is loaded with, what that job
+    uses. Outputs are deleted. The first sampler step, less an average later
+    step, approximates the compile time.
+    """
+    template = get_workflow_template("image", "single")
+    plan = prepare_job({"id": "warmup", "input": {
+        "image_path": os.path.join(EXAMPLES_DIR, "image.jpg"),
+        "wav_path": os.path.join(EXAMPLES_DIR, "audio.mp3"),
+        "prompt": "a person is talking",
+        "width": DEFAULT_WIDTH,
+        "height": DEFAULT_HEIGHT,
+        "max_frame": template.frame_window_size,
+        "steps": WARMUP_STEPS,
+        "silence_aware": False,
+        "use_result_cache": False,
+    }})
+    apply_memory_plan(plan, session)
+    profiler = ExecutionProfiler(plan.prompt)
+    started = time.perf_counter()
+    try:
+        collector = run_prompts([(plan.prompt, [profiler])], plan.timer, output_mode="local", session=session)[0]
+        if isinstance(collector, Exception):
+            raise collector
+        plan.workspace.track(*(path for paths in collector.paths.values() for path in paths))
+        if collector.error:
+            raise Exception(f"ComfyUI execution failed: {collector.error}")
+    finally:
+        plan.workspace.cleanup()
+
+    model_load = sum(
+        seconds for node_id, seconds in profiler.node_seconds.items()
+        if profiler.class_types.get(node_id) in MODEL_LOADER_CLASS_TYPES
+    )
+    breakdown = {
+        "warmup_seconds": round(time.perf_counter() - started, 3),
+        "model_load_seconds": round(model_load, 3),
+    }
+    sampler = next((n for n, t in profiler.class_types.items() if t == "WanVideoSampler"), None)
+    samples = profiler.steps.get(sampler, [])
+    if sampler in profiler.node_started and len(samples) >= 2:
+        first_step = samples[0][0] - profiler.node_started[sampler]
+        later_step = (samples[-1][0] - samples[0][0]) / (len(samples) - 1)
+        breakdown["first_compile_seconds"] = round(max(0.0, first_step - later_step), 3)
+    return breakdown
+
+def boot_instance(session, boot_time, warmup):
+    """Wait for one ComfyUI instance and warm it up; returns its cold-start breakdown"""
+    session.wait_ready()
+    report = {"comfyui_boot_seconds": round(time.time() - boot_time, 3)}
+    if warmup:
+        try:
+            report.update(warm_up(session))
+        except Exception as e:
+            logger.error(f"❌ Warm-up failed on {session.base_url}, the first job will load the models: {e}")
+            report["warmup_error"] = str(e)
+    return report
+
+def boot(warmup=WARMUP):
+    """Wait for ComfyUI, optionally warm it up, and record the cold-start breakdown.
+
+    Instances boot and warm up in parallel. One that never reports ready is
+    drained; the worker only fails if none does. entrypoint.sh exports
+    BOOT_TIME (container start) and HANDLER_START (just before python
+    handler.py), both as Unix timestamps.
+    """
+    boot_time = float(os.getenv('BOOT_TIME') or handler_started)
+    report = {"handler_import_seconds": round(handler_imported - float(os.getenv('HANDLER_START') or handler_started), 3)}
+    with ThreadPoolExecutor(max_workers=len(comfy_pool.sessions)) as pool:
+        futures = [pool.submit(boot_instance, session, boot_time, warmup) for session in comfy_pool.sessions]
+    instances = []
+    for session, future in zip(comfy_pool.sessions, futures):
+        try:
+            instances.append(future.result())
+        except Exception as e:
+            logger.error(f"❌ Draining ComfyUI at {session.base_url}: {e}")
+            session.healthy = False
+            session.start_health_check()  # rejoins the pool if it comes up later
+    if not instances:
+        raise Exception("No ComfyUI instance became ready")
+    report.update(instances[0])
+    if len(comfy_pool.sessions) > 1:
+        report["instances"] = {"ready": len(instances), "total": len(comfy_pool.sessions)}
+    report["ready_seconds"] = round(time.time() - boot_time, 3)
+    logger.info(f"Cold start: {report}")
+    with _cold_start_lock:
+        _cold_start["report"] = report
+    return report
+
+handler_imported = time.time()
+
+def write_sweep_metrics(result):
+    if result["files"]:
+        write_metrics({"timestamp": time.time(), "sweep": result, "disk": reclaim_stats.report()})
+
+if __name__ == "__main__":
+    boot()
+    start_sweeper(on_sweep=write_sweep_metrics)
+    runpod.serverless.start({"handler": async_handler, "concurrency_modifier": concurrency_modifier})
\ No newline at end of file
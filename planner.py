@@ -0,0 +1,117 @@
+"""VRAM planner for WanVideoBlockSwap and VAE tiling.
+
+The templates hardcode blocks_to_swap=20 and untiled VAE decoding whatever the
+GPU and job shape. This module estimates what a job needs from its resolution
+and frame window and picks the smallest swap depth, a prefetch depth and VAE
+tiling that fit a VRAM budget. plan_memory() is a pure function of the shape
+and the VRAM figure, so it can be exercised with made-up numbers; the budget
+comes from VRAM_GB or nvidia-smi at runtime.
+"""
+import os
+import math
+import logging
+import subprocess
+
+logger = logging.getLogger(__name__)
+
+# VRAM budget. VRAM_GB overrides detection (e.g. when nvidia-smi is unavailable)
+VRAM_GB = os.getenv('VRAM_GB')
+VRAM_RESERVE_GB = float(os.getenv('VRAM_RESERVE_GB', '1.5'))  # CUDA context, allocator slack
+
+# Cost model for Wan2.1 I2V 14B Q8 + InfiniteTalk Q8 (40 transformer blocks).
+# Calibrated so the default job, 848x480 x 81 frames, on a 24 GB card (nvidia-smi
+# reports 24564 MiB) gets the templates' settings: 20 swapped blocks, 1 prefetched.
+# Other shapes and cards are extrapolated and not yet measured.
+MODEL_BLOCKS = 40
+BLOCK_GB = float(os.getenv('PLANNER_BLOCK_GB', '0.45'))  # one block with its InfiniteTalk audio layers
+RESIDENT_GB = float(os.getenv('PLANNER_RESIDENT_GB', '2.5'))  # embeddings, head, LoRA, text/clip embeds
+ACTIVATION_GB_PER_KTOKEN = float(os.getenv('PLANNER_ACTIVATION_GB_PER_KTOKEN', '0.29'))
+VAE_GB_PER_MPIXEL = float(os.getenv('PLANNER_VAE_GB_PER_MPIXEL', '12'))  # untiled decode, per frame megapixel
+VAE_WEIGHTS_GB = 0.25
+MAX_PREFETCH_BLOCKS = int(os.getenv('PLANNER_MAX_PREFETCH_BLOCKS', '1'))
+
+# blocks_to_swap is rounded up to this step. Changing it reloads the model in
+# ComfyUI, so neighbouring shapes should share a plan.
+SWAP_STEP = int(os.getenv('PLANNER_SWAP_STEP', '5'))
+
+_detected_vram = {}
+
+
+def detect_vram_gb(gpu_index=0):
+    """Total memory of a GPU in GB from VRAM_GB or nvidia-smi; None if unknown"""
+    if VRAM_GB:
+        return float(VRAM_GB)
+    if gpu_index not in _detected_vram:
+        try:
+            result = subprocess.run([
+                'nvidia-smi', f'--id={gpu_index}', '--query-gpu=memory.total', '--format=csv,noheader,nounits'
+            ], capture_output=True, text=True, timeout=10)
+            _detected_vram[gpu_index] = float(result.stdout.strip().splitlines()[0]) / 1024 if result.returncode == 0 else None
+        except (OSError, subprocess.TimeoutExpired, ValueError, IndexError) as e:
+            logger.warning(f"Could not query GPU memory: {e}")
+            _detected_vram[gpu_index] = None
+    return _detected_vram[gpu_index]
+
+
+def latent_tokens(width, height, window):
+    """Transformer tokens per sampling window (VAE 8x spatial, 2x2 patches, 4x temporal)"""
+    return (width // 16) * (height // 16) * ((window - 1) // 4 + 1)
+
+
+def estimate_memory(width, height, window):
+    """Estimated GB for each part of a job, before any block swapping"""
+    return {
+        "blocks": MODEL_BLOCKS * BLOCK_GB,
+        "resident": RESIDENT_GB,
+        "activations": latent_tokens(width, height, window) / 1000 * ACTIVATION_GB_PER_KTOKEN,
+        "vae_decode": width * height / 1e6 * VAE_GB_PER_MPIXEL + VAE_WEIGHTS_GB,
+    }
+
+
+def plan_memory(width, height, window, vram_gb):
+    """Choose blocks_to_swap, prefetch_blocks and VAE tiling for a job.
+
+    Returns a dict with those three values, the estimate and the budget it was
+    planned against. fits is False when even swapping every block leaves the
+    estimate above the budget.
+    """
+    budget = vram_gb - VRAM_RESERVE_GB
+    estimate = estimate_memory(width, height, window)
+    room = budget - estimate["resident"] - estimate["activations"]
+
+    blocks_to_swap = 0
+    prefetch_blocks = 0
+    if room < estimate["blocks"]:
+        # Swapped blocks still need a landing slot on the GPU for each prefetched block
+        blocks_to_swap = MODEL_BLOCKS - max(0, math.floor((room - BLOCK_GB) / BLOCK_GB))
+        blocks_to_swap = min(MODEL_BLOCKS, math.ceil(blocks_to_swap / SWAP_STEP) * SWAP_STEP)
+        spare = room - (MODEL_BLOCKS - blocks_to_swap) * BLOCK_GB
+        prefetch_blocks = max(1, min(MAX_PREFETCH_BLOCKS, math.floor(spare / BLOCK_GB)))
+
+    fits = room >= (MODEL_BLOCKS - blocks_to_swap + prefetch_blocks) * BLOCK_GB
+    # The sampler offloads the model (force_offload) before decoding
+    vae_tiling = not fits or estimate["vae_decode"] > budget - estimate["resident"]
+
+    return {
+        "blocks_to_swap": blocks_to_swap,
+        "prefetch_blocks": prefetch_blocks,
+        "vae_tiling": vae_tiling,
+        "fits": fits,
+        "vram_gb": round(vram_gb, 1),
+        "estimate_gb": {name: round(value, 2) for name, value in estimate.items()},
+    }
+
+
+def plan_for_job(width, height, window, gpu_index=0):
+    """plan_memory() against the detected VRAM; None keeps the workflow defaults"""
+    vram_gb = detect_vram_gb(gpu_index)
+    if vram_gb is None:
+        return None
+    plan = plan_memory(width, height, window, vram_gb)
+    logger.info(
+        f"🧮 Memory plan for {width}x{height}x{window} on {plan['vram_gb']} GB: "
+        f"blocks_to_swap={plan['blocks_to_swap']}, prefetch={plan['prefetch_blocks']}, vae_tiling={plan['vae_tiling']}"
+    )
+    if not plan["fits"]:
+        logger.warning(f"Job {width}x{height}x{window} may not fit in {plan['vram_gb']} GB even with every block swapped")
+    return plan
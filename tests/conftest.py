@@ -0,0 +1,103 @@
+"""Shared fixtures: handler.py against scratch directories and the fakes in benchmarks/fakes.py.
+
+handler reads its configuration at import time, so the environment is set up
+here, before any test module imports it. Caches, workspaces and outputs go to
+a temporary directory that is removed after the session.
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [REPO_DIR, os.path.join(REPO_DIR, "benchmarks")]
+
+SCRATCH_DIR = tempfile.mkdtemp(prefix="infinitetalk_tests_")
+os.environ.update({
+    "METRICS_PATH": "",
+    "RESULT_CACHE_TTL": "0",
+    "RESULT_CACHE_PATH": os.path.join(SCRATCH_DIR, "results.sqlite"),
+    "INPUT_CACHE_DIR": os.path.join(SCRATCH_DIR, "cache", "inputs"),
+    "MEDIA_STORE_DIR": os.path.join(SCRATCH_DIR, "cache", "media"),
+    "PREPROCESS_CACHE_DIR": os.path.join(SCRATCH_DIR, "cache", "preprocessed"),
+    "TEXT_EMBED_CACHE_DIR": os.path.join(SCRATCH_DIR, "cache", "text_embeds"),
+    "WORKSPACE_DIR": os.path.join(SCRATCH_DIR, "workspaces"),
+    "WORKSPACE_TMPFS_DIR": "",
+    "OUTPUT_DIR": os.path.join(SCRATCH_DIR, "outputs"),
+    "SUPABASE_SERVICE_ROLE_KEY": "test",
+    "COMFYUI_HEALTH_INTERVAL": "0",  # no background health threads
+    "PREPROCESS_INPUTS": "false",  # keeps ffmpeg out of the handler tests
+})
+
+from fakes import FakeComfyUI, FakeStorage  # noqa: E402
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(SCRATCH_DIR, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def handler():
+    import handler
+    return handler
+
+
+@pytest.fixture
+def output_video(tmp_path):
+    """Stand-in for the MP4 VHS_VideoCombine writes; nothing decodes it"""
+    path = tmp_path / "rendered.mp4"
+    path.write_bytes(os.urandom(64 * 1024))
+    return str(path)
+
+
+@pytest.fixture
+def comfyui(tmp_path, output_video):
+    fake = FakeComfyUI(output_video, str(tmp_path / "comfyui" / "temp"), render_seconds=0.2)
+    yield fake
+    fake.close()
+
+
+@pytest.fixture
+def session(handler, comfyui):
+    session = handler.ComfySession("127.0.0.1", comfyui.port)
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def storage(handler, tmp_path, monkeypatch):
+    fake = FakeStorage(str(tmp_path / "inputs"))
+    monkeypatch.setattr(handler, "storage_backend", handler.SupabaseStorage(url=fake.url, key="test"))
+    yield fake
+    fake.close()
+
+
+@pytest.fixture
+def make_prompt(handler):
+    """make_prompt(seed) -> the I2V single prompt; a new seed makes the fake re-run the sampler"""
+    template = handler.get_workflow_template("image", "single")
+
+    def make(seed=0):
+        return template.instantiate({"seed": seed})
+    return make
+
+
+@pytest.fixture
+def pool(handler, session, monkeypatch):
+    """Route handler() and async_handler() jobs to the fake ComfyUI"""
+    pool = handler.ComfyPool([session])
+    monkeypatch.setattr(handler, "comfy_pool", pool)
+    return pool
+
+
+@pytest.fixture
+def job_input():
+    """Input of a short I2V job on the bundled examples (no ffmpeg needed)"""
+    return {
+        "image_path": os.path.join(REPO_DIR, "examples", "image.jpg"),
+        "wav_path": os.path.join(REPO_DIR, "examples", "audio.mp3"),
+        "max_frame": 81,
+        "output_mode": "path",
+    }
@@ -0,0 +1,65 @@
+"""probe_audio_duration(): durations read from WAV, FLAC and MP3 headers.
+
+The MP3 and FLAC fixtures are 1.5 s tones (silence for FLAC) made with ffmpeg:
+  cbr.mp3       MPEG-1 44.1 kHz mono, 32 kbit/s CBR without a Xing header,
+                with ID3v2 and ID3v1 tags; 59 frames
+  vbr_xing.mp3  MPEG-1 44.1 kHz mono, LAME -q:a 9 VBR with a Xing header
+  mpeg2.mp3     MPEG-2 16 kHz mono, 16 kbit/s CBR; 44 frames of 576 samples
+  silence.flac  8 kHz mono, STREAMINFO followed by padding
+"""
+import os
+import struct
+import wave
+
+import pytest
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+@pytest.mark.parametrize("name, duration", [
+    ("cbr.mp3", 59 * 1152 / 44100),  # the ID3v1 tag is not counted as audio
+    ("vbr_xing.mp3", 59 * 1152 / 44100),  # frame count from the Xing header, not the first frame's bitrate
+    ("mpeg2.mp3", 44 * 576 / 16000),
+    ("silence.flac", 1.5),
+])
+def test_fixture_durations(handler, name, duration):
+    assert handler.probe_audio_duration(os.path.join(FIXTURES, name)) == pytest.approx(duration, abs=0.005)
+
+
+def write_wav(path, seconds, sample_rate=16000, channels=2):
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(channels)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(b"\0" * int(seconds * sample_rate) * channels * 2)
+    return path
+
+
+def test_wav_duration(handler, tmp_path):
+    assert handler.probe_audio_duration(str(write_wav(tmp_path / "a.wav", 2.25))) == pytest.approx(2.25)
+
+
+def test_wav_chunks_before_data_are_skipped(handler, tmp_path):
+    path = write_wav(tmp_path / "a.wav", 1.0)
+    data = path.read_bytes()
+    # An odd-sized LIST chunk (padded to even) between fmt and data
+    extra = b"LIST" + struct.pack("<I", 5) + b"INFO!" + b"\0"
+    data = data[:36] + extra + data[36:]
+    path.write_bytes(data[:4] + struct.pack("<I", len(data) - 8) + data[8:])
+
+    assert handler.probe_audio_duration(str(path)) == pytest.approx(1.0)
+
+
+def test_streamed_wav_uses_the_file_size(handler, tmp_path):
+    path = write_wav(tmp_path / "a.wav", 1.5)
+    data = bytearray(path.read_bytes())
+    data[40:44] = struct.pack("<I", 0xFFFFFFFF)  # data chunk size unknown when the writer started
+    path.write_bytes(bytes(data))
+
+    assert handler.probe_audio_duration(str(path)) == pytest.approx(1.5)
+
+
+def test_unknown_format_is_left_to_ffprobe(handler, tmp_path):
+    path = tmp_path / "a.ogg"
+    path.write_bytes(b"OggS" + os.urandom(1024))
+    assert handler.probe_audio_duration(str(path)) is None
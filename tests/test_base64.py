@@ -0,0 +1,61 @@
+"""Base64 in both directions: chunked input decoding and the "base64" output mode."""
+import base64
+import os
+
+import pytest
+
+SIZE = 3 * 1024 + 2  # spans several chunks and ends in padding
+
+
+@pytest.fixture
+def payload(tmp_path):
+    data = os.urandom(SIZE)
+    path = tmp_path / "video.mp4"
+    path.write_bytes(data)
+    return data, str(path)
+
+
+def test_chunks_join_into_the_base64_of_the_file(handler, payload):
+    data, path = payload
+    assert handler.encode_file_base64(path, chunk_bytes=300) == base64.b64encode(data).decode("ascii")
+
+
+def test_decoding_in_chunks_restores_the_file(handler, payload, tmp_path, monkeypatch):
+    data, path = payload
+    monkeypatch.setattr(handler, "BASE64_CHUNK_CHARS", 400)
+    encoded = handler.encode_file_base64(path, chunk_bytes=300)
+    wrapped = "\n".join(encoded[i:i + 76] for i in range(0, len(encoded), 76))  # line breaks shift the groups
+
+    for text in (encoded, wrapped, "data:video/mp4;base64," + encoded):
+        saved = handler.save_base64_to_file(text, str(tmp_path / "decoded"), "input.mp4")
+        with open(saved, "rb") as f:
+            assert f.read() == data
+
+
+@pytest.mark.parametrize("text, message", [
+    ("QUJD" * 200 + "!!!!", "Base64 decoding failed"),
+    ("QUJDR", "Base64 decoding failed"),
+    ("QUJD" * 1000, "Base64 input too large"),
+])
+def test_bad_payloads_are_rejected_without_leftovers(handler, tmp_path, text, message):
+    with pytest.raises(Exception, match=message):
+        handler.save_base64_to_file(text, str(tmp_path), "input.mp4", max_bytes=1024)
+    assert os.listdir(tmp_path) == []
+
+
+def test_base64_output_is_one_string(handler, payload):
+    data, path = payload
+    assert handler.deliver_video(path, "base64") == {"video_base64": base64.b64encode(data).decode("ascii")}
+
+
+def test_large_output_is_not_returned_inline(handler, payload, monkeypatch):
+    data, path = payload
+    monkeypatch.setattr(handler, "OUTPUT_BASE64_MAX_BYTES", SIZE - 1)
+    monkeypatch.setattr(handler, "OUTPUT_BASE64_OVERFLOW", "path")
+    monkeypatch.setattr(handler, "encode_file_base64", lambda *args: pytest.fail("the output was encoded"))
+
+    delivered = handler.deliver_video(path, "base64")
+
+    assert list(delivered) == ["video_path"]
+    with open(delivered["video_path"], "rb") as f:
+        assert f.read() == data
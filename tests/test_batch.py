@@ -0,0 +1,30 @@
+"""Batch jobs: items are validated one by one and fail on their own."""
+import pytest
+
+
+def test_items_inherit_the_batch_input(handler):
+    _, item_jobs = handler.split_batch({"id": "batch", "input": {
+        "image_url": "https://example.com/a.jpg",
+        "wav_url": "https://example.com/shared.wav",
+        "prompt": "shared",
+        "items": [{"wav_path": "/tmp/a.wav"}, {"prompt": "own"}],
+    }})
+
+    assert "wav_url" not in item_jobs[0]["input"] and item_jobs[0]["input"]["wav_path"] == "/tmp/a.wav"
+    assert item_jobs[1]["input"]["wav_url"] == "https://example.com/shared.wav"
+    assert item_jobs[1]["input"]["prompt"] == "own"
+
+
+@pytest.mark.parametrize("items", [[], {"wav_path": "/tmp/a.wav"}, None])
+def test_items_must_be_a_non_empty_list(handler, items):
+    with pytest.raises(handler.JobError):
+        handler.split_batch({"input": {"items": items}})
+
+
+def test_non_object_item_is_that_items_error(handler, pool, job_input):
+    result = handler.handler({"id": "batch", "input": dict(job_input, items=[{"seed": 1}, "input.wav", ["x"]])})
+
+    first, second, third = result["items"]
+    assert first["video_path"].endswith(".mp4")
+    assert second == {"error": "Item 2 must be an object, got str"}
+    assert third == {"error": "Item 3 must be an object, got list"}
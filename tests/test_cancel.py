@@ -0,0 +1,134 @@
+"""Deadlines and cancellation interrupt the prompt and take it off the ComfyUI queue, and free what the job held."""
+import asyncio
+import os
+import threading
+import time
+
+import pytest
+
+import workspace
+
+
+@pytest.fixture
+def hung(comfyui):
+    """The fake's sampler takes a minute unless interrupted"""
+    comfyui.render_seconds, comfyui.steps = 60, 600
+    return comfyui
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not met in time"
+        time.sleep(0.02)
+
+
+class CancelOnProgress:
+    """Listener that sets an event when the sampler reports its first step"""
+
+    def __init__(self):
+        self.event = threading.Event()
+
+    def attach(self, prompt_id):
+        pass
+
+    def on_message(self, message):
+        if message["type"] == "progress":
+            self.event.set()
+
+
+def test_deadline_interrupts_the_running_prompt(handler, hung, session, make_prompt):
+    started = time.monotonic()
+    collector = handler.run_prompts(
+        [(make_prompt(), [])], output_mode="local", deadline=started + 0.5, session=session
+    )[0]
+
+    assert time.monotonic() - started < 5
+    assert collector.error == "Job exceeded its deadline; render interrupted"
+    with pytest.raises(Exception, match="deadline"):
+        collector.results()
+    assert hung.interrupts == 1
+    wait_until(lambda: session.queue_depth() == 0)
+    assert hung.history[collector.prompt_id]["status"]["completed"] is False
+
+
+def test_cancel_removes_pending_prompts_too(handler, hung, session, make_prompt):
+    listener = CancelOnProgress()
+    running, pending = handler.run_prompts(
+        [(make_prompt(0), [listener]), (make_prompt(1), [])],
+        output_mode="local", cancelled=listener.event.is_set, session=session,
+    )
+
+    assert running.error == pending.error == "Job cancelled; render interrupted"
+    wait_until(lambda: session.queue_depth() == 0)
+    assert hung.interrupts == 1
+    time.sleep(0.2)
+    assert pending.prompt_id not in hung.history  # deleted before it started
+
+
+def test_session_renders_normally_after_a_cancel(handler, hung, session, make_prompt):
+    handler.run_prompts([(make_prompt(0), [])], output_mode="local", deadline=time.monotonic() + 0.3, session=session)
+    hung.render_seconds, hung.steps = 0.2, 4
+
+    collector = handler.run_prompts([(make_prompt(1), [])], output_mode="local", session=session)[0]
+    assert collector.results()["131"]
+
+
+def test_cancelled_async_job_frees_the_instance(handler, hung, pool, job_input):
+    async def cancel_mid_render():
+        task = asyncio.ensure_future(handler.async_handler({"id": "cancelled", "input": job_input}))
+        while not hung.pending:
+            await asyncio.sleep(0.02)
+        await asyncio.sleep(0.3)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert not pool.slots[pool.sessions[0]].locked()
+
+    asyncio.run(cancel_mid_render())
+    assert hung.interrupts == 1
+    wait_until(lambda: not hung.pending)
+
+
+@pytest.mark.parametrize("batch", [False, True])
+def test_job_cancelled_while_preparing_leaves_no_workspace(handler, pool, job_input, monkeypatch, batch):
+    active_before = set(workspace._active)
+    prepared, release = threading.Event(), threading.Event()
+    build_plan = handler.build_plan
+
+    def slow_build_plan(*args):
+        plan = build_plan(*args)
+        prepared.set()
+        release.wait(5)  # e.g. a download still in flight
+        return plan
+    monkeypatch.setattr(handler, "build_plan", slow_build_plan)
+    job = {"id": "cancelled", "input": {"items": [job_input]} if batch else job_input}
+    created = set()
+
+    async def cancel_mid_prepare():
+        task = asyncio.ensure_future(handler.async_handler(job))
+        while not prepared.is_set():
+            await asyncio.sleep(0.02)
+        created.update(set(workspace._active) - active_before)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        release.set()
+        while set(workspace._active) != active_before:
+            await asyncio.sleep(0.02)
+
+    asyncio.run(asyncio.wait_for(cancel_mid_prepare(), 5))
+    assert created
+    assert not any(os.path.exists(os.path.join(workspace.WORKSPACE_DIR, name)) for name in created)
+
+
+@pytest.mark.parametrize("timeout", ["soon", [60], 0, -5, "nan"])
+def test_invalid_timeout_is_a_job_error(handler, pool, job_input, timeout):
+    result = handler.handler({"id": "bad-timeout", "input": dict(job_input, timeout=timeout)})
+    assert result["error"].startswith(f"Invalid timeout '{timeout}'")
+
+
+def test_timeout_input_sets_the_deadline(handler):
+    settings = {"max_frame": 81, "steps": 4, "width": 848, "height": 480}
+    assert handler.job_timeout({"timeout": "90"}, settings) == 90.0
+    assert handler.job_timeout({"timeout": None}, settings) >= handler.JOB_TIMEOUT_MIN
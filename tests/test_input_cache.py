@@ -0,0 +1,114 @@
+"""InputCache: one download per URL across threads and processes, revalidation and LRU eviction."""
+import hashlib
+import multiprocessing
+import os
+import threading
+
+import pytest
+
+
+@pytest.fixture
+def cache(handler, tmp_path):
+    return handler.InputCache(str(tmp_path / "cache"), 1024 ** 3)
+
+
+@pytest.fixture
+def media(storage):
+    """Write an input file FakeStorage serves; returns (path, url)"""
+    def write(name, data, mtime=None):
+        os.makedirs(storage.input_dir, exist_ok=True)
+        path = os.path.join(storage.input_dir, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+        return path, storage.input_url(name)
+    return write
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_concurrent_threads_download_once(cache, storage, media, tmp_path):
+    data = os.urandom(256 * 1024)
+    _, url = media("avatar.png", data)
+    barrier = threading.Barrier(8)
+
+    def fetch(index):
+        barrier.wait()
+        cache.fetch_url(url, str(tmp_path / f"job_{index}.png"), "image")
+    threads = [threading.Thread(target=fetch, args=(index,)) for index in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert storage.downloads == 1
+    assert cache.stats["misses"] == 1 and cache.stats["hits"] == 7
+    assert all(read(tmp_path / f"job_{index}.png") == data for index in range(8))
+
+
+def fetch_in_process(cache, url, dest):
+    cache.fetch_url(url, dest, "image")
+
+
+def test_concurrent_processes_download_once(cache, storage, media, tmp_path):
+    data = os.urandom(256 * 1024)
+    _, url = media("avatar.png", data)
+    context = multiprocessing.get_context("fork")
+    processes = [
+        context.Process(target=fetch_in_process, args=(cache, url, str(tmp_path / f"job_{index}.png")))
+        for index in range(4)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(30)
+
+    assert [process.exitcode for process in processes] == [0] * 4
+    assert storage.downloads == 1
+    assert storage.not_modified == 3
+    assert all(read(tmp_path / f"job_{index}.png") == data for index in range(4))
+
+
+@pytest.mark.parametrize("send_etag", [True, False], ids=["etag", "last-modified"])
+def test_entries_are_revalidated(cache, storage, media, tmp_path, send_etag):
+    storage.send_etag = send_etag
+    _, url = media("voice.wav", b"first", mtime=1_700_000_000)
+    cache.fetch_url(url, str(tmp_path / "first.wav"), "audio")
+    cache.fetch_url(url, str(tmp_path / "second.wav"), "audio")
+
+    assert storage.downloads == 1 and storage.not_modified == 1
+    assert read(tmp_path / "second.wav") == b"first"
+
+    media("voice.wav", b"second", mtime=1_700_000_100)
+    cache.fetch_url(url, str(tmp_path / "third.wav"), "audio")
+
+    assert storage.downloads == 2
+    assert read(tmp_path / "third.wav") == b"second"
+    assert cache.stats == {"hits": 1, "misses": 2, "evictions": 0}
+
+
+def test_least_recently_used_entry_is_evicted(handler, storage, media, tmp_path):
+    size = 64 * 1024
+    cache = handler.InputCache(str(tmp_path / "cache"), int(size * 2.5))
+    urls = {name: media(f"{name}.wav", os.urandom(size))[1] for name in "abc"}
+
+    cache.fetch_url(urls["a"], str(tmp_path / "a1.wav"), "audio")
+    cache.fetch_url(urls["b"], str(tmp_path / "b1.wav"), "audio")
+    # "a" is the older entry until it is used again, whatever the filesystem's mtime resolution
+    for name, mtime in (("a", 1), ("b", 2)):
+        data_path = cache._paths("url-" + hashlib.sha256(urls[name].encode()).hexdigest())[0]
+        os.utime(data_path, (mtime, mtime))
+    cache.fetch_url(urls["a"], str(tmp_path / "a2.wav"), "audio")
+    cache.fetch_url(urls["c"], str(tmp_path / "c1.wav"), "audio")
+
+    assert cache.stats["evictions"] == 1
+    assert len([name for name in os.listdir(cache.cache_dir) if name.endswith(".bin")]) == 2
+    downloads = storage.downloads
+    cache.fetch_url(urls["a"], str(tmp_path / "a3.wav"), "audio")
+    assert storage.downloads == downloads  # still cached
+    cache.fetch_url(urls["b"], str(tmp_path / "b2.wav"), "audio")
+    assert storage.downloads == downloads + 1  # evicted
@@ -0,0 +1,111 @@
+"""MediaStore and file_sha256: each input file is read once per job, and files live jobs use are not pruned."""
+import hashlib
+import os
+
+import pytest
+
+
+@pytest.fixture
+def sha256_calls(monkeypatch):
+    """Records every incremental hashlib.sha256() (the way file_sha256 reads files)"""
+    calls = []
+    sha256 = hashlib.sha256
+
+    def counting(*args):
+        if not args:
+            calls.append(args)
+        return sha256(*args)
+    monkeypatch.setattr(hashlib, "sha256", counting)
+    return calls
+
+
+def write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    return str(path)
+
+
+@pytest.mark.parametrize("hardlinks", [True, False])
+def test_fingerprinting_the_stored_copy_does_not_reread_it(handler, tmp_path, monkeypatch, sha256_calls, hardlinks):
+    if not hardlinks:
+        # Workspace on tmpfs, store on disk: link_or_copy() falls back to a copy
+        def link(src, dst):
+            raise OSError("cross-device link")
+        monkeypatch.setattr(os, "link", link)
+    store = handler.MediaStore(str(tmp_path / "media"), 1024 ** 3)
+    data = os.urandom(256 * 1024)
+
+    for job in range(3):
+        source = write(tmp_path / f"task_{job}" / "input_video.mp4", data)
+        stable_path = store.put(source)
+        assert handler.file_sha256(stable_path) == hashlib.sha256(data).hexdigest()
+        assert os.path.basename(stable_path) == hashlib.sha256(data).hexdigest() + ".mp4"
+        assert len(sha256_calls) == job + 1  # only the job's own source file is read
+
+
+def test_changed_file_is_hashed_again(handler, tmp_path, sha256_calls):
+    path = write(tmp_path / "audio.wav", b"first")
+    first = handler.file_sha256(path)
+    write(tmp_path / "audio.wav", b"second")
+
+    assert handler.file_sha256(path) != first
+    assert len(sha256_calls) == 2
+
+
+def age(path, seconds):
+    """Make path look last used seconds ago"""
+    st = os.stat(path)
+    os.utime(path, (st.st_atime - seconds, st.st_mtime - seconds))
+
+
+def test_files_of_live_jobs_are_not_pruned(handler, tmp_path):
+    size = 64 * 1024
+    store = handler.MediaStore(str(tmp_path / "media"), int(size * 2.5))
+    prepared = handler.Workspace()  # a job prepared ahead of its render
+    avatar = store.put(write(tmp_path / "a.png", os.urandom(size)), prepared)
+    age(avatar, 3600)
+
+    # Other jobs fill the store past its budget; the avatar is the oldest file
+    for name in "bcd":
+        age(store.put(write(tmp_path / f"{name}.wav", os.urandom(size))), 60)
+
+    assert os.path.exists(avatar)
+    assert len(store.entries()) == 2  # the avatar and the newest file
+
+    prepared.cleanup()
+    store.put(write(tmp_path / "e.wav", os.urandom(size)))
+    assert not os.path.exists(avatar)
+
+
+def test_a_file_shared_by_two_jobs_stays_pinned_until_both_end(handler, tmp_path):
+    store = handler.MediaStore(str(tmp_path / "media"), 1)
+    data = os.urandom(1024)
+    first, second = handler.Workspace(), handler.Workspace()
+    path = store.put(write(tmp_path / "first" / "a.png", data), first)
+    assert store.put(write(tmp_path / "second" / "a.png", data), second) == path
+
+    first.cleanup()
+    store.prune()
+    assert os.path.exists(path)
+    second.cleanup()
+    store.prune()
+    assert not os.path.exists(path)
+
+
+def test_a_new_file_survives_the_prune_it_triggers(handler, tmp_path):
+    store = handler.MediaStore(str(tmp_path / "media"), 1)
+    source = write(tmp_path / "a.png", os.urandom(1024))
+    age(source, 3600)  # hardlinked, the stored copy keeps the old mtime
+
+    assert os.path.exists(store.put(source))
+
+
+def test_pinning_a_removed_workspace_releases_at_once(handler, tmp_path):
+    store = handler.MediaStore(str(tmp_path / "media"), 1)
+    workspace = handler.Workspace()
+    workspace.cleanup()
+    path = store.put(write(tmp_path / "a.png", os.urandom(1024)), workspace)
+
+    store.prune()
+    assert not os.path.exists(path)
@@ -0,0 +1,36 @@
+"""OutputCollector: outputs are delivered while ComfyUI is still finishing the prompt."""
+import copy
+
+import pytest
+
+
+def test_upload_starts_before_the_prompt_ends(handler, comfyui, storage, session, make_prompt):
+    comfyui.tail_seconds = 0.5
+    collector = handler.run_prompts([(make_prompt(), [])], output_mode="url", session=session)[0]
+    videos = collector.results()
+
+    assert videos["131"][0]["video_url"].startswith(f"{storage.url}/storage/v1/object/public/")
+    assert len(storage.upload_times) == 1
+    assert storage.upload_times[0] < comfyui.finish_times[collector.prompt_id]
+
+
+def test_outputs_upload_concurrently(handler, comfyui, storage, session, make_prompt):
+    storage.upload_seconds = 0.5
+    prompt = make_prompt()
+    prompt["900"] = copy.deepcopy(prompt["131"])  # a second VHS_VideoCombine output
+
+    collector = handler.run_prompts([(prompt, [])], output_mode="url", session=session)[0]
+    videos = collector.results()
+
+    assert set(videos) == {"131", "900"}
+    first, second = sorted(storage.upload_times)
+    assert second - first < storage.upload_seconds
+
+
+def test_history_is_not_fetched_when_outputs_arrive_on_the_socket(handler, session, make_prompt, monkeypatch):
+    collector = handler.run_prompts([(make_prompt(), [])], output_mode="local", session=session)[0]
+
+    def get_history(*args):
+        pytest.fail("/history was fetched")
+    monkeypatch.setattr(handler, "get_history", get_history)
+    assert collector.results()["131"]
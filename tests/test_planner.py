@@ -0,0 +1,116 @@
+"""planner.plan_memory() with made-up VRAM figures, and VRAM detection with a mocked nvidia-smi."""
+import subprocess
+
+import pytest
+
+import planner
+
+NVIDIA_SMI_24GB = 24564 / 1024  # memory.total of a 24 GB card, in GB
+NVIDIA_SMI_32GB = 32607 / 1024
+
+
+@pytest.mark.parametrize("vram_gb", [24, NVIDIA_SMI_24GB])
+def test_default_job_on_24gb_matches_the_templates(vram_gb):
+    plan = planner.plan_memory(848, 480, 81, vram_gb)
+
+    # WanVideoBlockSwap (134) and WanVideoDecode (130) as the templates ship them
+    assert (plan["blocks_to_swap"], plan["prefetch_blocks"], plan["vae_tiling"]) == (20, 1, False)
+    assert plan["fits"]
+
+
+def test_swap_depth_falls_as_vram_grows():
+    depths = [planner.plan_memory(848, 480, 81, vram)["blocks_to_swap"] for vram in (16, NVIDIA_SMI_24GB, NVIDIA_SMI_32GB, 48)]
+    assert depths == sorted(depths, reverse=True)
+    assert depths[-1] == 0
+
+
+def test_swap_depth_grows_with_the_shape():
+    small, default, large = (planner.plan_memory(w, h, 81, 24)["blocks_to_swap"] for w, h in ((480, 480), (848, 480), (960, 544)))
+    assert small <= default <= large
+
+
+@pytest.mark.parametrize("width,height,vram_gb", [(480, 480, 16), (848, 480, 24), (960, 544, 24), (1280, 720, 32)])
+def test_plans_are_in_range_and_on_the_swap_grid(width, height, vram_gb):
+    plan = planner.plan_memory(width, height, 81, vram_gb)
+
+    assert 0 <= plan["blocks_to_swap"] <= planner.MODEL_BLOCKS
+    assert plan["blocks_to_swap"] % planner.SWAP_STEP == 0
+    assert 0 <= plan["prefetch_blocks"] <= planner.MAX_PREFETCH_BLOCKS
+    assert (plan["prefetch_blocks"] == 0) == (plan["blocks_to_swap"] == 0)
+
+
+def test_job_that_cannot_fit_swaps_everything_and_tiles_the_vae():
+    plan = planner.plan_memory(1280, 720, 81, 12)
+
+    assert not plan["fits"]
+    assert plan["blocks_to_swap"] == planner.MODEL_BLOCKS
+    assert plan["vae_tiling"]
+
+
+class NvidiaSmi:
+    def __init__(self, stdout="", returncode=0, error=None):
+        self.stdout, self.returncode, self.error = stdout, returncode, error
+        self.calls = 0
+
+    def __call__(self, *args, **kwargs):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        return subprocess.CompletedProcess(args, self.returncode, stdout=self.stdout, stderr="")
+
+
+@pytest.fixture
+def vram(monkeypatch):
+    monkeypatch.setattr(planner, "VRAM_GB", None)
+    monkeypatch.setattr(planner, "_detected_vram", {})
+
+    def mock(**kwargs):
+        nvidia_smi = NvidiaSmi(**kwargs)
+        monkeypatch.setattr(planner.subprocess, "run", nvidia_smi)
+        return nvidia_smi
+    return mock
+
+
+def test_vram_is_read_from_nvidia_smi_once(vram):
+    nvidia_smi = vram(stdout="24564\n")
+
+    assert planner.detect_vram_gb() == pytest.approx(NVIDIA_SMI_24GB)
+    assert planner.plan_for_job(848, 480, 81)["blocks_to_swap"] == 20
+    assert nvidia_smi.calls == 1
+
+
+@pytest.mark.parametrize("kwargs", [{"error": FileNotFoundError("nvidia-smi")}, {"returncode": 9}, {"stdout": ""}])
+def test_unknown_vram_keeps_the_workflow_defaults(vram, kwargs):
+    vram(**kwargs)
+
+    assert planner.detect_vram_gb() is None
+    assert planner.plan_for_job(848, 480, 81) is None
+
+
+def test_vram_gb_overrides_detection(vram, monkeypatch):
+    nvidia_smi = vram(stdout="24564\n")
+    monkeypatch.setattr(planner, "VRAM_GB", "32")
+
+    assert planner.detect_vram_gb() == 32
+    assert nvidia_smi.calls == 0
+
+
+def test_each_instance_is_planned_against_its_own_gpu(handler, comfyui, session, pool, job_input, vram, monkeypatch):
+    nvidia_smi = vram(stdout="24564\n")
+    sizes = {"--id=0": "24564\n", "--id=1": "49140\n"}  # instance 1 runs on a 48 GB card
+
+    def run(args, **kwargs):
+        nvidia_smi.stdout = next(size for flag, size in sizes.items() if flag in args)
+        return nvidia_smi(args, **kwargs)
+    monkeypatch.setattr(planner.subprocess, "run", run)
+    monkeypatch.setattr(handler, "MEMORY_PLANNER", True)
+    monkeypatch.setattr(session, "gpu_index", 1)
+
+    result = handler.handler({"id": "gpu1", "input": job_input})
+
+    assert "error" not in result
+    prompt = next(iter(comfyui.history.values()))["prompt"]
+    assert prompt["134"]["inputs"]["blocks_to_swap"] == 0  # 20 on the 24 GB card
+    assert result["memory_plan"]["gpu_index"] == 1
+    assert planner.detect_vram_gb(0) == pytest.approx(NVIDIA_SMI_24GB)
+    assert nvidia_smi.calls == 2
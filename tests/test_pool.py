@@ -0,0 +1,94 @@
+"""ComfyPool: jobs spread across live instances and a dead one is drained."""
+import asyncio
+import socket
+import time
+
+import pytest
+
+from fakes import FakeComfyUI
+
+
+def unused_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def instances(handler, tmp_path, output_video):
+    """Three fake ComfyUIs and a port nothing listens on, as sessions"""
+    fakes = [FakeComfyUI(output_video, str(tmp_path / f"comfyui_{i}"), render_seconds=0.5) for i in range(3)]
+    sessions = [handler.ComfySession("127.0.0.1", fake.port) for fake in fakes]
+    dead = handler.ComfySession("127.0.0.1", unused_port())
+    yield fakes, sessions, dead
+    for session in [*sessions, dead]:
+        session.close()
+    for fake in fakes:
+        fake.close()
+
+
+def test_dead_instance_is_drained_and_load_spread(handler, instances):
+    fakes, sessions, dead = instances
+    pool = handler.ComfyPool([dead, *sessions])
+    for session in pool.sessions:
+        session.healthy = True  # as if the dead one failed after its last health check
+
+    acquired = [pool.acquire() for _ in range(6)]
+
+    assert dead not in acquired and not dead.healthy
+    assert all(acquired.count(session) == 2 for session in sessions)
+    assert [entry["in_flight"] for entry in pool.status()] == [0, 2, 2, 2]
+    for session in acquired:
+        pool.release(session)
+    assert [entry["in_flight"] for entry in pool.status()] == [0, 0, 0, 0]
+
+
+def test_busy_instance_is_picked_last(handler, instances, make_prompt):
+    fakes, sessions, _ = instances
+    fakes[0].render_seconds = 5
+    other_client = handler.ComfySession("127.0.0.1", fakes[0].port)
+    try:
+        handler.queue_prompt(make_prompt(), session=other_client)  # someone else's render
+        for session in sessions:
+            session.check_health()
+        pool = handler.ComfyPool(sessions)
+
+        assert pool.acquire() is sessions[1]
+        assert pool.acquire() is sessions[2]
+    finally:
+        other_client.cancel([item[1] for item in other_client.get("/queue").json()["queue_running"]])
+        other_client.close()
+
+
+def test_drained_instance_rejoins_after_its_health_check(handler, instances):
+    _, sessions, dead = instances
+    pool = handler.ComfyPool([dead, sessions[0]])
+
+    assert pool.acquire() is sessions[0]  # nothing was healthy: every instance is probed
+    assert not dead.healthy
+    pool.release(sessions[0])
+
+
+def test_no_live_instance_is_an_error(handler, instances):
+    _, _, dead = instances
+    with pytest.raises(Exception, match="No healthy ComfyUI instance"):
+        handler.ComfyPool([dead]).acquire()
+
+
+def test_async_jobs_render_in_parallel_on_live_instances(handler, instances, job_input, monkeypatch):
+    fakes, sessions, dead = instances
+    pool = handler.ComfyPool([dead, *sessions[:2]])
+    monkeypatch.setattr(handler, "comfy_pool", pool)
+    jobs = [{"id": f"job-{i}", "input": dict(job_input, seed=i)} for i in range(4)]
+
+    async def run_all():
+        return await asyncio.gather(*(handler.async_handler(job) for job in jobs))
+
+    started = time.monotonic()
+    results = asyncio.run(run_all())
+    elapsed = time.monotonic() - started
+
+    assert all("video_path" in result for result in results)
+    assert [fake.prompts for fake in fakes] == [2, 2, 0]
+    assert elapsed < 4 * fakes[0].render_seconds  # two at a time, not one after another
+    assert not dead.healthy
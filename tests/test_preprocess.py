@@ -0,0 +1,105 @@
+"""Input normalization: already-normalized inputs are skipped, converted ones are cached by content."""
+import os
+import shutil
+import struct
+import wave
+
+import pytest
+from PIL import Image
+
+needs_ffmpeg = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg is not installed")
+
+
+def write_wav(path, sample_rate, channels=1, sample_width=2, seconds=0.1):
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(channels)
+        f.setsampwidth(sample_width)
+        f.setframerate(sample_rate)
+        f.writeframes(os.urandom(int(sample_rate * seconds) * channels * sample_width))
+    return str(path)
+
+
+def write_image(path, size, exif_orientation=None):
+    image = Image.frombytes("RGB", size, os.urandom(size[0] * size[1] * 3))
+    exif = Image.Exif()
+    if exif_orientation:
+        exif[0x0112] = exif_orientation
+    image.save(path, format="JPEG", exif=exif)
+    return str(path)
+
+
+def test_normalized_wav_is_recognized(handler, tmp_path):
+    rate = handler.AUDIO_SAMPLE_RATE
+    assert handler._is_normalized_wav(write_wav(tmp_path / "ok.wav", rate))
+    assert not handler._is_normalized_wav(write_wav(tmp_path / "stereo.wav", rate, channels=2))
+    assert not handler._is_normalized_wav(write_wav(tmp_path / "16k.wav", 16000))
+    assert not handler._is_normalized_wav(write_wav(tmp_path / "8bit.wav", rate, sample_width=1))
+    (tmp_path / "a.mp3").write_bytes(b"ID3" + os.urandom(64))
+    assert not handler._is_normalized_wav(str(tmp_path / "a.mp3"))
+
+
+def test_fmt_after_another_chunk_is_found(handler, tmp_path):
+    path = write_wav(tmp_path / "ok.wav", handler.AUDIO_SAMPLE_RATE)
+    with open(path, "rb") as f:
+        data = f.read()
+    extra = b"JUNK" + struct.pack("<I", 3) + b"abc\0"  # odd size, padded
+    with open(path, "wb") as f:
+        f.write(data[:12] + extra + data[12:])
+
+    assert handler._is_normalized_wav(path)
+
+
+def test_normalized_audio_is_passed_through(handler, tmp_path, monkeypatch):
+    def run(*args, **kwargs):
+        pytest.fail("ffmpeg was run")
+    monkeypatch.setattr(handler.subprocess, "run", run)
+    path = write_wav(tmp_path / "ok.wav", handler.AUDIO_SAMPLE_RATE)
+
+    assert handler.normalize_audio(path) == (path, "unchanged")
+
+
+@needs_ffmpeg
+def test_converted_audio_is_cached_by_content(handler, tmp_path):
+    first = write_wav(tmp_path / "first.wav", 16000, channels=2)
+    second = str(shutil.copyfile(first, tmp_path / "second.wav"))  # same audio, another job's path
+
+    converted, status = handler.normalize_audio(first)
+    assert status == "converted" and handler._is_normalized_wav(converted)
+    assert handler.normalize_audio(second) == (converted, "cached")
+
+
+def test_large_image_is_resized_to_cover_the_target(handler, tmp_path):
+    path = write_image(tmp_path / "avatar.jpg", (1600, 1200))
+    resized, status = handler.normalize_image(path, 480, 480)
+
+    assert status == "resized"
+    with Image.open(resized) as img:
+        assert img.size == (640, 480)  # aspect kept, nothing cropped
+
+
+def test_small_image_is_unchanged(handler, tmp_path):
+    path = write_image(tmp_path / "avatar.jpg", (400, 300))
+    assert handler.normalize_image(path, 848, 480) == (path, "unchanged")
+
+
+def test_exif_rotation_is_applied(handler, tmp_path):
+    path = write_image(tmp_path / "portrait.jpg", (1600, 1200), exif_orientation=6)
+    resized, _ = handler.normalize_image(path, 480, 848)
+
+    with Image.open(resized) as img:
+        assert img.size == (636, 848)
+
+
+def test_image_cache_is_keyed_by_content_and_target(handler, tmp_path):
+    first = write_image(tmp_path / "a.jpg", (1600, 1200))
+    copy = str(shutil.copyfile(first, tmp_path / "b.jpg"))
+
+    resized, _ = handler.normalize_image(first, 480, 480)
+    assert handler.normalize_image(copy, 480, 480) == (resized, "cached")
+
+    other, status = handler.normalize_image(copy, 640, 640)
+    assert status == "resized" and other != resized
+
+    write_image(tmp_path / "a.jpg", (1600, 1200))  # new content at the same path
+    changed, status = handler.normalize_image(first, 480, 480)
+    assert status == "resized" and changed != resized
@@ -0,0 +1,70 @@
+"""ExecutionProfiler: node timeline, cached nodes and step rates from the WebSocket stream."""
+import json
+
+import pytest
+
+
+def profile(handler, session, prompt):
+    profiler = handler.ExecutionProfiler(prompt)
+    collector = handler.run_prompts([(prompt, [profiler])], output_mode="local", session=session)[0]
+    collector.results()
+    return profiler, collector.prompt_id
+
+
+def test_timeline_follows_execution(handler, comfyui, session, make_prompt):
+    comfyui.render_seconds, comfyui.steps = 0.4, 5
+    profiler, _ = profile(handler, session, make_prompt())
+    report = profiler.report()
+
+    # Nodes run in id order in the fake, and the sampler takes the time
+    started = sorted(profiler.node_started, key=profiler.node_started.get)
+    assert started == sorted(profiler.class_types, key=int) + [None]
+    assert report["nodes"][0]["node"] == "128"
+    assert report["nodes"][0]["class_type"] == "WanVideoSampler"
+    assert report["nodes"][0]["seconds"] == pytest.approx(0.4, abs=0.15)
+    assert report["total_seconds"] >= report["nodes"][0]["seconds"]
+    assert report["cached"] == []
+
+
+def test_step_rate_of_the_sampler(handler, comfyui, session, make_prompt):
+    comfyui.render_seconds, comfyui.steps = 0.5, 5  # a step every 0.1 s
+    profiler, _ = profile(handler, session, make_prompt())
+
+    progress = profiler.report()["progress"]
+    assert list(progress) == ["128"]
+    assert progress["128"]["steps"] == 5
+    assert progress["128"]["steps_per_second"] == pytest.approx(10, rel=0.3)
+
+
+def test_cached_nodes_are_listed(handler, comfyui, session, make_prompt):
+    profile(handler, session, make_prompt(seed=0))
+    profiler, prompt_id = profile(handler, session, make_prompt(seed=1))
+    report = profiler.report()
+
+    cached = [entry["node"] for entry in report["cached"]]
+    assert cached == comfyui.cached[prompt_id]
+    assert cached and "128" not in cached  # the new seed re-runs the sampler and what follows
+    assert not set(cached) & {entry["node"] for entry in report["nodes"] if entry["node"] is not None}
+    assert all(entry["class_type"] == profiler.class_types[entry["node"]] for entry in report["cached"])
+
+
+def test_messages_of_other_prompts_are_ignored(handler, make_prompt):
+    profiler = handler.ExecutionProfiler(make_prompt(), prompt_id="mine")
+    profiler.on_message({"type": "executing", "data": {"node": "128", "prompt_id": "other"}})
+    profiler.on_message({"type": "execution_cached", "data": {"nodes": ["125"], "prompt_id": "other"}})
+
+    assert profiler.node_seconds == {} and profiler.cached == []
+
+
+def test_metrics_file_is_rotated(handler, tmp_path):
+    path = str(tmp_path / "metrics.jsonl")
+    for index in range(10):
+        handler.write_metrics({"job": index, "padding": "x" * 100}, path=path, max_bytes=500)
+
+    with open(path) as f:
+        current = [json.loads(line)["job"] for line in f]
+    with open(path + ".1") as f:
+        previous = [json.loads(line)["job"] for line in f]
+    assert previous + current == list(range(previous[0], 10))
+    assert len(previous) == 4 and len(current) == 2  # 4 lines of ~125 bytes pass 500
+    assert not (tmp_path / "metrics.jsonl.2").exists()
@@ -0,0 +1,165 @@
+"""Segmented rendering: where the audio is cut, which jobs are segmented, retries and stitching.
+
+voiced_frames(), trim_audio(), extract_last_frame() and concat_videos() are
+replaced in the handler tests, so only the stitching test needs ffmpeg.
+"""
+import os
+import re
+import shutil
+import subprocess
+
+import numpy as np
+import pytest
+
+FRAME = 0.02  # VAD frame, seconds
+needs_ffmpeg = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg is not installed")
+
+
+def voiced(seconds, *silences):
+    """Voiced mask of a track with silent (start, end) spans"""
+    mask = np.ones(int(round(seconds / FRAME)), dtype=bool)
+    for start, end in silences:
+        mask[int(round(start / FRAME)):int(round(end / FRAME))] = False
+    return mask
+
+
+@pytest.fixture
+def template(handler):
+    return handler.get_workflow_template("image", "single")
+
+
+def grid_seconds(handler, template, max_seconds):
+    """Longest frame-window grid length (seconds) within max_seconds"""
+    window, stride = template.frame_window_size, template.frame_window_size - template.motion_frame
+    return (window + int((max_seconds * handler.VIDEO_FPS - window) // stride) * stride) / handler.VIDEO_FPS
+
+
+def test_cut_snaps_to_the_middle_of_a_silence(handler, template):
+    cuts = handler.find_segment_cuts(voiced(70, (27.5, 28.5)), FRAME, 70, template, 30)
+    assert cuts == [pytest.approx(28.0)]  # the 42 s left fit in one segment
+
+
+def test_speech_without_silence_is_cut_on_the_window_grid(handler, template):
+    cuts = handler.find_segment_cuts(voiced(100), FRAME, 100, template, 30)
+
+    longest = grid_seconds(handler, template, 45)
+    assert cuts == [pytest.approx(longest), pytest.approx(2 * longest)]
+    frames = round(longest * handler.VIDEO_FPS)
+    assert handler.snap_frames(frames, template.frame_window_size, template.motion_frame) == frames
+
+
+def test_silence_too_early_or_short_is_not_used(handler, template):
+    # 5 s is under half the target; 0.1 s is under SEGMENT_MIN_GAP
+    cuts = handler.find_segment_cuts(voiced(60, (4.5, 5.5), (30.0, 30.1)), FRAME, 60, template, 30)
+    assert cuts == [pytest.approx(grid_seconds(handler, template, 45))]
+
+
+def test_short_tail_is_its_own_segment(handler, template):
+    cuts = handler.find_segment_cuts(voiced(46), FRAME, 46, template, 30)
+
+    assert len(cuts) == 1
+    assert 46 - cuts[0] < template.frame_window_size / handler.VIDEO_FPS  # shorter than one window
+
+
+def test_audio_within_one_segment_is_not_cut(handler, template):
+    assert handler.find_segment_cuts(voiced(45), FRAME, 45, template, 30) == []
+
+
+def test_only_image_jobs_are_segmented(handler):
+    assert handler.wants_segments({"segmented": True})
+    assert not handler.wants_segments({"segmented": True, "input_type": "video"})
+    assert not handler.wants_segments({"segmented": True, "items": []})
+    assert not handler.wants_segments({})
+
+
+@pytest.fixture
+def segmenting(handler, job_input, monkeypatch):
+    """Segmented job input over audio of track["duration"] seconds, silent at 28-29 s"""
+    track = {"duration": 70.0}
+    monkeypatch.setattr(handler, "voiced_frames", lambda path, frame_seconds=FRAME: (
+        voiced(track["duration"], (28.0, 29.0)), track["duration"]
+    ))
+    monkeypatch.setattr(handler, "trim_audio", lambda path, start, end, output_path: (
+        track.setdefault("trims", []).append((round(start, 3), round(end, 3))) or shutil.copyfile(path, output_path)
+    ))
+    monkeypatch.setattr(handler, "extract_last_frame", lambda video_path, output_path: job_input["image_path"])
+
+    def concat_videos(video_paths, output_path):
+        track["stitched"] = list(video_paths)
+        return shutil.copyfile(video_paths[0], output_path)
+    monkeypatch.setattr(handler, "concat_videos", concat_videos)
+    track["input"] = dict(job_input, segmented=True, segment_seconds=30)
+    return track
+
+
+def test_failed_segment_is_retried_on_its_own(handler, comfyui, pool, segmenting):
+    comfyui.sampler_faults = 1  # the first attempt at segment 1 fails
+
+    result = handler.handler({"id": "long", "input": segmenting["input"]})
+
+    assert "error" not in result
+    assert [(s["start"], s["end"], s["attempts"]) for s in result["segments"]] == [(0.0, 28.5, 2), (28.5, 70.0, 1)]
+    assert len(comfyui.history) == 3
+    assert len(segmenting["stitched"]) == 2
+    assert os.path.exists(result["video_path"])
+    # Segment 2 gets one frame of audio before its cut, for the frame concat_videos() drops
+    assert segmenting["trims"] == [(0.0, 28.5), (28.46, 70.0)]
+    prompts = [entry["prompt"] for entry in comfyui.history.values()]
+    assert prompts[2]["270"]["inputs"]["value"] == handler.snap_frames(1039, 81, 9)
+
+
+def test_segment_that_keeps_failing_returns_the_finished_ones(handler, comfyui, pool, segmenting, monkeypatch):
+    def progress_update(job, progress):
+        comfyui.sampler_faults = handler.SEGMENT_RETRIES + 1  # every attempt at segment 2 fails
+    monkeypatch.setattr(handler.runpod.serverless, "progress_update", progress_update)
+
+    result = handler.handler({"id": "long", "input": segmenting["input"]})
+
+    assert result["error"].startswith("Segment 2/2 failed")
+    assert [s["attempts"] for s in result["segments"]] == [1]
+    assert len(comfyui.history) == 2 + handler.SEGMENT_RETRIES
+    assert "stitched" not in segmenting
+
+
+def test_audio_that_fits_one_segment_renders_as_a_normal_job(handler, comfyui, pool, segmenting):
+    segmenting["duration"] = 40.0
+
+    result = handler.handler({"id": "short", "input": segmenting["input"]})
+
+    assert "error" not in result and "segments" not in result
+    assert len(comfyui.history) == 1
+    assert "trims" not in segmenting and "stitched" not in segmenting
+
+
+@pytest.mark.parametrize("value, message", [
+    ("long", "expected a number of seconds"),
+    (None, "expected a number of seconds"),
+    (0, "must be greater than 0"),
+    (-5, "must be greater than 0"),
+    ("inf", "must be greater than 0"),
+])
+def test_invalid_segment_seconds_is_a_job_error(handler, pool, segmenting, value, message):
+    result = handler.handler({"id": "bad", "input": dict(segmenting["input"], segment_seconds=value)})
+    assert result == {"error": f"Invalid segment_seconds '{value}': {message}"}
+
+
+def make_clip(path, frames, color):
+    subprocess.run([
+        "ffmpeg", "-v", "error", "-y", "-f", "lavfi", "-i", f"color=c={color}:s=64x64:r=25:d={frames / 25}",
+        "-f", "lavfi", "-i", f"sine=d={frames / 25}", "-c:v", "libx264", "-pix_fmt", "yuv420p", "-c:a", "aac",
+        "-shortest", str(path),
+    ], check=True)
+    return str(path)
+
+
+def count_frames(path):
+    result = subprocess.run(["ffmpeg", "-i", path, "-map", "0:v", "-f", "null", "-"], capture_output=True, text=True)
+    return int(re.findall(r"frame=\s*(\d+)", result.stderr)[-1])
+
+
+@needs_ffmpeg
+def test_stitching_drops_the_repeated_first_frames(handler, tmp_path):
+    clips = [make_clip(tmp_path / f"{index}.mp4", 10, color) for index, color in enumerate(["red", "green", "blue"])]
+    stitched = handler.concat_videos(clips, str(tmp_path / "stitched.mp4"))
+
+    assert count_frames(stitched) == 10 + 9 + 9
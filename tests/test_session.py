@@ -0,0 +1,55 @@
+"""ComfySession: one WebSocket and one pooled HTTP connection serve every job."""
+
+
+class DropOnProgress:
+    """Listener that cuts the WebSocket when the sampler reports its first step"""
+
+    def __init__(self, comfyui):
+        self.comfyui = comfyui
+        self.dropped = False
+
+    def attach(self, prompt_id):
+        pass
+
+    def on_message(self, message):
+        if message["type"] == "progress" and not self.dropped:
+            self.dropped = True
+            self.comfyui.drop_websockets()
+
+
+def run(handler, session, prompt, listeners=()):
+    collector = handler.run_prompts([(prompt, list(listeners))], output_mode="local", session=session)[0]
+    return collector.results()
+
+
+def test_jobs_after_the_first_open_no_connections(handler, comfyui, session, make_prompt):
+    run(handler, session, make_prompt(0))
+    connections = comfyui.connections
+    assert connections <= 2  # the WebSocket and one keep-alive HTTP connection
+
+    for seed in range(1, 6):
+        videos = run(handler, session, make_prompt(seed))
+        assert videos["131"][0]["video_path"].endswith(".mp4")
+
+    assert comfyui.connections == connections
+    assert comfyui.ws_connections == 1
+    assert session.stats == {"ws_connects": 1, "ws_reconnects": 0}
+
+
+def test_dropped_websocket_is_replaced_without_failing_the_job(handler, comfyui, session, make_prompt):
+    listener = DropOnProgress(comfyui)
+    videos = run(handler, session, make_prompt(0), [listener])
+
+    assert listener.dropped
+    assert videos["131"][0]["video_path"].endswith(".mp4")
+    assert session.stats["ws_reconnects"] == 1
+
+    # The replacement socket serves the next job
+    run(handler, session, make_prompt(1))
+    assert comfyui.ws_connections == 2
+
+
+def test_wait_ready_returns_on_the_status_event(handler, comfyui, session):
+    session.wait_ready(timeout=5)
+    assert session.healthy
+    assert session.check_health()
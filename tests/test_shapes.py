@@ -0,0 +1,48 @@
+"""Shape bucketing: snap_resolution(), snap_frames() and width/height validation."""
+import pytest
+
+
+@pytest.mark.parametrize("requested, snapped", [
+    ((854, 480), (848, 480)),  # the default job shape
+    ((848, 480), (848, 480)),
+    ((720, 1280), (720, 1280)),
+    ((500, 500), (512, 512)),
+    ((1280, 700), (1280, 720)),
+    ((1000, 560), (960, 544)),
+])
+def test_close_sizes_snap_to_a_bucket(handler, requested, snapped):
+    assert handler.snap_resolution(*requested) == snapped
+
+
+@pytest.mark.parametrize("requested, rounded", [
+    ((1920, 1080), (1920, 1088)),  # 1280x720 would lose more than half the pixels
+    ((2048, 2048), (2048, 2048)),
+    ((1000, 300), (1008, 304)),  # no bucket is that wide
+    ((5, 5), (16, 16)),
+])
+def test_far_sizes_are_rounded_to_multiples_of_16(handler, requested, rounded):
+    assert handler.snap_resolution(*requested) == rounded
+
+
+@pytest.mark.parametrize("max_frame, snapped", [
+    (1, 81), (81, 81), (82, 153), (153, 153), (154, 225),
+])
+def test_frames_snap_up_to_the_window_grid(handler, max_frame, snapped):
+    assert handler.snap_frames(max_frame, 81, 9) == snapped
+
+
+@pytest.mark.parametrize("field, value, message", [
+    ("width", 0, "must be a whole number greater than 0"),
+    ("height", -480, "must be a whole number greater than 0"),
+    ("width", 512.5, "must be a whole number greater than 0"),
+    ("height", "tall", "expected a number of pixels"),
+    ("width", None, "expected a number of pixels"),
+])
+def test_invalid_dimensions_are_job_errors(handler, pool, job_input, field, value, message):
+    result = handler.handler({"id": "bad-size", "input": dict(job_input, **{field: value})})
+    assert result == {"error": f"Invalid {field} '{value}': {message}"}
+
+
+def test_numeric_strings_are_accepted(handler):
+    assert handler.job_dimension({"width": "512"}, "width", 854) == 512
+    assert handler.job_dimension({}, "width", 854) == 854
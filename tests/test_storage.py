@@ -0,0 +1,71 @@
+"""TusUploader and SupabaseStorage against FakeStorage's TUS endpoint."""
+import os
+
+import pytest
+
+CHUNK = 64 * 1024
+
+
+@pytest.fixture
+def video(tmp_path):
+    """A 10.5-chunk file, so the last chunk is a short one"""
+    path = tmp_path / "video.mp4"
+    path.write_bytes(os.urandom(10 * CHUNK + CHUNK // 2))
+    return str(path)
+
+
+@pytest.fixture
+def uploader(handler, storage):
+    return handler.TusUploader(
+        f"{storage.url}/storage/v1/upload/resumable", {"Authorization": "Bearer test"},
+        chunk_size=CHUNK, parallel_parts=4,
+    )
+
+
+def content(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_file_is_sent_in_chunks(uploader, storage, video):
+    uploader.upload(video, {"objectName": "out.mp4"})
+
+    assert storage.objects["out.mp4"] == content(video)
+    assert storage.tus_creates == ["single"]
+    assert storage.patches == [(offset, CHUNK) for offset in range(0, 10 * CHUNK, CHUNK)] + [(10 * CHUNK, CHUNK // 2)]
+
+
+def test_failed_chunk_resumes_from_the_server_offset(uploader, storage, video):
+    storage.patch_faults = 1  # the first PATCH stores half a chunk, then fails
+    uploader.upload(video, {"objectName": "out.mp4"})
+
+    assert storage.objects["out.mp4"] == content(video)
+    assert storage.heads == 1
+    assert storage.patches[:3] == [(0, CHUNK), (CHUNK // 2, CHUNK), (CHUNK // 2 + CHUNK, CHUNK)]
+
+
+def test_parts_upload_in_parallel_and_retry_on_their_own(uploader, storage, video):
+    storage.tus_extensions = "creation,concatenation"
+    storage.patch_seconds = 0.05
+    storage.patch_faults = 1
+    uploader.upload(video, {"objectName": "out.mp4"})
+
+    assert storage.objects["out.mp4"] == content(video)
+    # 11 chunks in parts of 3, 3, 3 and 2 chunks
+    assert storage.tus_creates == ["partial"] * 4 + ["final"]
+    assert storage.max_parallel_patches == 4
+    assert storage.heads == 1
+    assert storage.uploads == 1
+
+
+def test_no_concatenation_means_one_upload(uploader, storage, video):
+    uploader.upload(video, {"objectName": "out.mp4"})
+    assert storage.max_parallel_patches == 1
+
+
+def test_large_outputs_go_through_tus(handler, storage, video, monkeypatch):
+    monkeypatch.setattr(handler, "RESUMABLE_UPLOAD_THRESHOLD", CHUNK)
+    url = handler.storage_backend.upload(video, "large.mp4")
+
+    assert url == f"{storage.url}/storage/v1/object/public/{handler.SUPABASE_BUCKET_NAME}/animations/large.mp4"
+    assert storage.objects["animations/large.mp4"] == content(video)
@@ -0,0 +1,95 @@
+"""plan_video_load(): frame cap, resampling to VIDEO_FPS and the stream-copy pre-trim.
+
+probe_video() and stream_copy_trim() are replaced, so no ffmpeg is needed.
+"""
+import pytest
+
+
+@pytest.fixture
+def source(handler, tmp_path, monkeypatch):
+    """source(duration, fps) -> path of a "video" that probe_video() describes that way"""
+    trims = []
+
+    def make(duration, fps, width=1280, height=720):
+        path = tmp_path / "input_video.mp4"
+        path.write_bytes(b"\0" * 100_000)
+        info = {"fps": fps, "frames": round(duration * fps), "width": width, "height": height, "duration": duration}
+        monkeypatch.setattr(handler, "probe_video", lambda video_path: info)
+        return str(path)
+
+    def stream_copy_trim(video_path, seconds, output_path):
+        trims.append(round(seconds, 3))
+        with open(output_path, "wb") as f:
+            f.write(b"\0" * 10_000)
+        return output_path
+    monkeypatch.setattr(handler, "stream_copy_trim", stream_copy_trim)
+    make.trims = trims
+    return make
+
+
+def test_short_clip_is_loaded_whole(handler, source, tmp_path):
+    path = source(duration=2.0, fps=25)
+    plan = handler.plan_video_load(path, 81, str(tmp_path / "work"))
+
+    assert plan["video_path"] == path
+    assert plan["values"] == {"video_fps": 25, "video_frame_cap": 81}
+    assert plan["report"]["frames_loaded"] == 50  # the clip runs out before the cap
+    assert source.trims == []
+
+
+def test_long_clip_is_capped_and_cut(handler, source, tmp_path):
+    path = source(duration=60.0, fps=30)
+    plan = handler.plan_video_load(path, 153, str(tmp_path / "work"))
+
+    assert plan["values"] == {"video_fps": 25, "video_frame_cap": 153}
+    assert plan["report"]["frames_loaded"] == 153
+    # 153 frames at 25 fps need 6.12 s; a second of slack for packet boundaries
+    assert source.trims == [7.12]
+    assert plan["video_path"].endswith("input_video_trimmed.mp4")
+    assert plan["report"]["trimmed_seconds"] == pytest.approx(60.0 - 7.12)
+    assert plan["report"]["trimmed_bytes"] == 90_000
+
+
+def test_clip_barely_longer_than_needed_is_not_cut(handler, source, tmp_path):
+    path = source(duration=5.0, fps=25)  # 81 frames need 3.24 s; not worth a copy within 2 s
+    plan = handler.plan_video_load(path, 81, str(tmp_path / "work"))
+
+    assert plan["video_path"] == path and source.trims == []
+    assert plan["report"]["frames_loaded"] == 81
+
+
+@pytest.mark.parametrize("fps, frames_loaded", [(12, 100), (60, 100), (29.97, 100)])
+def test_other_frame_rates_are_resampled_to_25(handler, source, tmp_path, fps, frames_loaded):
+    path = source(duration=4.0, fps=fps)
+    plan = handler.plan_video_load(path, 153, str(tmp_path / "work"))
+
+    assert plan["values"]["video_fps"] == 25
+    assert plan["report"]["source_frames"] == round(4.0 * fps)
+    assert plan["report"]["frames_loaded"] == frames_loaded  # 4 s at 25 fps, whatever the source rate
+
+
+def test_stream_copy_can_be_turned_off(handler, source, tmp_path):
+    path = source(duration=60.0, fps=25)
+    plan = handler.plan_video_load(path, 81, str(tmp_path / "work"), stream_copy=False)
+
+    assert plan["video_path"] == path and source.trims == []
+    assert plan["report"]["frames_loaded"] == 81
+
+
+def test_failed_probe_still_caps_the_load(handler, tmp_path, monkeypatch):
+    def probe_video(video_path):
+        raise Exception("ffprobe failed")
+    monkeypatch.setattr(handler, "probe_video", probe_video)
+    plan = handler.plan_video_load("input.mp4", 81, str(tmp_path))
+
+    assert plan == {"video_path": "input.mp4", "values": {"video_fps": 25, "video_frame_cap": 81}, "report": {"frames_loaded": 81}}
+
+
+def test_values_reach_the_video_nodes(handler, source, tmp_path):
+    plan = handler.plan_video_load(source(duration=60.0, fps=30), 153, str(tmp_path / "work"))
+    prompt = handler.get_workflow_template("video", "single").instantiate(plan["values"])
+
+    assert prompt["228"]["inputs"]["force_rate"] == 25
+    assert prompt["228"]["inputs"]["frame_load_cap"] == 153
+    assert prompt["194"]["inputs"]["fps"] == 25
+    assert prompt["131"]["inputs"]["frame_rate"] == 25
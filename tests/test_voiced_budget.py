@@ -0,0 +1,115 @@
+"""Silence-aware frame budget: voiced spans and the max_frames they give.
+
+decode_audio_mono() is replaced by synthetic tracks, so no ffmpeg is needed;
+trim_audio() records its cuts instead of running ffmpeg.
+"""
+import numpy as np
+import pytest
+
+RATE = 16000
+
+
+def track(*parts):
+    """Concatenate (seconds, dBFS) parts of noise; None is digital silence"""
+    rng = np.random.default_rng(0)
+    chunks = []
+    for seconds, level in parts:
+        n = int(round(seconds * RATE))
+        if level is None:
+            chunks.append(np.zeros(n, dtype=np.float32))
+        else:
+            # Random ±1 samples have an RMS of 1, so scaling sets the level directly
+            chunks.append((rng.choice([-1.0, 1.0], n) * 10 ** (level / 20)).astype(np.float32))
+    return np.concatenate(chunks)
+
+
+@pytest.fixture
+def tracks(handler, monkeypatch):
+    """tracks[path] = samples that decode_audio_mono(path) returns"""
+    tracks = {}
+    monkeypatch.setattr(handler, "decode_audio_mono", lambda path, sample_rate=RATE: tracks[path])
+    return tracks
+
+
+@pytest.fixture
+def cuts(handler, monkeypatch):
+    cuts = []
+
+    def trim_audio(path, start, end, output_path):
+        cuts.append((path, round(start, 3), round(end, 3)))
+        return output_path
+    monkeypatch.setattr(handler, "trim_audio", trim_audio)
+    return cuts
+
+
+def frames(seconds, fps=25):
+    return int(seconds * fps) + 25
+
+
+def test_trailing_silence_is_left_out_without_trimming(handler, tracks, cuts, tmp_path):
+    tracks["a.wav"] = track((1.0, None), (2.0, -6), (3.0, None))
+    budget = handler.budget_frames_from_voiced_audio("a.wav", None, str(tmp_path))
+
+    padding = handler.SILENCE_PADDING
+    assert budget["max_frames"] == frames(3.0 + padding)  # leading silence is still rendered
+    assert budget["wav_path"] == "a.wav" and cuts == []
+    assert budget["report"] == {
+        "voiced_start": 0.0, "voiced_end": 3.0 + padding, "duration": 6.0,
+        "frames_trimmed": frames(6.0) - frames(3.0 + padding),
+    }
+
+
+def test_trimming_also_drops_leading_silence(handler, tracks, cuts, tmp_path):
+    tracks["a.wav"] = track((1.0, None), (2.0, -6), (3.0, None))
+    budget = handler.budget_frames_from_voiced_audio("a.wav", None, str(tmp_path), trim=True)
+
+    padding = handler.SILENCE_PADDING
+    assert budget["max_frames"] == frames(2.0 + 2 * padding)
+    assert cuts == [("a.wav", round(1.0 - padding, 3), round(3.0 + padding, 3))]
+    assert budget["wav_path"].endswith("input_audio_trimmed.wav")
+
+
+def test_all_silent_audio_keeps_its_full_length(handler, tracks, cuts, tmp_path):
+    tracks["a.wav"] = track((4.0, None))
+    budget = handler.budget_frames_from_voiced_audio("a.wav", None, str(tmp_path), trim=True)
+
+    assert budget["max_frames"] == frames(4.0)
+    assert budget["report"]["frames_trimmed"] == 0
+    assert cuts == []
+
+
+def test_speech_to_the_end_is_not_cut(handler, tracks, cuts, tmp_path):
+    tracks["a.wav"] = track((0.5, None), (2.5, -6))
+    budget = handler.budget_frames_from_voiced_audio("a.wav", None, str(tmp_path))
+
+    assert budget["max_frames"] == frames(3.0)  # padding never runs past the end
+
+
+def test_quiet_background_far_below_speech_is_silence(handler, tracks, cuts, tmp_path):
+    # -42 dBFS is above the absolute floor but more than SILENCE_RELATIVE_DB below the speech
+    tracks["a.wav"] = track((1.0, -42), (1.0, -1), (2.0, -42))
+    budget = handler.budget_frames_from_voiced_audio("a.wav", None, str(tmp_path), trim=True)
+
+    padding = handler.SILENCE_PADDING
+    assert budget["report"]["voiced_start"] == pytest.approx(1.0 - padding)
+    assert budget["report"]["voiced_end"] == pytest.approx(2.0 + padding)
+
+
+def test_two_speakers_share_one_span(handler, tracks, cuts, tmp_path):
+    tracks["a.wav"] = track((1.0, None), (1.0, -6), (4.0, None))
+    tracks["b.wav"] = track((3.0, None), (1.0, -6), (1.0, None))
+    budget = handler.budget_frames_from_voiced_audio("a.wav", "b.wav", str(tmp_path), trim=True)
+
+    padding = handler.SILENCE_PADDING
+    span = (round(1.0 - padding, 3), round(4.0 + padding, 3))
+    assert cuts == [("a.wav", *span), ("b.wav", *span)]
+    assert budget["max_frames"] == frames(3.0 + 2 * padding)
+    assert budget["report"]["duration"] == 6.0  # the longer track
+
+
+def test_failed_analysis_falls_back_to_the_file_length(handler, monkeypatch, tmp_path):
+    def decode(path, sample_rate=RATE):
+        raise Exception("ffmpeg decode failed")
+    monkeypatch.setattr(handler, "decode_audio_mono", decode)
+
+    assert handler.budget_frames_from_voiced_audio("a.wav", None, str(tmp_path)) is None
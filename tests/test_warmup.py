@@ -0,0 +1,28 @@
+"""warm_up(): the warm-up render has the shape and memory plan of a default job."""
+import os
+
+import planner
+
+
+def rendered_shape(prompt):
+    return prompt["245"]["inputs"]["value"], prompt["246"]["inputs"]["value"], dict(prompt["134"]["inputs"])
+
+
+def test_warm_up_renders_the_default_job_shape(handler, comfyui, session, pool, job_input, monkeypatch):
+    monkeypatch.setattr(handler, "MEMORY_PLANNER", True)
+    monkeypatch.setattr(planner, "VRAM_GB", "24")
+
+    report = handler.warm_up(session)
+    result = handler.handler({"id": "default", "input": job_input})  # sets no width/height
+
+    assert "error" not in result
+    warmup_prompt, job_prompt = (entry["prompt"] for entry in comfyui.history.values())
+    assert rendered_shape(warmup_prompt) == rendered_shape(job_prompt)
+    assert rendered_shape(warmup_prompt)[:2] == handler.snap_resolution(handler.DEFAULT_WIDTH, handler.DEFAULT_HEIGHT)
+    assert report["warmup_seconds"] > 0
+    assert "first_compile_seconds" in report
+
+
+def test_warm_up_leaves_no_files(handler, comfyui, session):
+    handler.warm_up(session)
+    assert os.listdir(comfyui.output_dir) == []
@@ -0,0 +1,33 @@
+"""Job workspaces: ComfyUI outputs are removed with the job, and a repeated job still gets its video."""
+import os
+
+import pytest
+
+
+@pytest.mark.parametrize("repeat", [{}, {"use_result_cache": False}])
+def test_repeated_job_renders_a_new_output(handler, comfyui, pool, job_input, repeat):
+    first = handler.handler({"id": "first", "input": job_input})
+    second = handler.handler({"id": "second", "input": dict(job_input, **repeat)})
+
+    assert "error" not in second, second
+    assert os.path.exists(second["video_path"])
+    assert second["video_path"] != first["video_path"]
+    # Every node upstream of the output is a cache hit; only the output node runs again
+    prompt_id = list(comfyui.cached)[-1]
+    assert "128" in comfyui.cached[prompt_id] and "131" not in comfyui.cached[prompt_id]
+    assert os.listdir(comfyui.output_dir) == []  # both outputs went with their workspaces
+
+
+def test_fingerprint_ignores_the_output_prefix(handler, job_input):
+    template = handler.get_workflow_template("image", "single")
+    first, second = (template.instantiate({
+        "media": job_input["image_path"], "wav": job_input["wav_path"], "output_prefix": prefix,
+    }) for prefix in ("task_a", "task_b"))
+
+    assert first["131"]["inputs"]["filename_prefix"] == "task_a"
+    assert template.fingerprint(first) == template.fingerprint(second)
+
+
+def test_missing_output_is_not_delivered(handler, tmp_path):
+    with pytest.raises(Exception, match="does not exist"):
+        handler.deliver_video(str(tmp_path / "gone.mp4"), "path")
@@ -0,0 +1,258 @@
+"""Per-job scratch directories and a sweeper for ComfyUI's output files.
+
+Jobs used to write their inputs to task_<uuid> directories under the working
+directory and never remove them, and VHS_VideoCombine leaves every rendered
+MP4 in ComfyUI's temp directory. A Workspace is made for each job and removed
+as a whole when the job ends, whatever the outcome; images and audio go to
+tmpfs when it has room, video to disk. sweep() keeps ComfyUI's output and
+temp directories under a byte budget and removes workspaces a killed job
+left behind; start_sweeper() runs it in the background.
+"""
+import os
+import glob
+import uuid
+import shutil
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+WORKSPACE_DIR = os.getenv('WORKSPACE_DIR', '/tmp/infinitetalk_work')
+WORKSPACE_TMPFS_DIR = os.getenv('WORKSPACE_TMPFS_DIR', '/dev/shm/infinitetalk_work')  # empty disables tmpfs
+WORKSPACE_TMPFS_MIN_FREE = int(os.getenv('WORKSPACE_TMPFS_MIN_FREE', str(1024 ** 3)))  # else the job uses disk
+
+# ComfyUI output/temp directories (globs; --temp-directory X writes to X/temp)
+SWEEP_DIRS = os.getenv('SWEEP_DIRS', '/ComfyUI/output,/ComfyUI/temp,/tmp/comfyui_*/temp')
+SWEEP_MAX_BYTES = int(os.getenv('SWEEP_MAX_BYTES', str(5 * 1024 ** 3)))
+SWEEP_MIN_AGE = float(os.getenv('SWEEP_MIN_AGE', '900'))  # seconds; younger files may belong to a running job
+SWEEP_INTERVAL = float(os.getenv('SWEEP_INTERVAL', '300'))  # 0 disables the background sweeper
+
+_lock = threading.Lock()
+_active = set()  # names of live workspaces
+_pinned = set()  # files a live workspace still needs
+
+
+class ReclaimStats:
+    """Bytes and files removed by workspace cleanups and sweeps"""
+
+    def __init__(self):
+        self.workspaces = 0
+        self.workspace_bytes = 0
+        self.sweeps = 0
+        self.swept_files = 0
+        self.swept_bytes = 0
+        self._lock = threading.Lock()
+
+    def record_workspace(self, reclaimed):
+        with self._lock:
+            self.workspaces += 1
+            self.workspace_bytes += reclaimed
+
+    def record_sweep(self, files, reclaimed):
+        with self._lock:
+            self.sweeps += 1
+            self.swept_files += files
+            self.swept_bytes += reclaimed
+
+    def report(self):
+        with self._lock:
+            return {
+                "workspaces_removed": self.workspaces,
+                "workspace_bytes_reclaimed": self.workspace_bytes,
+                "sweeps": self.sweeps,
+                "swept_files": self.swept_files,
+                "swept_bytes_reclaimed": self.swept_bytes,
+            }
+
+
+reclaim_stats = ReclaimStats()
+
+
+def tree_size(path):
+    """Total size in bytes of the files under path"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def remove_path(path):
+    """Delete a file or directory tree; returns the bytes freed"""
+    try:
+        if os.path.isdir(path) and not os.path.islink(path):
+            size = tree_size(path)
+            shutil.rmtree(path, ignore_errors=True)
+            return size
+        size = os.lstat(path).st_size
+        os.remove(path)
+        return size
+    except FileNotFoundError:
+        return 0
+    except OSError as e:
+        logger.warning(f"Could not remove {path}: {e}")
+        return 0
+
+
+def tmpfs_has_room():
+    if not WORKSPACE_TMPFS_DIR:
+        return False
+    try:
+        os.makedirs(WORKSPACE_TMPFS_DIR, exist_ok=True)
+        return shutil.disk_usage(WORKSPACE_TMPFS_DIR).free >= WORKSPACE_TMPFS_MIN_FREE
+    except OSError:
+        return False
+
+
+class Workspace:
+    """Scratch space of one job.
+
+    dir_for(kind) hands out a tmpfs directory for images and audio when tmpfs
+    has WORKSPACE_TMPFS_MIN_FREE bytes free, and a disk directory for video.
+    Files outside the workspace that the job owns (its ComfyUI outputs) are
+    added with track(); the sweeper leaves them alone until cleanup() removes
+    them with the rest. Other resources the job holds are released through
+    on_cleanup() callbacks. cleanup() is idempotent, and the class is a
+    context manager that calls it on exit.
+    """
+
+    def __init__(self, name=None):
+        self.name = name or f"task_{uuid.uuid4()}"
+        self.disk_dir = os.path.join(WORKSPACE_DIR, self.name)
+        self.tmpfs_dir = os.path.join(WORKSPACE_TMPFS_DIR, self.name) if tmpfs_has_room() else None
+        self.tracked = []
+        self.callbacks = []
+        self.closed = False
+        with _lock:
+            _active.add(self.name)
+
+    def dir_for(self, kind=None):
+        """Directory for a file of kind "image", "audio" or "video" (created on first use)"""
+        directory = self.disk_dir if kind == "video" or self.tmpfs_dir is None else self.tmpfs_dir
+        os.makedirs(directory, exist_ok=True)
+        return directory
+
+    def path(self, filename, kind=None):
+        return os.path.abspath(os.path.join(self.dir_for(kind), filename))
+
+    def track(self, *paths):
+        with _lock:
+            self.tracked.extend(paths)
+            _pinned.update(paths)
+
+    def on_cleanup(self, callback, *args):
+        """Call callback(*args) when the workspace is removed, or now if it already is"""
+        with _lock:
+            if not self.closed:
+                self.callbacks.append((callback, args))
+                return
+        callback(*args)
+
+    def cleanup(self):
+        """Remove the workspace and tracked files; returns the bytes freed"""
+        with _lock:
+            if self.closed:
+                return 0
+            self.closed = True
+            tracked, self.tracked = self.tracked, []
+            callbacks, self.callbacks = self.callbacks, []
+        for callback, args in callbacks:
+            try:
+                callback(*args)
+            except Exception as e:
+                logger.warning(f"Workspace {self.name} cleanup callback failed: {e}")
+        reclaimed = sum(remove_path(path) for path in [self.disk_dir, self.tmpfs_dir, *tracked] if path)
+        with _lock:
+            _active.discard(self.name)
+            _pinned.difference_update(tracked)
+        reclaim_stats.record_workspace(reclaimed)
+        logger.info(f"🧹 Removed workspace {self.name} ({reclaimed} bytes)")
+        return reclaimed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.cleanup()
+
+
+def sweep(patterns=SWEEP_DIRS, max_bytes=SWEEP_MAX_BYTES, min_age=SWEEP_MIN_AGE):
+    """Trim ComfyUI's output directories to max_bytes and drop orphaned workspaces.
+
+    Files are removed oldest first, skipping anything younger than min_age or
+    tracked by a live workspace. Workspace directories that belong to no live
+    Workspace and are older than min_age are removed whole. Returns
+    {"files", "bytes"} removed.
+    """
+    now = time.time()
+    with _lock:
+        pinned = set(_pinned)
+        active = set(_active)
+
+    entries = []
+    for pattern in filter(None, (p.strip() for p in patterns.split(","))):
+        for directory in glob.glob(pattern):
+            for root, _, files in os.walk(directory):
+                for name in files:
+                    path = os.path.join(root, name)
+                    try:
+                        st = os.lstat(path)
+                    except OSError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    files = 0
+    reclaimed = 0
+    for mtime, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if path in pinned or now - mtime < min_age:
+            continue
+        freed = remove_path(path)
+        total -= size
+        files += 1
+        reclaimed += freed
+
+    for root in filter(None, [WORKSPACE_DIR, WORKSPACE_TMPFS_DIR]):
+        try:
+            scan = list(os.scandir(root))
+        except OSError:
+            continue
+        for entry in scan:
+            try:
+                orphaned = entry.name not in active and now - entry.stat().st_mtime >= min_age
+            except OSError:
+                continue
+            if orphaned:
+                reclaimed += remove_path(entry.path)
+                files += 1
+
+    reclaim_stats.record_sweep(files, reclaimed)
+    if files:
+        logger.info(f"🧹 Swept {files} file(s)/workspace(s), {reclaimed} bytes; {total} bytes left in ComfyUI outputs")
+    return {"files": files, "bytes": reclaimed}
+
+
+def start_sweeper(interval=SWEEP_INTERVAL, on_sweep=None):
+    """Run sweep() every interval seconds in a daemon thread; on_sweep(result) is called after each"""
+    if interval <= 0:
+        return None
+
+    def loop():
+        while True:
+            try:
+                result = sweep()
+                if on_sweep is not None:
+                    on_sweep(result)
+            except Exception as e:
+                logger.warning(f"Sweep failed: {e}")
+            time.sleep(interval)
+
+    thread = threading.Thread(target=loop, name="workspace-sweeper", daemon=True)
+    thread.start()
+    return thread